@@ -0,0 +1,62 @@
+"""Бенчмарк загрузки листов из excel/ на старте: разбор .xlsx через pandas
+и чтение готовых снимков. Каждый замер - отдельный процесс, чтобы в
+время попал импорт pandas и openpyxl, как при холодном старте контейнера.
+
+Запуск: poetry run python -m benchmarks.bench_excel_startup
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+RUNS = 5
+
+COLD = """
+from db.excel_snapshot import EXCEL_TABLES, _parse, excel_path
+for table in EXCEL_TABLES:
+    _parse(excel_path(table))
+"""
+BUILD = """
+from db.excel_snapshot import load_sheets
+load_sheets()
+"""
+SNAPSHOT = BUILD + """
+import sys
+assert 'pandas' not in sys.modules
+"""
+
+
+def run(code: str, env: dict) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def best_of(code: str, env: dict) -> float:
+    return min(run(code, env) for _ in range(RUNS))
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        env = {**os.environ, "EXCEL_SNAPSHOT_DIR": snapshot_dir}
+        # Пустой процесс с теми же импортами конфига и логгера
+        baseline = best_of("import db.excel_snapshot", env)
+        cold = best_of(COLD, env)
+        run(BUILD, env)
+        warm = best_of(SNAPSHOT, env)
+
+        size = sum(
+            os.path.getsize(os.path.join(snapshot_dir, name))
+            for name in os.listdir(snapshot_dir))
+
+    print(f"Загрузка листов из excel/, лучшее из {RUNS} запусков (с):")
+    print(f"  процесс без загрузки:     {baseline:.3f}")
+    print(f"  pandas.read_excel:        {cold:.3f} (+{cold - baseline:.3f})")
+    print(f"  снимки ({size / 1024:.0f} КБ):         {warm:.3f} "
+          f"(+{warm - baseline:.3f})")
+
+
+if __name__ == "__main__":
+    main()
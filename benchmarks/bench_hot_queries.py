@@ -0,0 +1,101 @@
+"""Бенчмарк горячих запросов: накладные расходы на вызов в прежнем виде
+(ORM select собирается заново, строки превращаются в сущности) и через
+кэшируемые Core-запросы из repositories/.
+
+База - SQLite в памяти, поэтому время почти целиком уходит на сборку
+запроса, поиск в кэше компиляции и разбор строк, а не на сервер.
+
+Запуск: poetry run python -m benchmarks.bench_hot_queries
+"""
+import time
+from typing import Callable
+
+from sqlalchemy import create_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session
+
+from db.enums import UserRole
+from db.models import AiSettings, DAMACompetenceKey, DAMAQuestion, DAMARoleKey, User
+from repositories.ai_repository import SETTINGS_VALUES
+from repositories.question_repository import questions_stmt
+from repositories.user_repository import profile_stmt, role_stmt
+
+ROLE = "Data Steward"
+COMPETENCE = "Data Quality"
+USERS = 1_000
+QUESTIONS = 40
+RUNS = 5_000
+
+
+def build_session() -> Session:
+    engine = create_engine("sqlite://")
+    for model in (DAMARoleKey, DAMACompetenceKey, User, DAMAQuestion,
+                  AiSettings):
+        model.__table__.create(engine)
+
+    session = Session(engine)
+    session.add_all(
+        User(id=i,
+             first_name=f"Имя {i}",
+             last_name=f"Фамилия {i}",
+             username=f"user{i}",
+             role=UserRole.USER) for i in range(1, USERS + 1))
+    session.add_all(
+        DAMAQuestion(dama_role_name=ROLE,
+                     dama_competence_name=COMPETENCE,
+                     question_type="Теория",
+                     question=f"Вопрос {i}",
+                     question_answer=f"Ответ {i}",
+                     dama_knowledge_area=f"Area {i % 8}")
+        for i in range(QUESTIONS))
+    session.add(AiSettings(temperature=0.7, prompt="Промпт"))
+    session.commit()
+    return session
+
+
+def per_call(session: Session, call: Callable[[int], object]) -> float:
+    # Каждый апдейт раньше шел в новой сессии, поэтому identity map
+    # очищается на каждом вызове в обоих вариантах
+    for i in range(100):
+        call(i % USERS + 1)
+        session.expunge_all()
+    started = time.perf_counter()
+    for i in range(RUNS):
+        call(i % USERS + 1)
+        session.expunge_all()
+    return (time.perf_counter() - started) / RUNS * 1e6
+
+
+def main() -> None:
+    session = build_session()
+    cases = {
+        "Проверка роли": (
+            lambda user_id: session.execute(
+                select(User).where(User.id == user_id)).scalar_one().role,
+            lambda user_id: session.execute(role_stmt(user_id)).scalar_one()),
+        "Профиль пользователя": (
+            lambda user_id: session.execute(
+                select(User.id, User.first_name, User.last_name, User.username,
+                       User.role).where(User.id == user_id)).first(),
+            lambda user_id: session.execute(profile_stmt(user_id)).first()),
+        f"Вопросы компетенции ({QUESTIONS})": (
+            lambda _: session.scalars(
+                select(DAMAQuestion).where(
+                    DAMAQuestion.dama_role_name == ROLE,
+                    DAMAQuestion.dama_competence_name == COMPETENCE)).all(),
+            lambda _: session.execute(questions_stmt(ROLE, COMPETENCE)).all()),
+        "Настройки AI": (
+            lambda _: session.execute(select(AiSettings)).scalars().first(),
+            lambda _: session.execute(SETTINGS_VALUES).first()),
+    }
+
+    print(f"Время на вызов, мкс ({RUNS} вызовов):")
+    print(f"  {'запрос':<28}{'было':>8}{'стало':>8}{'ускорение':>11}")
+    for title, (before, after) in cases.items():
+        old = per_call(session, before)
+        new = per_call(session, after)
+        print(f"  {title:<28}{old:8.1f}{new:8.1f}{old / new:10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Бенчмарк выборки вопросов: время на экзамен и равномерность распределения.
+
+Запуск: poetry run python -m benchmarks.bench_question_selection
+"""
+import random
+import time
+from collections import Counter
+
+from services.question_catalog import CatalogQuestion, QuestionCatalog, THEORY, PRACTICE
+from services.question_selector import QuestionSelector, SelectionPlan
+
+ROLE = "Data Steward"
+COMPETENCE = "Data Quality"
+AREAS = [f"Area {i}" for i in range(8)]
+
+
+def build_catalog(per_type: int) -> QuestionCatalog:
+    questions = []
+    for question_type in (THEORY, PRACTICE):
+        for i in range(per_type):
+            questions.append(
+                CatalogQuestion(id=len(questions) + 1,
+                                dama_role_name=ROLE,
+                                dama_competence_name=COMPETENCE,
+                                question_type=question_type,
+                                question=f"{question_type} {i}",
+                                question_answer="",
+                                dama_knowledge_area=AREAS[i % len(AREAS)],
+                                dama_main_job=None))
+    return QuestionCatalog.build([ROLE], [(ROLE, COMPETENCE)], questions, [])
+
+
+def bench_latency() -> None:
+    print("Время выборки 10 вопросов на экзамен (мкс):")
+    for per_type in (10, 100, 1_000, 10_000, 100_000):
+        selector = QuestionSelector(build_catalog(per_type))
+        plan = SelectionPlan(type_quotas={THEORY: 5, PRACTICE: 5},
+                             knowledge_area_quota=2)
+        runs = 2_000
+        started = time.perf_counter()
+        for seed in range(runs):
+            selector.select(ROLE, COMPETENCE, plan=plan, seed=seed)
+        per_call = (time.perf_counter() - started) / runs * 1e6
+        print(f"  {per_type * 2:>7} вопросов в банке: {per_call:8.1f}")
+
+
+def bench_distribution() -> None:
+    per_type = 40
+    runs = 50_000
+    selector = QuestionSelector(build_catalog(per_type))
+    plan = SelectionPlan(type_quotas={THEORY: 5, PRACTICE: 5},
+                         knowledge_area_quota=0)
+    counts = Counter()
+    rng = random.Random(0)
+    for _ in range(runs):
+        for question in selector.select(ROLE, COMPETENCE, plan=plan,
+                                        seed=rng.getrandbits(64)):
+            counts[question.id] += 1
+
+    expected = runs * 5 / per_type
+    chi2 = sum((counts[i] - expected)**2 / expected
+               for i in range(1, per_type * 2 + 1))
+    worst = max(abs(counts[i] - expected) / expected
+                for i in range(1, per_type * 2 + 1))
+    # Критическое значение хи-квадрат для df=78 при alpha=0.001 ~ 124.8
+    print(f"Распределение по {per_type * 2} вопросам за {runs} экзаменов: "
+          f"chi2={chi2:.1f} (порог 124.8), max отклонение={worst:.2%}")
+
+    first = selector.select(ROLE, COMPETENCE, plan=plan, seed=42)
+    second = selector.select(ROLE, COMPETENCE, plan=plan, seed=42)
+    print(f"Воспроизводимость по сиду: {[q.id for q in first] == [q.id for q in second]}")
+
+    recent = {q.id for q in first}
+    fresh = selector.select(ROLE, COMPETENCE, plan=plan, seed=7, recent=recent)
+    print(f"Повторов из недавних: {len(recent & {q.id for q in fresh})}")
+
+
+if __name__ == "__main__":
+    bench_latency()
+    bench_distribution()
@@ -0,0 +1,181 @@
+"""Бенчмарк рендера Excel-отчета: прежняя книга openpyxl со стилями на
+каждую ячейку и потоковая запись с общими стилями из
+services/report_renderer.py. Отчет на 50 ответов с длинными текстами,
+время - лучшее из нескольких запусков, память - пик по tracemalloc.
+
+Запуск: poetry run python -m benchmarks.bench_report_render
+"""
+import io
+import time
+import tracemalloc
+from typing import Callable
+
+from services.report_renderer import REPORT_TITLE, ReportAnswer, ReportData, render_xlsx
+
+ANSWERS = 50
+RUNS = 20
+
+
+def build_report() -> ReportData:
+    return ReportData(
+        tested_at="2025-01-01 12:00:00",
+        user_name="Иванов Иван Иванович",
+        role="Data Steward",
+        competence="Data Quality",
+        avg_score=3.84,
+        is_expert=False,
+        answers=tuple(
+            ReportAnswer(knowledge_area=f"Область знаний {i % 8}",
+                         question=f"Вопрос {i}: " + "формулировка " * 20,
+                         user_answer="Развернутый ответ кандидата. " * 60,
+                         recommendations="DMBOK2, глава 13; " * 10,
+                         score=float(i % 6)) for i in range(ANSWERS)))
+
+
+def render_legacy(data: ReportData) -> bytes:
+    """Прежний вариант: обычная книга, стили создаются на каждую ячейку"""
+    from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+    from openpyxl.workbook import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+
+    if ws is not None:
+        ws.title = "DAMA Assessment Report"
+    else:
+        ws = wb.create_sheet("DAMA Assessment Report")
+
+    header_font = Font(bold=True, name='Century Gothic', size=12)
+    body_font = Font(name='Century Gothic', size=11)
+    center_alignment = Alignment(horizontal='center',
+                                 vertical='center',
+                                 wrap_text=True)
+    header_fill = PatternFill(start_color='D5FD7B',
+                              end_color='D5FD7B',
+                              fill_type='solid')
+    thin_border = Border(left=Side(style='thin'),
+                         right=Side(style='thin'),
+                         top=Side(style='thin'),
+                         bottom=Side(style='thin'))
+
+    ws.merge_cells('A1:E1')
+    title_cell = ws['A1']
+    title_cell.value = REPORT_TITLE
+    title_cell.font = header_font
+    title_cell.alignment = center_alignment
+    title_cell.fill = header_fill
+    title_cell.border = thin_border
+
+    ws.append([None])
+
+    meta_rows = [
+        ["Дата и время тестирования", "", "", "", ""],
+        ["ФИО тестируемого", "", "", "", ""], ["Роль", "", "", "", ""],
+        ["Компетенция", "", "", "",
+         ""], ["Средняя оценка по компетенции", "", "", "", ""],
+        [
+            "Экспертность в управлении данными DAMA (порог экспертности ≥ 4.5)",
+            "", "", "", ""
+        ], [None, None, None, None, None],
+        [
+            "Область знаний/Основные работы", "Вопрос",
+            "Пользовательский ответ", "Рекомендуемые материалы для изучения",
+            "Оценка (1-5)"
+        ]
+    ]
+
+    for row_idx, row in enumerate(meta_rows, start=3):
+        for col_idx, value in enumerate(row, start=1):
+            if value is not None:
+                cell = ws.cell(row=row_idx, column=col_idx, value=value)
+                cell.font = body_font
+                cell.alignment = center_alignment
+                if row_idx == 10:
+                    cell.font = Font(bold=True, name='Century Gothic', size=11)
+                    cell.fill = header_fill
+                if value != "":
+                    cell.border = thin_border
+
+    ws['B3'] = data.tested_at
+    ws['B4'] = data.user_name
+    ws['B5'] = data.role
+    ws['B6'] = data.competence
+    ws['B7'] = data.avg_score
+    ws['B8'] = "Да" if data.is_expert else "Нет"
+
+    for row in range(3, 9):
+        for col in range(1, 6):
+            cell = ws.cell(row=row, column=col)
+            if cell.value:
+                cell.font = body_font
+                cell.alignment = center_alignment
+                cell.border = thin_border
+
+    for answer in data.answers:
+        ws.append([
+            answer.knowledge_area, answer.question, answer.user_answer,
+            answer.recommendations, answer.score
+        ])
+
+        for col in range(1, 6):
+            cell = ws.cell(row=ws.max_row, column=col)
+            cell.font = body_font
+            cell.alignment = center_alignment
+            cell.border = thin_border
+
+    ws.column_dimensions['A'].width = 35
+    ws.column_dimensions['B'].width = 40
+    ws.column_dimensions['C'].width = 50
+    ws.column_dimensions['D'].width = 50
+    ws.column_dimensions['E'].width = 15
+
+    for row in ws.iter_rows():
+        for cell in row:
+            cell.alignment = Alignment(wrap_text=True,
+                                       horizontal='center',
+                                       vertical='center')
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def measure(render: Callable[[ReportData], bytes], data: ReportData):
+    render(data)
+    best = min(timed(render, data) for _ in range(RUNS))
+    tracemalloc.start()
+    content = render(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, len(content)
+
+
+def timed(render: Callable[[ReportData], bytes], data: ReportData) -> float:
+    started = time.perf_counter()
+    render(data)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    data = build_report()
+    cases = {
+        "прежний": render_legacy,
+        "потоковый": render_xlsx,
+    }
+
+    print(f"Рендер отчета на {ANSWERS} ответов, лучшее из {RUNS} запусков:")
+    print(f"  {'вариант':<12}{'мс':>8}{'пик, КБ':>10}{'файл, КБ':>10}")
+    results = {}
+    for title, render in cases.items():
+        best, peak, size = measure(render, data)
+        results[title] = (best, peak)
+        print(f"  {title:<12}{best * 1000:8.1f}{peak / 1024:10.0f}"
+              f"{size / 1024:10.0f}")
+
+    (old_time, old_peak), (new_time, new_peak) = results.values()
+    print(f"  ускорение {old_time / new_time:.2f}x, "
+          f"пик памяти в {old_peak / new_peak:.2f} раза меньше")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,44 @@
+"""Запуск бота: long polling, webhook (BOT_MODE=webhook) или опрос
+лидером с обработкой в нескольких процессах (BOT_MODE=sharded, см.
+services/update_stream).
+
+В режиме webhook каждая реплика поднимает aiohttp-сервер на
+WEBHOOK_HOST:WEBHOOK_PORT. Состояние FSM лежит в общем Redis, поэтому
+реплики без состояния можно ставить за балансировщик: WEBHOOK_URL -
+его публичный адрес. Для локальной проверки хватит самоподписанного
+сертификата (Telegram принимает порты 443, 80, 88 и 8443):
+
+    openssl req -newkey rsa:2048 -sha256 -nodes -x509 -days 365 \
+        -keyout webhook.key -out webhook.pem -subj "/CN=<публичный IP>"
+
+WEBHOOK_SSL_CERT=webhook.pem, WEBHOOK_SSL_KEY=webhook.key,
+WEBHOOK_URL=https://<публичный IP>:8443, WEBHOOK_PORT=8443.
+"""
+import asyncio
+import multiprocessing
+import signal
+import ssl
+from typing import Optional
+
+from aiohttp import web
 from config import Config
 from aiogram import Bot, Dispatcher
+from aiogram.types import FSInputFile
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from services.broadcast_service import broadcaster
+from services.logger import logger
+from services.outbound import outbound
 from services.state_service import state_storage
-from services.middleware import BanCheckMiddleware
+from services.middleware import BanCheckMiddleware, ConcurrencyLimitMiddleware, DbSessionMiddleware
 from handlers.test_handlers import test_router
 from handlers.admin_hendler import admin_router
 from aiogram.client.default import DefaultBotProperties
 from handlers.common import common_router
+from services.question_catalog import question_catalog
+from services.report_queue import report_queue
+from services.report_renderer import report_renderer
+from services.update_stream import ShardWorker, UpdatePoller
+from services.user_cache import user_profile_cache
 
 
 def setup_handlers(dp: Dispatcher) -> None:
@@ -14,18 +47,153 @@ def setup_handlers(dp: Dispatcher) -> None:
     dp.include_router(admin_router)
 
 
-async def init_bot() -> None:
-    """Initialize bot"""
+def _ssl_context() -> Optional[ssl.SSLContext]:
+    if not (Config.WEBHOOK_SSL_CERT and Config.WEBHOOK_SSL_KEY):
+        # TLS снимает балансировщик или прокси перед репликами
+        return None
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(Config.WEBHOOK_SSL_CERT, Config.WEBHOOK_SSL_KEY)
+    return context
+
+
+async def _healthz(request: web.Request) -> web.Response:
+    return web.Response(text="ok")
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    if not (Config.WEBHOOK_URL and Config.WEBHOOK_SECRET):
+        raise RuntimeError(
+            "WEBHOOK_URL and WEBHOOK_SECRET are required in webhook mode")
+
+    ssl_context = _ssl_context()
+    # Самоподписанный сертификат Telegram получает при регистрации webhook.
+    # Реплики регистрируют один и тот же адрес, повторный вызов безвреден
+    await bot.set_webhook(
+        url=f"{Config.WEBHOOK_URL.rstrip('/')}{Config.WEBHOOK_PATH}",
+        secret_token=Config.WEBHOOK_SECRET,
+        certificate=(FSInputFile(Config.WEBHOOK_SSL_CERT)
+                     if ssl_context else None),
+        max_connections=Config.WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dp.resolve_used_update_types())
+
+    app = web.Application()
+    # Запросы без верного X-Telegram-Bot-Api-Secret-Token получают 401
+    SimpleRequestHandler(dispatcher=dp,
+                         bot=bot,
+                         secret_token=Config.WEBHOOK_SECRET).register(
+                             app, path=Config.WEBHOOK_PATH)
+    app.router.add_get("/healthz", _healthz)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner,
+                       Config.WEBHOOK_HOST,
+                       Config.WEBHOOK_PORT,
+                       ssl_context=ssl_context)
+    await site.start()
+    logger.info(f"Webhook server listening on "
+                f"{Config.WEBHOOK_HOST}:{Config.WEBHOOK_PORT}"
+                f"{Config.WEBHOOK_PATH}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        # webhook не снимаем: остальные реплики продолжают принимать апдейты
+        await runner.cleanup()
+
+
+async def _update_worker() -> None:
+    # terminate() от родителя отменяет работу, а не убивает процесс:
+    # иначе пул рендера отчетов останется без хозяина
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, asyncio.current_task().cancel)
+    await question_catalog.reload()
+    bot = create_bot()
+    user_profile_cache.start()
+    try:
+        await ShardWorker(bot, await build_dispatcher()).run()
+    finally:
+        await user_profile_cache.stop()
+        report_renderer.close()
+        await bot.session.close()
+
+
+def run_update_worker() -> None:
+    """Точка входа процесса-обработчика апдейтов"""
+    try:
+        asyncio.run(_update_worker())
+    except asyncio.CancelledError:
+        pass
+
+
+async def run_sharded() -> None:
+    # spawn: fork процесса с event loop и открытыми соединениями
+    # небезопасен
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    try:
+        while True:
+            workers = [worker for worker in workers if worker.is_alive()]
+            for _ in range(Config.UPDATE_WORKERS - len(workers)):
+                # Не daemon: обработчику нужен свой пул процессов для
+                # рендера отчетов, а daemon-процессам дочерние запрещены.
+                # Останавливаем обработчики сами, в finally
+                worker = context.Process(target=run_update_worker)
+                worker.start()
+                workers.append(worker)
+                logger.info(f"Started update worker {worker.pid}")
+            await asyncio.sleep(Config.UPDATE_LEASE_TTL)
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            await asyncio.to_thread(worker.join)
+
+
+def create_bot() -> Bot:
     bot = Bot(token=Config.TELEGRAM_TOKEN,
               default=DefaultBotProperties(parse_mode="HTML"))
+    # Все запросы с chat_id идут через лимиты flood control
+    bot.session.middleware(outbound)
+    return bot
+
 
+async def build_dispatcher() -> Dispatcher:
     storage = await state_storage.get_storage()
     dp = Dispatcher(storage=storage)
 
     # Setup middleware
+    dp.update.outer_middleware(
+        ConcurrencyLimitMiddleware(Config.MAX_CONCURRENT_UPDATES))
+    dp.update.outer_middleware(DbSessionMiddleware())
     dp.message.middleware(BanCheckMiddleware())
     dp.callback_query.middleware(BanCheckMiddleware())
 
     setup_handlers(dp)
+    return dp
+
+
+async def init_bot() -> None:
+    """Initialize bot"""
+    bot = create_bot()
+    dp = await build_dispatcher()
 
-    await dp.start_polling(bot)
+    await report_queue.start(bot)
+    broadcaster.start(bot)
+    user_profile_cache.start()
+    try:
+        if Config.BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        elif Config.BOT_MODE == "sharded":
+            # Процессы-обработчики поднимаются на каждой реплике, а
+            # Telegram опрашивает только лидер
+            await asyncio.gather(run_sharded(),
+                                 UpdatePoller(bot, dp).run())
+        else:
+            # getUpdates не работает, пока у бота установлен webhook
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        await user_profile_cache.stop()
+        await broadcaster.stop()
+        await report_queue.stop()
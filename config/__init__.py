@@ -7,6 +7,86 @@ class Config:
     def TELEGRAM_TOKEN(self):
         return settings.telegram.token
     
+    @property
+    def BOT_MODE(self):
+        return settings.telegram.mode
+    
+    @property
+    def MAX_CONCURRENT_UPDATES(self):
+        return settings.telegram.max_concurrent_updates
+    
+    @property
+    def OUTBOUND_GLOBAL_RATE(self):
+        return settings.outbound.global_rate
+    
+    @property
+    def OUTBOUND_CHAT_RATE(self):
+        return settings.outbound.chat_rate
+    
+    @property
+    def OUTBOUND_CHAT_BURST(self):
+        return settings.outbound.chat_burst
+    
+    @property
+    def OUTBOUND_MAX_RETRIES(self):
+        return settings.outbound.max_retries
+    
+    @property
+    def BROADCAST_RATE(self):
+        return settings.broadcast.rate
+    
+    @property
+    def BROADCAST_BATCH_SIZE(self):
+        return settings.broadcast.batch_size
+    
+    @property
+    def BROADCAST_POLL_SECONDS(self):
+        return settings.broadcast.poll_seconds
+    
+    @property
+    def WEBHOOK_URL(self):
+        return settings.webhook.url
+    
+    @property
+    def WEBHOOK_PATH(self):
+        return settings.webhook.path
+    
+    @property
+    def WEBHOOK_SECRET(self):
+        return settings.webhook.secret
+    
+    @property
+    def WEBHOOK_HOST(self):
+        return settings.webhook.host
+    
+    @property
+    def WEBHOOK_PORT(self):
+        return settings.webhook.port
+    
+    @property
+    def WEBHOOK_MAX_CONNECTIONS(self):
+        return settings.webhook.max_connections
+    
+    @property
+    def WEBHOOK_SSL_CERT(self):
+        return settings.webhook.ssl_cert
+    
+    @property
+    def WEBHOOK_SSL_KEY(self):
+        return settings.webhook.ssl_key
+    
+    @property
+    def UPDATE_SHARDS(self):
+        return settings.updates.shards
+    
+    @property
+    def UPDATE_WORKERS(self):
+        return settings.updates.workers
+    
+    @property
+    def UPDATE_LEASE_TTL(self):
+        return settings.updates.lease_ttl
+    
     @property
     def LOG_LEVEL(self):
         return settings.log_level
@@ -35,6 +115,18 @@ class Config:
     def DROP_DB_ON_STARTUP(self):
         return settings.database.drop_on_startup
     
+    @property
+    def REPLICA_DB_URL(self):
+        return settings.replica.url
+    
+    @property
+    def REPLICA_MAX_LAG(self):
+        return settings.replica.max_lag
+    
+    @property
+    def REPLICA_CHECK_INTERVAL(self):
+        return settings.replica.check_interval
+    
     @property
     def REDIS_HOST(self):
         return settings.redis.host
@@ -75,6 +167,14 @@ class Config:
     def SECURE(self):
         return settings.minio.secure
     
+    @property
+    def MINIO_MAX_WORKERS(self):
+        return settings.minio.max_workers
+    
+    @property
+    def MINIO_PART_SIZE(self):
+        return settings.minio.part_size
+    
     @property
     def RETRIES_AI_ASK(self):
         return settings.ai.retries
@@ -87,6 +187,130 @@ class Config:
     def DEFAULT_PROMPT(self):
         return settings.ai.default_prompt
     
+    @property
+    def THEORY_QUESTIONS(self):
+        return settings.selection.theory_quota
+    
+    @property
+    def PRACTICE_QUESTIONS(self):
+        return settings.selection.practice_quota
+    
+    @property
+    def KNOWLEDGE_AREA_QUOTA(self):
+        return settings.selection.knowledge_area_quota
+    
+    @property
+    def RECENT_QUESTIONS_DAYS(self):
+        return settings.selection.recent_window_days
+    
+    @property
+    def QUESTION_SELECTION_SEED(self):
+        return settings.selection.seed
+    
+    @property
+    def ADAPTIVE_TESTING(self):
+        return settings.adaptive.enabled
+    
+    @property
+    def ADAPTIVE_MIN_QUESTIONS(self):
+        return settings.adaptive.min_questions
+    
+    @property
+    def ADAPTIVE_MAX_QUESTIONS(self):
+        return settings.adaptive.max_questions
+    
+    @property
+    def ADAPTIVE_CONFIDENCE(self):
+        return settings.adaptive.confidence
+    
+    @property
+    def USER_CACHE_SIZE(self):
+        return settings.user_cache.max_size
+    
+    @property
+    def USER_CACHE_LOCAL_TTL(self):
+        return settings.user_cache.local_ttl
+    
+    @property
+    def USER_CACHE_TTL(self):
+        return settings.user_cache.redis_ttl
+    
+    @property
+    def USER_CACHE_MISSING_TTL(self):
+        return settings.user_cache.missing_ttl
+    
+    @property
+    def ANALYTICS_WINDOW_DAYS(self):
+        return settings.analytics.window_days
+    
+    @property
+    def ROLLUP_RECONCILE_HOUR(self):
+        return settings.analytics.reconcile_hour
+    
+    @property
+    def ROLLUP_RECONCILE_DAYS(self):
+        return settings.analytics.reconcile_days
+    
+    @property
+    def PARTITION_MONTHS_AHEAD(self):
+        return settings.partitions.months_ahead
+    
+    @property
+    def PARTITION_RETENTION_MONTHS(self):
+        return settings.partitions.retention_months
+    
+    @property
+    def PARTITION_MAINTENANCE_HOUR(self):
+        return settings.partitions.maintenance_hour
+    
+    @property
+    def ARCHIVE_AFTER_MONTHS(self):
+        return settings.archive.after_months
+    
+    @property
+    def ARCHIVE_BUCKET(self):
+        return settings.archive.bucket
+    
+    @property
+    def RESULTS_HOT_MONTHS(self):
+        return settings.archive.hot_months
+    
+    @property
+    def EXCEL_SNAPSHOT_DIR(self):
+        return settings.excel.snapshot_dir
+    
+    @property
+    def REPORT_WORKERS(self):
+        return settings.report.workers
+    
+    @property
+    def REPORT_QUEUE_LIMIT(self):
+        return settings.report.queue_limit
+    
+    @property
+    def REPORT_JOB_WORKERS(self):
+        return settings.report.job_workers
+    
+    @property
+    def REPORT_JOB_MAX_ATTEMPTS(self):
+        return settings.report.job_max_attempts
+    
+    @property
+    def REPORT_JOB_RETRY_SECONDS(self):
+        return settings.report.job_retry_seconds
+    
+    @property
+    def EXPORT_BUCKET(self):
+        return settings.export.bucket
+    
+    @property
+    def EXPORT_LINK_TTL(self):
+        return settings.export.link_ttl
+    
+    @property
+    def EXPORT_BATCH_SIZE(self):
+        return settings.export.batch_size
+    
     @property
     def ADMIN_PASSWORD(self):
         return settings.admin_password
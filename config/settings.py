@@ -15,6 +15,12 @@ class DatabaseConfig:
     name: str
     drop_on_startup: bool
 
+@dataclass
+class ReplicaConfig:
+    url: Optional[str]
+    max_lag: float
+    check_interval: int
+
 @dataclass
 class RedisConfig:
     host: str
@@ -30,10 +36,44 @@ class MinioConfig:
     user: str
     password: str
     secure: bool
+    max_workers: int
+    part_size: int
 
 @dataclass
 class TelegramConfig:
     token: str
+    mode: str
+    max_concurrent_updates: int
+
+@dataclass
+class OutboundConfig:
+    global_rate: float
+    chat_rate: float
+    chat_burst: int
+    max_retries: int
+
+@dataclass
+class BroadcastConfig:
+    rate: float
+    batch_size: int
+    poll_seconds: int
+
+@dataclass
+class WebhookConfig:
+    url: Optional[str]
+    path: str
+    secret: Optional[str]
+    host: str
+    port: int
+    max_connections: int
+    ssl_cert: Optional[str]
+    ssl_key: Optional[str]
+
+@dataclass
+class UpdateStreamConfig:
+    shards: int
+    workers: int
+    lease_ttl: int
 
 @dataclass
 class AiConfig:
@@ -41,13 +81,85 @@ class AiConfig:
     default_temperature: float
     default_prompt: str
 
+@dataclass
+class SelectionConfig:
+    theory_quota: int
+    practice_quota: int
+    knowledge_area_quota: int
+    recent_window_days: int
+    seed: Optional[str]
+
+@dataclass
+class AdaptiveConfig:
+    enabled: bool
+    min_questions: int
+    max_questions: int
+    confidence: float
+
+@dataclass
+class UserCacheConfig:
+    max_size: int
+    local_ttl: int
+    redis_ttl: int
+    missing_ttl: int
+
+@dataclass
+class AnalyticsConfig:
+    window_days: int
+    reconcile_hour: int
+    reconcile_days: int
+
+@dataclass
+class PartitionConfig:
+    months_ahead: int
+    retention_months: int
+    maintenance_hour: int
+
+@dataclass
+class ArchiveConfig:
+    after_months: int
+    bucket: str
+    hot_months: int
+
+@dataclass
+class ExcelConfig:
+    snapshot_dir: str
+
+@dataclass
+class ExportConfig:
+    bucket: str
+    link_ttl: int
+    batch_size: int
+
+@dataclass
+class ReportConfig:
+    workers: int
+    queue_limit: int
+    job_workers: int
+    job_max_attempts: int
+    job_retry_seconds: int
+
 @dataclass
 class AppSettings:
     database: DatabaseConfig
+    replica: ReplicaConfig
     redis: RedisConfig
     minio: MinioConfig
     telegram: TelegramConfig
+    outbound: OutboundConfig
+    broadcast: BroadcastConfig
+    webhook: WebhookConfig
+    updates: UpdateStreamConfig
     ai: AiConfig
+    selection: SelectionConfig
+    adaptive: AdaptiveConfig
+    user_cache: UserCacheConfig
+    analytics: AnalyticsConfig
+    partitions: PartitionConfig
+    archive: ArchiveConfig
+    excel: ExcelConfig
+    report: ReportConfig
+    export: ExportConfig
     log_level: str
     admin_password: str
 
@@ -62,6 +174,11 @@ def load_settings() -> AppSettings:
             name=str(os.getenv('DB_NAME')),
             drop_on_startup=bool(os.getenv('DROP_DB_ON_STARTUP', 'false').lower() in ('true', '1', 'yes'))
         ),
+        replica=ReplicaConfig(
+            url=os.getenv('REPLICA_DB_URL') or None,
+            max_lag=float(os.getenv('REPLICA_MAX_LAG', 30)),
+            check_interval=int(os.getenv('REPLICA_CHECK_INTERVAL', 10))
+        ),
         redis=RedisConfig(
             host=str(os.getenv('REDIS_HOST')),
             port=int(os.getenv('REDIS_PORT', 6380)),
@@ -74,10 +191,40 @@ def load_settings() -> AppSettings:
             port=int(os.getenv('MINIO_PORT', 9000)),
             user=str(os.getenv('MINIO_ROOT_USER')),
             password=str(os.getenv('MINIO_ROOT_PASSWORD')),
-            secure=bool(os.getenv('SECURE', 'false').lower() in ('true', '1', 'yes'))
+            secure=bool(os.getenv('SECURE', 'false').lower() in ('true', '1', 'yes')),
+            max_workers=int(os.getenv('MINIO_MAX_WORKERS', 4)),
+            part_size=int(os.getenv('MINIO_PART_SIZE_MB', 16)) * 1024 * 1024
         ),
         telegram=TelegramConfig(
-            token=str(os.getenv('TELEGRAM_TOKEN'))
+            token=str(os.getenv('TELEGRAM_TOKEN')),
+            mode=str(os.getenv('BOT_MODE', 'polling')).lower(),
+            max_concurrent_updates=int(os.getenv('MAX_CONCURRENT_UPDATES', 64))
+        ),
+        outbound=OutboundConfig(
+            global_rate=float(os.getenv('OUTBOUND_GLOBAL_RATE', 25)),
+            chat_rate=float(os.getenv('OUTBOUND_CHAT_RATE', 1)),
+            chat_burst=int(os.getenv('OUTBOUND_CHAT_BURST', 3)),
+            max_retries=int(os.getenv('OUTBOUND_MAX_RETRIES', 3))
+        ),
+        broadcast=BroadcastConfig(
+            rate=float(os.getenv('BROADCAST_RATE', 20)),
+            batch_size=int(os.getenv('BROADCAST_BATCH_SIZE', 200)),
+            poll_seconds=int(os.getenv('BROADCAST_POLL_SECONDS', 10))
+        ),
+        webhook=WebhookConfig(
+            url=os.getenv('WEBHOOK_URL') or None,
+            path=str(os.getenv('WEBHOOK_PATH', '/webhook')),
+            secret=os.getenv('WEBHOOK_SECRET') or None,
+            host=str(os.getenv('WEBHOOK_HOST', '0.0.0.0')),
+            port=int(os.getenv('WEBHOOK_PORT', 8080)),
+            max_connections=int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40)),
+            ssl_cert=os.getenv('WEBHOOK_SSL_CERT') or None,
+            ssl_key=os.getenv('WEBHOOK_SSL_KEY') or None
+        ),
+        updates=UpdateStreamConfig(
+            shards=int(os.getenv('UPDATE_SHARDS', 4)),
+            workers=int(os.getenv('UPDATE_WORKERS', 4)),
+            lease_ttl=int(os.getenv('UPDATE_LEASE_TTL', 15))
         ),
         ai=AiConfig(
             retries=int(os.getenv('RETRIES_AI_ASK', 1)),
@@ -99,6 +246,55 @@ def load_settings() -> AppSettings:
                 "Если считаешь, что эталонный вопрос недостаточно раскрывает тему, можешь добавить уточняющий вопрос (если пользователь хоть что-то ответил).\n"
             )
         ),
+        selection=SelectionConfig(
+            theory_quota=int(os.getenv('THEORY_QUESTIONS', 5)),
+            practice_quota=int(os.getenv('PRACTICE_QUESTIONS', 5)),
+            knowledge_area_quota=int(os.getenv('KNOWLEDGE_AREA_QUOTA', 0)),
+            recent_window_days=int(os.getenv('RECENT_QUESTIONS_DAYS', 30)),
+            seed=os.getenv('QUESTION_SELECTION_SEED') or None
+        ),
+        adaptive=AdaptiveConfig(
+            enabled=bool(os.getenv('ADAPTIVE_TESTING', 'false').lower() in ('true', '1', 'yes')),
+            min_questions=int(os.getenv('ADAPTIVE_MIN_QUESTIONS', 4)),
+            max_questions=int(os.getenv('ADAPTIVE_MAX_QUESTIONS', 10)),
+            confidence=float(os.getenv('ADAPTIVE_CONFIDENCE', 0.9))
+        ),
+        user_cache=UserCacheConfig(
+            max_size=int(os.getenv('USER_CACHE_SIZE', 10000)),
+            local_ttl=int(os.getenv('USER_CACHE_LOCAL_TTL', 30)),
+            redis_ttl=int(os.getenv('USER_CACHE_TTL', 3600)),
+            missing_ttl=int(os.getenv('USER_CACHE_MISSING_TTL', 60))
+        ),
+        analytics=AnalyticsConfig(
+            window_days=int(os.getenv('ANALYTICS_WINDOW_DAYS', 30)),
+            reconcile_hour=int(os.getenv('ROLLUP_RECONCILE_HOUR', 3)),
+            reconcile_days=int(os.getenv('ROLLUP_RECONCILE_DAYS', 2))
+        ),
+        partitions=PartitionConfig(
+            months_ahead=int(os.getenv('PARTITION_MONTHS_AHEAD', 2)),
+            retention_months=int(os.getenv('PARTITION_RETENTION_MONTHS', 0)),
+            maintenance_hour=int(os.getenv('PARTITION_MAINTENANCE_HOUR', 2))
+        ),
+        archive=ArchiveConfig(
+            after_months=int(os.getenv('ARCHIVE_AFTER_MONTHS', 0)),
+            bucket=str(os.getenv('ARCHIVE_BUCKET', 'results-archive')),
+            hot_months=int(os.getenv('RESULTS_HOT_MONTHS', 3))
+        ),
+        excel=ExcelConfig(
+            snapshot_dir=str(os.getenv('EXCEL_SNAPSHOT_DIR', os.path.join('excel', '.snapshot')))
+        ),
+        report=ReportConfig(
+            workers=int(os.getenv('REPORT_WORKERS', 2)),
+            queue_limit=int(os.getenv('REPORT_QUEUE_LIMIT', 8)),
+            job_workers=int(os.getenv('REPORT_JOB_WORKERS', 2)),
+            job_max_attempts=int(os.getenv('REPORT_JOB_MAX_ATTEMPTS', 5)),
+            job_retry_seconds=int(os.getenv('REPORT_JOB_RETRY_SECONDS', 30))
+        ),
+        export=ExportConfig(
+            bucket=str(os.getenv('EXPORT_BUCKET', 'results-export')),
+            link_ttl=int(os.getenv('EXPORT_LINK_TTL_HOURS', 24)) * 3600,
+            batch_size=int(os.getenv('EXPORT_BATCH_SIZE', 5000))
+        ),
         log_level=str(os.getenv('LOG_LEVEL')),
         admin_password=str(os.getenv('ADMIN_PASSWORD'))
     )
@@ -1,11 +1,17 @@
+import asyncio
+import time
 import aiohttp
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from sqlalchemy import inspect, select
-import os
-import pandas as pd
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy import inspect, select, text
 from db.models import AiCreators, Models, AiSettings
 from services.logger import logger
 from db.base import Base
+from db.dictionaries import sync_dictionary_keys
+from db.excel_snapshot import load_sheets
+from db.migrations import apply_migrations
+from db.partitions import ensure_partitions
 from config import Config
 
 def get_db_url():
@@ -17,6 +23,60 @@ def get_db_url():
     )
 
 engine = create_async_engine(get_db_url())
+# Запасной вариант для читающих сессий, когда реплики нет или она отстала
+readonly_engine = engine.execution_options(postgresql_readonly=True)
+
+# Отставание реплики в секундах: 0, если все полученные WAL уже применены
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 ELSE COALESCE(EXTRACT(EPOCH FROM now() - "
+    "pg_last_xact_replay_timestamp()), 0) END")
+
+
+class ReplicaRouter:
+    """Выбирает движок для читающих сессий.
+
+    Реплика используется, пока она отвечает и отстает не больше
+    REPLICA_MAX_LAG секунд, иначе чтение идет в primary. Проверка идет
+    в фоне не чаще раза в REPLICA_CHECK_INTERVAL секунд, поэтому выбор
+    движка не ждет сети. До первой проверки читаем из primary.
+    """
+
+    def __init__(self, url: Optional[str]):
+        self.replica = create_async_engine(url).execution_options(
+            postgresql_readonly=True) if url else None
+        self._healthy = False
+        self._checked_at = 0.0
+        self._check_task: Optional[asyncio.Task] = None
+
+    def read_engine(self) -> AsyncEngine:
+        if self.replica is None:
+            return readonly_engine
+        if (time.monotonic() - self._checked_at >= Config.REPLICA_CHECK_INTERVAL
+                and (self._check_task is None or self._check_task.done())):
+            self._check_task = asyncio.create_task(self._check())
+        return self.replica if self._healthy else readonly_engine
+
+    async def _check(self) -> None:
+        try:
+            async with asyncio.timeout(Config.REPLICA_CHECK_INTERVAL):
+                async with self.replica.connect() as conn:
+                    lag = float((await conn.execute(REPLICA_LAG_QUERY)).scalar()
+                                or 0)
+            healthy = lag <= Config.REPLICA_MAX_LAG
+            if not healthy:
+                logger.warning(f"Replica lag {lag:.1f}s, reading from primary")
+        except Exception as e:
+            logger.warning(f"Replica unavailable, reading from primary: {e}")
+            healthy = False
+
+        if healthy and not self._healthy:
+            logger.info("Replica is healthy, routing reads to it")
+        self._healthy = healthy
+        self._checked_at = time.monotonic()
+
+
+replica_router = ReplicaRouter(Config.REPLICA_DB_URL)
 
 async def init_db():
     async with engine.begin() as conn:
@@ -25,6 +85,8 @@ async def init_db():
             await conn.run_sync(Base.metadata.drop_all)
 
         await conn.run_sync(Base.metadata.create_all)
+        await apply_migrations(conn)
+        await ensure_partitions(conn)
 
         tables = await conn.run_sync(
             lambda sync_conn: inspect(sync_conn).get_table_names()
@@ -43,27 +105,17 @@ async def init_db():
 
 async def load_data_from_excel():
     try:
-        excel_dir = os.path.join(os.getcwd(), 'excel')
-        dfs = {
-            'dama_competencies': pd.read_excel(os.path.join(excel_dir, "dama_competencies.xlsx")),
-            'dama_questions': pd.read_excel(os.path.join(excel_dir, "dama_questions.xlsx")),
-            'dama_cases': pd.read_excel(os.path.join(excel_dir, "dama_cases.xlsx")),
-            'dama_roles': pd.read_excel(os.path.join(excel_dir, "dama_roles.xlsx"))
-        }
+        # Снимки читаются с диска, а при изменении xlsx парсятся pandas:
+        # и то и другое блокирующее, поэтому вне event loop
+        sheets = await asyncio.to_thread(load_sheets)
 
         async with engine.begin() as conn:
-            for table_name, df in dfs.items():
-                df.columns = df.columns.str.lower()
-
-                await conn.run_sync(
-                    lambda sync_conn: df.to_sql(
-                        table_name.lower(),
-                        sync_conn,
-                        if_exists='append',
-                        index=False,
-                        method='multi'
-                    )
-                )
+            for table_name, sheet in sheets.items():
+                if sheet.rows:
+                    await conn.execute(Base.metadata.tables[table_name].insert(),
+                                       sheet.records())
+
+            await sync_dictionary_keys(conn)
 
         logger.info("Data load from EXCEL")
     except Exception as e:
@@ -161,11 +213,65 @@ async def load_models(models_link: str, token: str, creator_id: int):
         
         return False
 
-def get_async_session():
+def get_write_session() -> AsyncSession:
+    """Сессия primary: запись и чтение сразу после записи"""
     return async_sessionmaker(engine, expire_on_commit=False)()
 
-async def get_selected_ai_creator():
-    async with get_async_session() as session:
+def get_read_session() -> AsyncSession:
+    """Сессия только для чтения: админка, отчеты, аналитика.
+
+    Идет в реплику, если она настроена и здорова, иначе в primary
+    в режиме READ ONLY.
+    """
+    return async_sessionmaker(replica_router.read_engine(),
+                              expire_on_commit=False)()
+
+get_async_session = get_write_session
+
+AFTER_COMMIT = 'after_commit'
+
+def after_commit(session: AsyncSession,
+                 callback: Callable[[], Awaitable[object]]) -> None:
+    """Выполнить callback после коммита транзакции session, например
+    сбросить кэш: до коммита другие процессы закэшировали бы старые данные"""
+    session.info.setdefault(AFTER_COMMIT, []).append(callback)
+
+async def commit(session: AsyncSession) -> None:
+    await session.commit()
+    for callback in session.info.pop(AFTER_COMMIT, []):
+        await callback()
+
+async def rollback(session: AsyncSession) -> None:
+    session.info.pop(AFTER_COMMIT, None)
+    await session.rollback()
+
+async def end_transaction(session: Optional[AsyncSession]) -> None:
+    """Завершить транзакцию перед долгим ожиданием (запрос к LLM, пауза):
+    соединение возвращается в пул, а не висит idle in transaction"""
+    if session is not None and session.in_transaction():
+        await commit(session)
+
+@asynccontextmanager
+async def session_scope(session: Optional[AsyncSession] = None):
+    """Сессия апдейта, если она передана, иначе отдельная короткая сессия.
+
+    Транзакцией переданной сессии владеет вызывающий (DbSessionMiddleware),
+    своя сессия коммитится при выходе и откатывается при исключении.
+    """
+    if session is not None:
+        yield session
+        return
+    async with get_async_session() as own_session:
+        try:
+            yield own_session
+        except BaseException:
+            await rollback(own_session)
+            raise
+        if own_session.in_transaction():
+            await commit(own_session)
+
+async def get_selected_ai_creator(session: Optional[AsyncSession] = None):
+    async with session_scope(session) as session:
         result = await session.execute(
             select(Models).where(Models.selected == True)
         )
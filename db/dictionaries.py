@@ -0,0 +1,36 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from services.logger import logger
+
+# Таблицы, которые приходят из Excel с именами ролей и компетенций
+NAMED_TABLES = ('dama_competencies', 'dama_questions', 'dama_cases')
+
+
+async def sync_dictionary_keys(conn: AsyncConnection) -> None:
+    """Пополнить справочники ролей/компетенций и проставить ссылки на них"""
+    names = " UNION ".join(
+        f"SELECT dama_role_name, dama_competence_name FROM {table}"
+        for table in NAMED_TABLES)
+
+    await conn.execute(
+        text("INSERT INTO dama_role_keys (name) "
+             f"SELECT DISTINCT dama_role_name FROM ({names}) AS names "
+             "UNION SELECT dama_role_name FROM dama_roles "
+             "ON CONFLICT (name) DO NOTHING"))
+    await conn.execute(
+        text("INSERT INTO dama_competence_keys (role_id, name) "
+             "SELECT DISTINCT r.id, names.dama_competence_name "
+             f"FROM ({names}) AS names "
+             "JOIN dama_role_keys r ON r.name = names.dama_role_name "
+             "ON CONFLICT (role_id, name) DO NOTHING"))
+
+    for table in NAMED_TABLES:
+        await conn.execute(
+            text(f"UPDATE {table} t SET role_id = r.id, competence_id = c.id "
+                 "FROM dama_role_keys r "
+                 "JOIN dama_competence_keys c ON c.role_id = r.id "
+                 "WHERE t.competence_id IS NULL "
+                 "AND r.name = t.dama_role_name "
+                 "AND c.name = t.dama_competence_name"))
+    logger.info("Role and competence dictionaries synced")
@@ -0,0 +1,117 @@
+"""Снимки листов из excel/ в компактном бинарном виде.
+
+Разбор .xlsx через pandas - заметная часть старта контейнера, поэтому
+распарсенные строки кэшируются в EXCEL_SNAPSHOT_DIR с ключом sha256
+исходного файла. pandas и openpyxl импортируются, только если таблица
+изменилась. Снимки пишет сам бот, поэтому это просто pickle, сжатый zlib.
+
+Прогрев снимков (например, при сборке образа):
+Запуск: poetry run python -m db.excel_snapshot
+"""
+import glob
+import hashlib
+import os
+import pickle
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+from services.logger import logger
+
+EXCEL_TABLES = ('dama_competencies', 'dama_questions', 'dama_cases',
+                'dama_roles')
+# Меняется при изменении формата снимка или правил разбора листов
+SNAPSHOT_VERSION = 1
+
+
+@dataclass(frozen=True)
+class Sheet:
+    """Распарсенный лист: имена колонок в нижнем регистре и строки"""
+    columns: Tuple[str, ...]
+    rows: List[tuple]
+
+    def records(self) -> List[dict]:
+        return [dict(zip(self.columns, row)) for row in self.rows]
+
+
+def excel_path(table: str) -> str:
+    return os.path.join(os.getcwd(), 'excel', f"{table}.xlsx")
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot_path(table: str, digest: str) -> str:
+    return os.path.join(Config.EXCEL_SNAPSHOT_DIR,
+                        f"{table}-{digest[:16]}.pickle.z")
+
+
+def _parse(path: str) -> Sheet:
+    import pandas as pd
+
+    df = pd.read_excel(path)
+    df.columns = df.columns.str.lower()
+    # Пустые ячейки - NULL, как и при df.to_sql
+    df = df.astype(object).where(df.notna(), None)
+    return Sheet(columns=tuple(df.columns),
+                 rows=list(df.itertuples(index=False, name=None)))
+
+
+def _read_snapshot(path: str) -> Optional[Sheet]:
+    try:
+        with open(path, 'rb') as file:
+            version, sheet = pickle.loads(zlib.decompress(file.read()))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Broken excel snapshot {path}: {e}")
+        return None
+    return sheet if version == SNAPSHOT_VERSION else None
+
+
+def _write_snapshot(table: str, path: str, sheet: Sheet) -> None:
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(
+                zlib.compress(
+                    pickle.dumps((SNAPSHOT_VERSION, sheet),
+                                 protocol=pickle.HIGHEST_PROTOCOL)))
+        os.replace(tmp_path, path)
+        for stale in glob.glob(
+                os.path.join(os.path.dirname(path), f"{table}-*.pickle.z")):
+            if stale != path:
+                os.remove(stale)
+    except OSError as e:
+        # Без снимка просто разберем файл заново на следующем старте
+        logger.warning(f"Cannot save excel snapshot {path}: {e}")
+
+
+def load_sheet(table: str) -> Sheet:
+    path = excel_path(table)
+    cached = snapshot_path(table, file_hash(path))
+    sheet = _read_snapshot(cached)
+    if sheet is None:
+        logger.info(f"Parsing {os.path.basename(path)}")
+        sheet = _parse(path)
+        _write_snapshot(table, cached, sheet)
+    return sheet
+
+
+def load_sheets() -> Dict[str, Sheet]:
+    started = time.perf_counter()
+    sheets = {table: load_sheet(table) for table in EXCEL_TABLES}
+    logger.info(f"Excel sheets loaded in {time.perf_counter() - started:.3f}s")
+    return sheets
+
+
+if __name__ == "__main__":
+    load_sheets()
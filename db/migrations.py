@@ -0,0 +1,312 @@
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from services.logger import logger
+
+
+@dataclass(frozen=True)
+class Migration:
+    """Шаг изменения схемы для уже существующих баз.
+
+    Новые базы создаются через metadata.create_all, поэтому каждый шаг
+    должен быть идемпотентным и не ломаться на уже актуальной схеме.
+    """
+    version: int
+    name: str
+    statements: Tuple[str, ...] = ()
+    run: Optional[Callable[[AsyncConnection], Awaitable[None]]] = None
+
+
+async def _backfill_user_stats(conn: AsyncConnection) -> None:
+    from repositories.user_stats_repository import build_user_stats_backfill
+    await conn.execute(build_user_stats_backfill())
+
+
+_PARTITIONED_DDL = (
+    "CREATE TABLE dama_test_results ("
+    "id SERIAL NOT NULL, "
+    "user_id BIGINT NOT NULL REFERENCES dama_users (id), "
+    "dama_role VARCHAR(255) NOT NULL, "
+    "dama_competence VARCHAR(255) NOT NULL, "
+    "total_score FLOAT NOT NULL, "
+    "is_expert BOOLEAN NOT NULL, "
+    "test_date TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "report_path VARCHAR, "
+    "PRIMARY KEY (id, test_date)"
+    ") PARTITION BY RANGE (test_date)",
+    "CREATE INDEX ix_dama_test_results_user_date "
+    "ON dama_test_results (user_id, test_date)",
+    "CREATE TABLE dama_test_answers ("
+    "id SERIAL NOT NULL, "
+    "test_result_id INTEGER NOT NULL, "
+    "test_date TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "question_id INTEGER REFERENCES dama_questions (id), "
+    "case_id INTEGER REFERENCES dama_cases (id), "
+    "answer_text TEXT NOT NULL, "
+    "score FLOAT NOT NULL, "
+    "feedback TEXT, "
+    "PRIMARY KEY (id, test_date), "
+    "FOREIGN KEY (test_result_id, test_date) "
+    "REFERENCES dama_test_results (id, test_date)"
+    ") PARTITION BY RANGE (test_date)",
+    "CREATE INDEX ix_dama_test_answers_result "
+    "ON dama_test_answers (test_result_id, test_date)",
+    "CREATE TABLE ai_analytics ("
+    "id SERIAL NOT NULL, "
+    "prompt_tokens INTEGER NOT NULL, "
+    "test_result_id INTEGER NOT NULL, "
+    "test_date TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "completion_tokens INTEGER NOT NULL, "
+    "total_tokens INTEGER NOT NULL, "
+    "model VARCHAR(255), "
+    "created_at TIMESTAMP WITHOUT TIME ZONE, "
+    "PRIMARY KEY (id, test_date), "
+    "FOREIGN KEY (test_result_id, test_date) "
+    "REFERENCES dama_test_results (id, test_date)"
+    ") PARTITION BY RANGE (test_date)",
+    "CREATE INDEX ix_ai_analytics_result "
+    "ON ai_analytics (test_result_id, test_date)",
+)
+
+_PARTITIONED_COPY = (
+    "INSERT INTO dama_test_results (id, user_id, dama_role, dama_competence, "
+    "total_score, is_expert, test_date, report_path) "
+    "SELECT id, user_id, dama_role, dama_competence, total_score, is_expert, "
+    "COALESCE(test_date, now()), report_path FROM dama_test_results_legacy",
+    "INSERT INTO dama_test_answers (id, test_result_id, test_date, "
+    "question_id, case_id, answer_text, score, feedback) "
+    "SELECT a.id, a.test_result_id, r.test_date, a.question_id, a.case_id, "
+    "a.answer_text, a.score, a.feedback FROM dama_test_answers_legacy a "
+    "JOIN dama_test_results r ON r.id = a.test_result_id",
+    "INSERT INTO ai_analytics (id, prompt_tokens, test_result_id, test_date, "
+    "completion_tokens, total_tokens, model, created_at) "
+    "SELECT a.id, a.prompt_tokens, a.test_result_id, r.test_date, "
+    "a.completion_tokens, a.total_tokens, a.model, a.created_at "
+    "FROM ai_analytics_legacy a "
+    "JOIN dama_test_results r ON r.id = a.test_result_id",
+)
+
+
+async def _partition_test_tables(conn: AsyncConnection) -> None:
+    """Перенести результаты, ответы и аналитику в секционированные таблицы"""
+    from db.partitions import PARTITIONED_TABLES, ensure_partitions
+
+    relkind = await conn.execute(
+        text("SELECT relkind FROM pg_class WHERE relname = 'dama_test_results'"))
+    if relkind.scalar_one_or_none() != 'r':
+        # Новая база: create_all уже создал секционированные таблицы
+        return
+
+    for table in PARTITIONED_TABLES:
+        await conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_legacy"))
+        await conn.execute(
+            text(f"ALTER SEQUENCE IF EXISTS {table}_id_seq "
+                 f"RENAME TO {table}_legacy_id_seq"))
+        await conn.execute(
+            text(f"ALTER INDEX IF EXISTS {table}_pkey "
+                 f"RENAME TO {table}_legacy_pkey"))
+    await conn.execute(
+        text("DROP INDEX IF EXISTS ix_dama_test_results_user_date"))
+
+    for statement in _PARTITIONED_DDL:
+        await conn.execute(text(statement))
+
+    first = await conn.execute(
+        text("SELECT min(test_date) FROM dama_test_results_legacy"))
+    first_date = first.scalar_one_or_none()
+    await ensure_partitions(conn,
+                            first_month=first_date.date() if first_date else None)
+
+    for statement in _PARTITIONED_COPY:
+        await conn.execute(text(statement))
+
+    for table in PARTITIONED_TABLES:
+        await conn.execute(
+            text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                 f"COALESCE(max(id), 0) + 1, false) FROM {table}"))
+    for table in reversed(PARTITIONED_TABLES):
+        await conn.execute(text(f"DROP TABLE {table}_legacy"))
+
+
+async def _column_type(conn: AsyncConnection, table: str,
+                       column: str) -> Optional[str]:
+    result = await conn.execute(
+        text("SELECT data_type FROM information_schema.columns "
+             "WHERE table_name = :table AND column_name = :column"),
+        {"table": table, "column": column})
+    return result.scalar_one_or_none()
+
+
+async def _normalize_results_schema(conn: AsyncConnection) -> None:
+    """JSONB для отзывов, enum для роли пользователя и ссылки на справочники"""
+    from db.dictionaries import NAMED_TABLES, sync_dictionary_keys
+
+    await conn.execute(
+        text("DO $$ BEGIN "
+             "CREATE TYPE user_role AS ENUM ('admin', 'user', 'banned'); "
+             "EXCEPTION WHEN duplicate_object THEN NULL; END $$"))
+    if await _column_type(conn, 'dama_users', 'role') != 'USER-DEFINED':
+        # Старые записи могли сохраниться как 'UserRole.ADMIN'
+        await conn.execute(
+            text("ALTER TABLE dama_users ALTER COLUMN role TYPE user_role "
+                 "USING (CASE WHEN role LIKE 'UserRole.%' "
+                 "THEN lower(substr(role, 10)) ELSE role END)::user_role"))
+
+    if await _column_type(conn, 'dama_test_answers', 'feedback') != 'jsonb':
+        await conn.execute(
+            text("ALTER TABLE dama_test_answers ALTER COLUMN feedback "
+                 "TYPE JSONB USING feedback::jsonb"))
+    await conn.execute(
+        text("CREATE INDEX IF NOT EXISTS ix_dama_test_answers_feedback "
+             "ON dama_test_answers USING gin (feedback jsonb_path_ops)"))
+
+    for table in NAMED_TABLES:
+        await conn.execute(
+            text(f"ALTER TABLE {table} "
+                 "ADD COLUMN IF NOT EXISTS role_id SMALLINT "
+                 "REFERENCES dama_role_keys (id), "
+                 "ADD COLUMN IF NOT EXISTS competence_id INTEGER "
+                 "REFERENCES dama_competence_keys (id)"))
+    await sync_dictionary_keys(conn)
+
+    if await _column_type(conn, 'dama_test_results', 'dama_role') is None:
+        return
+    for statement in (
+            "INSERT INTO dama_role_keys (name) "
+            "SELECT DISTINCT dama_role FROM dama_test_results "
+            "ON CONFLICT (name) DO NOTHING",
+            "INSERT INTO dama_competence_keys (role_id, name) "
+            "SELECT DISTINCT r.id, t.dama_competence FROM dama_test_results t "
+            "JOIN dama_role_keys r ON r.name = t.dama_role "
+            "ON CONFLICT (role_id, name) DO NOTHING",
+            "ALTER TABLE dama_test_results "
+            "ADD COLUMN IF NOT EXISTS role_id SMALLINT "
+            "REFERENCES dama_role_keys (id), "
+            "ADD COLUMN IF NOT EXISTS competence_id INTEGER "
+            "REFERENCES dama_competence_keys (id)",
+            "UPDATE dama_test_results t "
+            "SET role_id = r.id, competence_id = c.id "
+            "FROM dama_role_keys r "
+            "JOIN dama_competence_keys c ON c.role_id = r.id "
+            "WHERE r.name = t.dama_role AND c.name = t.dama_competence",
+            "ALTER TABLE dama_test_results "
+            "ALTER COLUMN role_id SET NOT NULL, "
+            "ALTER COLUMN competence_id SET NOT NULL, "
+            "DROP COLUMN dama_role, "
+            "DROP COLUMN dama_competence",
+    ):
+        await conn.execute(text(statement))
+
+
+MIGRATIONS = [
+    Migration(
+        version=1,
+        name="question difficulty",
+        statements=(
+            "ALTER TABLE dama_questions "
+            "ADD COLUMN IF NOT EXISTS difficulty DOUBLE PRECISION",
+        )),
+    Migration(
+        version=2,
+        name="users role keyset index",
+        statements=(
+            "CREATE INDEX IF NOT EXISTS ix_dama_users_role_id "
+            "ON dama_users (role, id)",
+        )),
+    Migration(
+        version=3,
+        name="user stats",
+        statements=(
+            "CREATE INDEX IF NOT EXISTS ix_dama_test_results_user_date "
+            "ON dama_test_results (user_id, test_date)",
+        ),
+        run=_backfill_user_stats),
+    Migration(
+        version=4,
+        name="monthly partitions for test tables",
+        run=_partition_test_tables),
+    Migration(
+        version=5,
+        name="jsonb feedback, user role enum, role/competence keys",
+        run=_normalize_results_schema),
+    Migration(
+        version=6,
+        name="candidate name on test results",
+        statements=(
+            "ALTER TABLE dama_test_results "
+            "ADD COLUMN IF NOT EXISTS candidate_name VARCHAR(255)",
+        )),
+    Migration(
+        version=7,
+        name="exam id on test results",
+        statements=(
+            "ALTER TABLE dama_test_results "
+            "ADD COLUMN IF NOT EXISTS exam_id VARCHAR(32)",
+            "CREATE INDEX IF NOT EXISTS ix_dama_test_results_exam_id "
+            "ON dama_test_results (exam_id)",
+        )),
+    Migration(
+        version=8,
+        name="broadcasts",
+        statements=(
+            "CREATE TABLE IF NOT EXISTS dama_broadcasts ("
+            "id SERIAL PRIMARY KEY, "
+            "text TEXT NOT NULL, "
+            "created_by BIGINT NOT NULL REFERENCES dama_users (id), "
+            "created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(), "
+            "status VARCHAR(16) NOT NULL DEFAULT 'running', "
+            "status_message_id BIGINT, "
+            "last_user_id BIGINT NOT NULL DEFAULT 0, "
+            "delivered INTEGER NOT NULL DEFAULT 0, "
+            "blocked INTEGER NOT NULL DEFAULT 0, "
+            "failed INTEGER NOT NULL DEFAULT 0, "
+            "finished_at TIMESTAMP WITHOUT TIME ZONE)",
+        )),
+    Migration(
+        version=9,
+        name="archived user months",
+        statements=(
+            "CREATE TABLE IF NOT EXISTS dama_archived_user_months ("
+            "user_id BIGINT NOT NULL, "
+            "month DATE NOT NULL, "
+            "tests_taken INTEGER NOT NULL, "
+            "total_score DOUBLE PRECISION NOT NULL, "
+            "best_score DOUBLE PRECISION NOT NULL, "
+            "last_test_date TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+            "is_expert BOOLEAN NOT NULL, "
+            "PRIMARY KEY (user_id, month))",
+            "CREATE INDEX IF NOT EXISTS ix_dama_archived_user_months_month "
+            "ON dama_archived_user_months (month)",
+        )),
+]
+
+
+async def apply_migrations(conn: AsyncConnection) -> None:
+    await conn.execute(
+        text("CREATE TABLE IF NOT EXISTS dama_schema_migrations ("
+             "version INTEGER PRIMARY KEY, "
+             "name VARCHAR(255) NOT NULL, "
+             "applied_at TIMESTAMP NOT NULL DEFAULT now())"))
+
+    result = await conn.execute(
+        text("SELECT version FROM dama_schema_migrations"))
+    applied = set(result.scalars().all())
+
+    for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+        if migration.version in applied:
+            continue
+
+        for statement in migration.statements:
+            await conn.execute(text(statement))
+        if migration.run:
+            await migration.run(conn)
+
+        await conn.execute(
+            text("INSERT INTO dama_schema_migrations (version, name) "
+                 "VALUES (:version, :name)"),
+            {"version": migration.version, "name": migration.name})
+        logger.info(
+            f"Applied migration {migration.version}: {migration.name}")
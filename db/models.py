@@ -1,6 +1,7 @@
 from datetime import datetime
 from sqlalchemy import Column, Integer, String, Text, CheckConstraint, Float, Boolean, ForeignKey, DateTime, \
-    UniqueConstraint, false
+    UniqueConstraint, Index, Date, ForeignKeyConstraint, SmallInteger, Enum, false
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 
 from config import Config
@@ -15,37 +16,96 @@ class User(Base):
     first_name = Column(String(255), nullable=False)
     last_name = Column(String(255), nullable=False)
     username = Column(String(255), nullable=False)
-    role = Column(String(255), nullable=False, default=UserRole.USER)
+    role = Column(Enum(UserRole,
+                       name='user_role',
+                       values_callable=lambda roles: [role.value for role in roles]),
+                  nullable=False,
+                  default=UserRole.USER)
     test_results = relationship("TestResults", back_populates="user")
 
     __table_args__ = (
         CheckConstraint("first_name != '' OR last_name != ''", name='has_name'),
+        Index('ix_dama_users_role_id', 'role', 'id'),
         {'extend_existing': True}
     )
 
 
+class DAMARoleKey(Base):
+    """Справочник ролей: остальные таблицы ссылаются на него по id"""
+    __tablename__ = 'dama_role_keys'
+
+    id = Column(SmallInteger, primary_key=True, autoincrement=True)
+    name = Column(String(255), nullable=False, unique=True)
+
+
+class DAMACompetenceKey(Base):
+    """Справочник компетенций в разрезе ролей"""
+    __tablename__ = 'dama_competence_keys'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    role_id = Column(SmallInteger, ForeignKey('dama_role_keys.id'), nullable=False)
+    name = Column(String(255), nullable=False)
+
+    role = relationship("DAMARoleKey")
+
+    __table_args__ = (
+        UniqueConstraint('role_id', 'name', name='uq_dama_competence_keys_role_name'),
+    )
+
+
 class TestResults(Base):
     __tablename__ = 'dama_test_results'
 
+    # Таблица секционирована по месяцам test_date, поэтому он входит в ключ
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, ForeignKey('dama_users.id'), nullable=False)
-    dama_role = Column(String(255), nullable=False)
-    dama_competence = Column(String(255), nullable=False)
+    role_id = Column(SmallInteger, ForeignKey('dama_role_keys.id'), nullable=False)
+    competence_id = Column(Integer, ForeignKey('dama_competence_keys.id'), nullable=False)
     total_score = Column(Float, nullable=False)
     is_expert = Column(Boolean, nullable=False)
-    test_date = Column(DateTime, default=datetime.utcnow)
+    test_date = Column(DateTime, primary_key=True, default=datetime.utcnow)
     report_path: Mapped[str] = mapped_column(String, nullable=True) # Add this line
+    # ФИО, которое кандидат ввел перед тестом: нужно для отчета
+    candidate_name = Column(String(255), nullable=True)
+    # Идентификатор прохождения: повторное сохранение того же теста не
+    # создает второй результат
+    exam_id = Column(String(32), nullable=True)
 
     user = relationship("User", back_populates="test_results")
+    role = relationship("DAMARoleKey")
+    competence = relationship("DAMACompetenceKey")
     answers = relationship("TestAnswer", back_populates="test_result")
     analytics = relationship("Analytics", back_populates="test_result", uselist=False, cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index('ix_dama_test_results_user_date', 'user_id', 'test_date'),
+        Index('ix_dama_test_results_exam_id', 'exam_id'),
+        {'postgresql_partition_by': 'RANGE (test_date)', 'extend_existing': True}
+    )
+
+
+class UserStats(Base):
+    """Агрегаты по результатам пользователя, обновляются вместе с TestResults"""
+    __tablename__ = 'dama_user_stats'
+
+    user_id = Column(BigInteger, ForeignKey('dama_users.id'), primary_key=True)
+    tests_taken = Column(Integer, nullable=False, default=0)
+    total_score = Column(Float, nullable=False, default=0.0)
+    avg_score = Column(Float, nullable=False, default=0.0)
+    best_score = Column(Float, nullable=False, default=0.0)
+    last_test_date = Column(DateTime, nullable=True)
+    # Хотя бы один тест пройден на уровне эксперта
+    is_expert = Column(Boolean, nullable=False, default=False)
+
 class DAMACompetency(Base):
     __tablename__ = 'dama_competencies'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     dama_role_name = Column(String(255), nullable=False)
     dama_competence_name = Column(String(255), nullable=False)
+    # Заполняются по именам из Excel при импорте (db.dictionaries)
+    role_id = Column(SmallInteger, ForeignKey('dama_role_keys.id'), nullable=True)
+    competence_id = Column(Integer, ForeignKey('dama_competence_keys.id'), nullable=True)
 
     __table_args__ = (
         CheckConstraint("dama_role_name != '' AND dama_competence_name != ''", name='non_empty_fields'),
@@ -59,11 +119,16 @@ class DAMAQuestion(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     dama_role_name = Column(String(255), nullable=False)
     dama_competence_name = Column(String(255), nullable=False)
+    # Заполняются по именам из Excel при импорте (db.dictionaries)
+    role_id = Column(SmallInteger, ForeignKey('dama_role_keys.id'), nullable=True)
+    competence_id = Column(Integer, ForeignKey('dama_competence_keys.id'), nullable=True)
     question_type = Column(String(50), nullable=False)
     question = Column(Text, nullable=False)
     question_answer = Column(Text, nullable=False)
     dama_knowledge_area = Column(Text)
     dama_main_job = Column(Text)
+    # Трудность по шкале Раша (логиты), калибруется jobs.calibrate_difficulty
+    difficulty = Column(Float, nullable=True)
 
     __table_args__ = (
         CheckConstraint("question_type IN ('Теория', 'Практика')", name='valid_question_type'),
@@ -75,23 +140,38 @@ class TestAnswer(Base):
     __tablename__ = 'dama_test_answers'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    test_result_id = Column(Integer, ForeignKey('dama_test_results.id'), nullable=False)
+    test_result_id = Column(Integer, nullable=False)
+    # Копия даты результата: ответы лежат в тех же месячных секциях
+    test_date = Column(DateTime, primary_key=True)
     question_id = Column(Integer, ForeignKey('dama_questions.id'), nullable=True)
     case_id = Column(Integer, ForeignKey('dama_cases.id'), nullable=True)
     answer_text = Column(Text, nullable=False)
     score = Column(Float, nullable=False)
-    feedback = Column(Text, nullable=True)
+    feedback = Column(JSONB, nullable=True)
 
     test_result = relationship("TestResults", back_populates="answers")
     question = relationship("DAMAQuestion")
     case = relationship("DAMACase")
 
+    __table_args__ = (
+        ForeignKeyConstraint(['test_result_id', 'test_date'],
+                             ['dama_test_results.id', 'dama_test_results.test_date']),
+        Index('ix_dama_test_answers_result', 'test_result_id', 'test_date'),
+        Index('ix_dama_test_answers_feedback', 'feedback',
+              postgresql_using='gin',
+              postgresql_ops={'feedback': 'jsonb_path_ops'}),
+        {'postgresql_partition_by': 'RANGE (test_date)', 'extend_existing': True}
+    )
+
 class DAMACase(Base):
     __tablename__ = 'dama_cases'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     dama_role_name = Column(String(255), nullable=False)
     dama_competence_name = Column(String(255), nullable=False)
+    # Заполняются по именам из Excel при импорте (db.dictionaries)
+    role_id = Column(SmallInteger, ForeignKey('dama_role_keys.id'), nullable=True)
+    competence_id = Column(Integer, ForeignKey('dama_competence_keys.id'), nullable=True)
     dama_main_job = Column(Text, nullable=False)
     situation = Column(Text, nullable=False)
     case_task = Column(Text, nullable=False)
@@ -139,10 +219,102 @@ class Analytics(Base):
     __tablename__ = 'ai_analytics'
     id = Column(Integer, primary_key=True, autoincrement=True)
     prompt_tokens = Column(Integer, nullable=False)
-    test_result_id = Column(Integer, ForeignKey('dama_test_results.id'), nullable=False)
+    test_result_id = Column(Integer, nullable=False)
+    test_date = Column(DateTime, primary_key=True)
     completion_tokens = Column(Integer, nullable=False)
     total_tokens = Column(Integer, nullable=False)
     model = Column(String(255), nullable=True)
     created_at = Column(DateTime, default=datetime.now)
 
-    test_result = relationship("TestResults", back_populates="analytics")
\ No newline at end of file
+    test_result = relationship("TestResults", back_populates="analytics")
+
+    __table_args__ = (
+        ForeignKeyConstraint(['test_result_id', 'test_date'],
+                             ['dama_test_results.id', 'dama_test_results.test_date']),
+        Index('ix_ai_analytics_result', 'test_result_id', 'test_date'),
+        {'postgresql_partition_by': 'RANGE (test_date)'}
+    )
+
+
+class ResultRollup(Base):
+    """Дневные агрегаты итоговых оценок по роли, компетенции и модели.
+
+    bucket_N - число тестов с оценкой в [N, N+1), пятерки попадают в bucket_4.
+    """
+    __tablename__ = 'dama_result_rollups'
+
+    day = Column(Date, primary_key=True)
+    dama_role = Column(String(255), primary_key=True)
+    dama_competence = Column(String(255), primary_key=True)
+    model = Column(String(255), primary_key=True, default='')
+    tests = Column(Integer, nullable=False, default=0)
+    experts = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Float, nullable=False, default=0.0)
+    score_sumsq = Column(Float, nullable=False, default=0.0)
+    bucket_0 = Column(Integer, nullable=False, default=0)
+    bucket_1 = Column(Integer, nullable=False, default=0)
+    bucket_2 = Column(Integer, nullable=False, default=0)
+    bucket_3 = Column(Integer, nullable=False, default=0)
+    bucket_4 = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
+
+
+class AnswerRollup(Base):
+    """Дневные агрегаты оценок ответов по роли, компетенции и области знаний"""
+    __tablename__ = 'dama_answer_rollups'
+
+    day = Column(Date, primary_key=True)
+    dama_role = Column(String(255), primary_key=True)
+    dama_competence = Column(String(255), primary_key=True)
+    knowledge_area = Column(Text, primary_key=True, default='')
+    answers = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Float, nullable=False, default=0.0)
+    score_sumsq = Column(Float, nullable=False, default=0.0)
+    bucket_0 = Column(Integer, nullable=False, default=0)
+    bucket_1 = Column(Integer, nullable=False, default=0)
+    bucket_2 = Column(Integer, nullable=False, default=0)
+    bucket_3 = Column(Integer, nullable=False, default=0)
+    bucket_4 = Column(Integer, nullable=False, default=0)
+
+
+class Broadcast(Base):
+    """Рассылка админа всем пользователям.
+
+    last_user_id - чекпоинт: всем пользователям с id до него рассылка
+    уже отправлена, прерванная рассылка продолжается с него.
+    """
+    __tablename__ = 'dama_broadcasts'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    text = Column(Text, nullable=False)
+    created_by = Column(BigInteger, ForeignKey('dama_users.id'), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # running, done или cancelled
+    status = Column(String(16), nullable=False, default='running')
+    status_message_id = Column(BigInteger, nullable=True)
+    last_user_id = Column(BigInteger, nullable=False, default=0)
+    delivered = Column(Integer, nullable=False, default=0)
+    blocked = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class ArchivedUserMonth(Base):
+    """Месяц архива, в котором есть тесты пользователя, с итогами за месяц.
+
+    По этому индексу архив читается только за нужные месяцы, а пересчет
+    dama_user_stats учитывает тесты, которых уже нет в базе.
+    """
+    __tablename__ = 'dama_archived_user_months'
+
+    user_id = Column(BigInteger, primary_key=True)
+    month = Column(Date, primary_key=True)
+    tests_taken = Column(Integer, nullable=False)
+    total_score = Column(Float, nullable=False)
+    best_score = Column(Float, nullable=False)
+    last_test_date = Column(DateTime, nullable=False)
+    is_expert = Column(Boolean, nullable=False)
+
+    __table_args__ = (
+        Index('ix_dama_archived_user_months_month', 'month'),
+    )
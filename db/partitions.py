@@ -0,0 +1,127 @@
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from config import Config
+from services.logger import logger
+
+# Таблицы, разбитые по месяцам test_date. Родитель идет первым: ответы и
+# аналитика ссылаются на результаты по (id, test_date)
+PARTITIONED_TABLES = ('dama_test_results', 'dama_test_answers', 'ai_analytics')
+PARENT_TABLE = PARTITIONED_TABLES[0]
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month.year:04d}{month.month:02d}"
+
+
+def _partition_month(table: str, name: str) -> Optional[date]:
+    suffix = name[len(table) + 2:]
+    if not name.startswith(f"{table}_p") or len(suffix) != 6 or not suffix.isdigit():
+        return None
+    return date(int(suffix[:4]), int(suffix[4:]), 1)
+
+
+async def ensure_partitions(conn: AsyncConnection,
+                            first_month: Optional[date] = None,
+                            months_ahead: Optional[int] = None) -> None:
+    """Создать месячные секции от first_month до текущего месяца + запас"""
+    months_ahead = (Config.PARTITION_MONTHS_AHEAD
+                    if months_ahead is None else months_ahead)
+    current = month_start(datetime.utcnow().date())
+    month = month_start(first_month) if first_month else current
+    last = add_months(current, months_ahead)
+
+    while month <= last:
+        upper = add_months(month, 1)
+        for table in PARTITIONED_TABLES:
+            await conn.execute(
+                text(f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} "
+                     f"PARTITION OF {table} "
+                     f"FOR VALUES FROM ('{month.isoformat()}') "
+                     f"TO ('{upper.isoformat()}')"))
+        month = upper
+
+
+async def _partitions(conn: AsyncConnection, table: str) -> List[str]:
+    result = await conn.execute(
+        text("SELECT child.relname FROM pg_inherits "
+             "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+             "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+             "WHERE parent.relname = :table"), {"table": table})
+    return list(result.scalars().all())
+
+
+async def partition_months(conn: AsyncConnection) -> List[date]:
+    """Месяцы, для которых есть секция результатов, в том числе отсоединенная"""
+    result = await conn.execute(
+        text("SELECT relname FROM pg_class "
+             "WHERE relkind = 'r' AND relname LIKE :pattern"),
+        {"pattern": f"{PARENT_TABLE}_p%"})
+    months = (_partition_month(PARENT_TABLE, name)
+              for name in result.scalars().all())
+    return sorted(month for month in months if month)
+
+
+async def drop_month(conn: AsyncConnection, month: date) -> None:
+    """Удалить секции месяца во всех таблицах, начиная со ссылающихся"""
+    for table in reversed(PARTITIONED_TABLES):
+        name = partition_name(table, month)
+        if name in await _partitions(conn, table):
+            await conn.execute(
+                text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+    logger.info(f"Dropped partitions for {month:%Y-%m}")
+
+
+async def detach_expired_partitions(
+        conn: AsyncConnection,
+        retention_months: Optional[int] = None) -> List[str]:
+    """Отсоединить секции старше срока хранения.
+
+    Отсоединенные таблицы остаются в базе для архивации, но перестают
+    участвовать в запросах к родительским таблицам. 0 - хранить все.
+    """
+    retention_months = (Config.PARTITION_RETENTION_MONTHS
+                        if retention_months is None else retention_months)
+    if retention_months <= 0:
+        return []
+
+    cutoff = add_months(month_start(datetime.utcnow().date()),
+                        -retention_months)
+    detached = []
+    # Сначала ссылающиеся таблицы, иначе секцию результатов не отсоединить
+    for table in reversed(PARTITIONED_TABLES):
+        for name in sorted(await _partitions(conn, table)):
+            month = _partition_month(table, name)
+            if month is None or month >= cutoff:
+                continue
+            await conn.execute(
+                text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            if table != PARENT_TABLE:
+                # Внешний ключ остался бы ссылаться на уже пустого родителя
+                constraints = await conn.execute(
+                    text("SELECT conname FROM pg_constraint "
+                         "WHERE conrelid = CAST(:name AS regclass) "
+                         "AND confrelid = CAST(:parent AS regclass) "
+                         "AND contype = 'f'"), {
+                             "name": name,
+                             "parent": PARENT_TABLE
+                         })
+                for constraint in constraints.scalars().all():
+                    await conn.execute(
+                        text(f'ALTER TABLE {name} DROP CONSTRAINT "{constraint}"'))
+            detached.append(name)
+            logger.info(f"Detached partition {name}")
+    return detached
@@ -1,34 +1,60 @@
+import html
+from datetime import datetime, time, timedelta
+from typing import Optional
 from aiogram import F, Router
 from aiogram.types import Message, CallbackQuery, message
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.future import select
-from sqlalchemy import update
 from aiogram.types import Message, InaccessibleMessage
 from config import Config
-from db.models import AiCreators, Models, AiSettings, User, TestResults
-from db.database import get_async_session, load_models
+from db.models import TestResults, DAMARoleKey, DAMACompetenceKey
+from db.database import load_models
+from db.partitions import add_months, month_start
 from handlers.states import AdminStates
 from services.keyboard import build_ai_creators_keyboard, build_admin_keyboard, build_model_choice_keyboard, \
-    build_back_to_providers_keyboard, build_users_keyboard
+    build_back_to_providers_keyboard, build_users_keyboard, build_analytics_keyboard, build_report_keyboard, ANALYTICS_DIMENSIONS, \
+    build_broadcast_confirm_keyboard, build_broadcast_keyboard
 from services.redis_service import RedisService
 from services.logger import logger
 from db.enums import UserRole
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-from services.minio_service import MinioService
+from services.archive_service import ResultsArchive
+from services.export_service import EXPORT_FORMATS, ExportFilter, ResultsExport
+from services.minio_service import minio_service
+from services.service_container import ServiceContainer
+from services.user_service import UserService
+from services.user_cache import UserProfile, user_profile_cache
 
 admin_router = Router()
 redis_service = RedisService()
-minio_service = MinioService()
+results_archive = ResultsArchive(minio_service)
+results_export = ResultsExport(minio_service)
+
+
+async def _load_user_results(session, user_id: int, limit: int,
+                             *conditions) -> list:
+    """Последние результаты пользователя из БД, от новых к старым"""
+    query = await session.execute(
+        select(TestResults.id, TestResults.total_score,
+               TestResults.test_date, TestResults.report_path,
+               DAMARoleKey.name.label('dama_role'),
+               DAMACompetenceKey.name.label('dama_competence')).join(
+                   DAMARoleKey, DAMARoleKey.id == TestResults.role_id).join(
+                       DAMACompetenceKey,
+                       DAMACompetenceKey.id == TestResults.competence_id).where(
+                           TestResults.user_id == user_id, *conditions).order_by(
+                               TestResults.test_date.desc()).limit(limit))
+    return [dict(row) for row in query.mappings().all()]
 
 
 @admin_router.message(F.text == "Админ")
-async def admin_panel(message: Message, state: FSMContext):
+async def admin_panel(message: Message, state: FSMContext,
+                      user_profile: Optional[UserProfile] = None):
     if not message.from_user:
         await message.answer("Не удалось определить пользователя.")
         return
 
-    if not await is_admin(message, state=state):
+    if not await is_admin(message, state=state, user_profile=user_profile):
         await message.answer("У вас нет прав администратора")
         return
 
@@ -36,26 +62,20 @@ async def admin_panel(message: Message, state: FSMContext):
                          reply_markup=build_admin_keyboard())
 
 
-async def is_admin(message: Message, state: FSMContext) -> bool:
-    if not message.from_user:
-        return False
-
-    user_id = message.from_user.id
-    if not user_id:
-        return False
-
-    async with get_async_session() as session:
-        result = await session.execute(
-            select(User.role).where(User.id == user_id))
-        current_user_role = result.scalar()
+async def is_admin(message: Message, state: FSMContext,
+                   user_profile: Optional[UserProfile] = None) -> bool:
+    if user_profile is None:
+        if not message.from_user or not message.from_user.id:
+            return False
+        user_profile = await user_profile_cache.get(message.from_user.id)
 
-        if current_user_role == UserRole.ADMIN:
-            return True
+    if user_profile and user_profile.is_admin:
+        return True
 
-        await message.answer(
-            "Вы не являетесь админом. \nПожалуйста введите пароль!")
-        await state.set_state(AdminStates.check_password)
-        return False
+    await message.answer(
+        "Вы не являетесь админом. \nПожалуйста введите пароль!")
+    await state.set_state(AdminStates.check_password)
+    return False
 
 
 @admin_router.message(AdminStates.check_password)
@@ -81,10 +101,8 @@ async def admin_check_password(message: Message, state: FSMContext):
 
 
 @admin_router.message(F.text == "Список AI провайдеров")
-async def list_ai_creators(message: Message):
-    async with get_async_session() as session:
-        result = await session.execute(select(AiCreators))
-        creators = list(result.scalars().all())
+async def list_ai_creators(message: Message, services: ServiceContainer):
+    creators = await services.read.ai_service.get_ai_creators()
 
     if not creators:
         await message.answer("Нет доступных AI провайдеров")
@@ -95,15 +113,17 @@ async def list_ai_creators(message: Message):
 
 
 @admin_router.message(F.text == "Назад")
-async def handle_back(message: Message, state: FSMContext):
+async def handle_back(message: Message, state: FSMContext,
+                      user_profile: Optional[UserProfile] = None):
     current_state = await state.get_state()
     if current_state:
         await state.clear()
-    await admin_panel(message, state)
+    await admin_panel(message, state, user_profile=user_profile)
 
 
 @admin_router.callback_query(F.data.startswith("select_creator:"))
-async def select_creator(callback: CallbackQuery, state: FSMContext):
+async def select_creator(callback: CallbackQuery, state: FSMContext,
+                         services: ServiceContainer):
     if not callback.data:
         logger.error("Callback data is None")
         await callback.answer("Произошла ошибка: нет данных", show_alert=True)
@@ -133,23 +153,18 @@ async def select_creator(callback: CallbackQuery, state: FSMContext):
             "Произошла ошибка: невозможно обновить сообщение", show_alert=True)
         return
 
-    async with get_async_session() as session:
-        creator_result = await session.execute(
-            select(AiCreators).where(AiCreators.id == creator_id))
-        creator = creator_result.scalars().first()
+    creator = await services.read.ai_service.get_ai_creator(creator_id)
 
-        if not creator:
-            await message.edit_text("Провайдер не найден.")
-            await callback.answer()
-            return
+    if not creator:
+        await message.edit_text("Провайдер не найден.")
+        await callback.answer()
+        return
 
-        await state.update_data(ai_creator_id=creator.id,
-                                ai_creator_name=creator.name,
-                                ai_creator_url=creator.url)
+    await state.update_data(ai_creator_id=creator.id,
+                            ai_creator_name=creator.name,
+                            ai_creator_url=creator.url)
 
-        models_result = await session.execute(
-            select(Models).where(Models.ai_creator_id == creator_id))
-        models = models_result.scalars().all()
+    models = await services.read.ai_service.get_models_by_creator(creator_id)
 
     try:
         if not models:
@@ -179,7 +194,8 @@ async def select_creator(callback: CallbackQuery, state: FSMContext):
 
 
 @admin_router.callback_query(F.data.startswith("select_model:"))
-async def select_model(callback: CallbackQuery, state: FSMContext):
+async def select_model(callback: CallbackQuery, state: FSMContext,
+                       services: ServiceContainer):
     if not callback.data:
         logger.error("Callback data is None in select_model")
         await callback.answer("Произошла ошибка: нет данных для выбора модели",
@@ -212,59 +228,31 @@ async def select_model(callback: CallbackQuery, state: FSMContext):
             "Произошла ошибка: невозможно обновить сообщение", show_alert=True)
         return
 
-    async with get_async_session() as session:
-        model_result = await session.execute(
-            select(Models).where(Models.id == model_id))
-        model: Models = model_result.scalars().first()
+    model = await services.ai_service.get_model(model_id)
 
-        if not model:
-            await callback.message.edit_text("Модель не найдена")
-            await callback.answer()
-            return
-
-        settings_result = await session.execute(select(AiSettings))
-        settings = settings_result.scalars().first()
-        if not settings:
-            settings = AiSettings()
-            session.add(settings)
-
-        await session.execute(update(Models).values(selected=False))
-
-        setattr(model, 'selected', True)
-        await session.commit()
-
-        creator_result = await session.execute(
-            select(AiCreators).where(AiCreators.id == model.ai_creator_id))
-        creator = creator_result.scalars().first()
-
-        if not creator:
-            logger.error(
-                f"Creator not found for model_id: {model_id} and ai_creator_id: {model.ai_creator_id}"
-            )
-            await callback.message.edit_text(
-                "Ошибка: связанный провайдер не найден. Настройки не применены."
-            )
-            await callback.answer()
-            return
+    if not model:
+        await callback.message.edit_text("Модель не найдена")
+        await callback.answer()
+        return
 
-        try:
-            model_temperature = float(
-                settings.temperature
-            ) if settings.temperature is not None else 0.0
-        except (TypeError, ValueError):
-            logger.error("Invalid temperature value in settings")
-            model_temperature = 0.0
-
-        await redis_service.save_openai_token(str(creator.token))
-        await redis_service.save_selected_url(str(creator.url))
-        await redis_service.save_selected_ai_model(str(model.name))
-        await redis_service.save_model_temperature(model_temperature)
+    creator = await services.ai_service.get_ai_creator(model.ai_creator_id)
 
+    if not creator:
+        logger.error(
+            f"Creator not found for model_id: {model_id} and ai_creator_id: {model.ai_creator_id}"
+        )
         await callback.message.edit_text(
-            f"Выбрана модель: {model.name}\n"
-            f"Провайдер: {creator.name}\n"
-            f"Температура: {model_temperature}\n\n"
-            "Настройки успешно сохранены!")
+            "Ошибка: связанный провайдер не найден. Настройки не применены.")
+        await callback.answer()
+        return
+
+    model_temperature = await services.ai_service.select_model(model, creator)
+
+    await callback.message.edit_text(
+        f"Выбрана модель: {model.name}\n"
+        f"Провайдер: {creator.name}\n"
+        f"Температура: {model_temperature}\n\n"
+        "Настройки успешно сохранены!")
     await callback.answer()
 
 
@@ -300,7 +288,8 @@ async def process_creator_token(message: Message, state: FSMContext):
 
 
 @admin_router.message(AdminStates.creator_url)
-async def process_creator_url(message: Message, state: FSMContext):
+async def process_creator_url(message: Message, state: FSMContext,
+                              services: ServiceContainer):
     data = await state.get_data()
 
     if not message.text:
@@ -308,27 +297,21 @@ async def process_creator_url(message: Message, state: FSMContext):
         await message.answer("Произошла ошибка: URL не указан")
         return
 
-    async with get_async_session() as session:
-        new_creator = AiCreators(name=data['creator_name'],
-                                 token=data['creator_token'],
-                                 url=message.text)
-        session.add(new_creator)
-        await session.commit()
-
-        await redis_service.save_openai_token(data['creator_token'])
-        await redis_service.save_selected_url(message.text)
+    new_creator = await services.ai_service.create_ai_creator(
+        name=data['creator_name'], token=data['creator_token'], url=message.text)
 
-        await state.update_data(ai_creator_id=new_creator.id)
-        await state.set_state(AdminStates.models_url)
-        await message.answer(
-            f"Провайдер {data['creator_name']} успешно добавлен!\n"
-            "Теперь введите URL для загрузки моделей от этого провайдера:\n"
-            "Пример: https://generativelanguage.googleapis.com/v1beta/openai/models"
-        )
+    await state.update_data(ai_creator_id=new_creator.id)
+    await state.set_state(AdminStates.models_url)
+    await message.answer(
+        f"Провайдер {data['creator_name']} успешно добавлен!\n"
+        "Теперь введите URL для загрузки моделей от этого провайдера:\n"
+        "Пример: https://generativelanguage.googleapis.com/v1beta/openai/models"
+    )
 
 
 @admin_router.message(AdminStates.models_url)
-async def process_models_url(message: Message, state: FSMContext):
+async def process_models_url(message: Message, state: FSMContext,
+                             services: ServiceContainer):
     data = await state.get_data()
     creator_id = data['ai_creator_id']
 
@@ -355,10 +338,7 @@ async def process_models_url(message: Message, state: FSMContext):
             await message.answer("Не удалось загрузить модели.")
             return
 
-        async with get_async_session() as session:
-            result = await session.execute(
-                select(Models).where(Models.ai_creator_id == creator_id))
-            models = result.scalars().all()
+        models = await services.ai_service.get_models_by_creator(creator_id)
 
         if not models:
             await message.answer("Не удалось загрузить модели.")
@@ -374,25 +354,20 @@ async def process_models_url(message: Message, state: FSMContext):
 
 
 @admin_router.message(F.text == "Изменить температуру")
-async def change_temperature_start(message: Message, state: FSMContext):
-    async with get_async_session() as session:
-        settings_result = await session.execute(select(AiSettings))
-        settings = settings_result.scalars().first()
-
-        if not settings:
-            settings = AiSettings(temperature=Config.DEFAULT_TEMPERATURE)
-            session.add(settings)
-            await session.commit()
+async def change_temperature_start(message: Message, state: FSMContext,
+                                   services: ServiceContainer):
+    settings = await services.ai_service.get_or_create_settings()
 
-        await state.update_data(current_temperature=settings.temperature)
-        await state.set_state(AdminStates.update_temperature)
+    await state.update_data(current_temperature=settings.temperature)
+    await state.set_state(AdminStates.update_temperature)
 
-        await message.answer(f"Текущая температура: {settings.temperature}\n\n"
-                             "Введите новое значение температуры (0.0-2.0):")
+    await message.answer(f"Текущая температура: {settings.temperature}\n\n"
+                         "Введите новое значение температуры (0.0-2.0):")
 
 
 @admin_router.message(AdminStates.update_temperature)
-async def process_temperature_update(message: Message, state: FSMContext):
+async def process_temperature_update(message: Message, state: FSMContext,
+                                     services: ServiceContainer):
     if not message.text:
         logger.error("Message text is empty")
         await message.answer("Произошла ошибка: URL не указан")
@@ -407,45 +382,30 @@ async def process_temperature_update(message: Message, state: FSMContext):
             "Введите корректное значение temperature (0.0-2.0)")
         return
 
-    async with get_async_session() as session:
-        settings_result = await session.execute(select(AiSettings))
-        settings = settings_result.scalars().first()
-
-        if settings:
-            settings.temperature = new_temperature
-            await session.commit()
-
-            await redis_service.save_model_temperature(new_temperature)
-
-            await message.answer(f"Температура изменена на {new_temperature}")
-        else:
-            await message.answer("Настройки не найдены")
+    if await services.ai_service.update_temperature(new_temperature):
+        await message.answer(f"Температура изменена на {new_temperature}")
+    else:
+        await message.answer("Настройки не найдены")
 
     await state.clear()
 
 
 @admin_router.message(F.text == "Изменить промпт")
-async def change_prompt_start(message: Message, state: FSMContext):
-    async with get_async_session() as session:
-        settings_result = await session.execute(select(AiSettings))
-        settings = settings_result.scalars().first()
-
-        if not settings:
-            settings = AiSettings(prompt=Config.DEFAULT_PROMPT)
-            session.add(settings)
-            await session.commit()
+async def change_prompt_start(message: Message, state: FSMContext,
+                              services: ServiceContainer):
+    settings = await services.ai_service.get_or_create_settings()
+    current_prompt = settings.prompt or "Промпт не установлен"
 
-        current_prompt = settings.prompt or "Промпт не установлен"
-
-        await state.set_state(AdminStates.update_prompt)
-        await message.answer(
-            f"Текущий системный промпт:\n\n{current_prompt}\n\n"
-            "Введите новый системный промпт:",
-            parse_mode=None)
+    await state.set_state(AdminStates.update_prompt)
+    await message.answer(
+        f"Текущий системный промпт:\n\n{current_prompt}\n\n"
+        "Введите новый системный промпт:",
+        parse_mode=None)
 
 
 @admin_router.message(AdminStates.update_prompt)
-async def process_prompt(message: Message, state: FSMContext):
+async def process_prompt(message: Message, state: FSMContext,
+                         services: ServiceContainer):
     if not message.text:
         logger.error("Message text is empty")
         await message.answer("Произошла ошибка: URL не указан")
@@ -457,71 +417,71 @@ async def process_prompt(message: Message, state: FSMContext):
         await message.answer("Промпт слишком длинный. Максимум 4000 символов.")
         return
 
-    async with get_async_session() as session:
-        settings_result = await session.execute(select(AiSettings))
-        settings = settings_result.scalars().first()
-
-        if settings:
-            setattr(settings, 'prompt', new_prompt)
-            await session.commit()
-
-            await redis_service.save_prompt(new_prompt)
-
-            await message.answer(
-                "Системный промпт успешно обновлен!\n\n"
-                f"Первые 500 символов нового промпта:\n{new_prompt[:500]}...",
-                parse_mode=None)
-        else:
-            await message.answer("Ошибка: настройки не найдены")
+    if await services.ai_service.update_prompt(new_prompt):
+        await message.answer(
+            "Системный промпт успешно обновлен!\n\n"
+            f"Первые 500 символов нового промпта:\n{new_prompt[:500]}...",
+            parse_mode=None)
+    else:
+        await message.answer("Ошибка: настройки не найдены")
 
     await state.clear()
 
 
 @admin_router.message(F.text == "Список пользователей")
-async def list_users(message: Message, state: FSMContext):
+async def list_users(message: Message, state: FSMContext,
+                     services: ServiceContainer):
     await state.set_state(AdminStates.users_list)
-    await show_users_page(message, state, page=0)
+    await show_users_page(message, state, services.read.user_service)
 
 
-async def show_users_page(message: Message, state: FSMContext, page: int):
+async def show_users_page(message: Message,
+                          state: FSMContext,
+                          user_service: UserService,
+                          role_filter: str = "all",
+                          after_id: Optional[int] = None,
+                          before_id: Optional[int] = None):
     page_size = 10
-    async with get_async_session() as session:
-        result = await session.execute(
-            select(User).order_by(User.id).offset(page *
-                                                  page_size).limit(page_size))
-        users = result.scalars().all()
+    role = None if role_filter == "all" else role_filter
+    page = await user_service.get_users_page(page_size=page_size,
+                                             after_id=after_id,
+                                             before_id=before_id,
+                                             role=role)
+    users = page['users']
 
     if not users:
-        await message.answer("Нет пользователей для отображения")
+        await message.answer("Нет пользователей для отображения",
+                             reply_markup=build_users_keyboard([],
+                                                               role_filter))
         return
 
-    await message.answer(f"Список пользователей (страница {page + 1}):",
-                         reply_markup=build_users_keyboard(
-                             list(users), page, page_size))
-
-
-def build_users_keyboard(users: list, page: int, page_size: int = 10):
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[])
+    # Запоминаем курсор страницы, чтобы после бана/назначения показать ее
+    # же: у первой страницы курсора нет, и кнопки "Назад" на ней не будет
+    await state.update_data(users_role_filter=role_filter,
+                            users_page_after=after_id,
+                            users_page_before=before_id)
+    await message.answer(
+        f"Список пользователей: {users[0].id}–{users[-1].id} "
+        f"(всего: {page['total_count']}):",
+        reply_markup=build_users_keyboard(users, role_filter,
+                                          page['has_prev'], page['has_next']))
 
-    for user in users:
-        keyboard.inline_keyboard.append([
-            InlineKeyboardButton(
-                text=
-                f"{user.id} - {user.username or 'No username'} - {user.role}",
-                callback_data=f"user_info:{user.id}")
-        ])
-        keyboard.inline_keyboard.append([
-            InlineKeyboardButton(text="Сделать Админом",
-                                 callback_data=f"make_admin:{user.id}"),
-            InlineKeyboardButton(text="Забанить пользователя",
-                                 callback_data=f"ban_user:{user.id}")
-        ])
 
-    return keyboard
+async def show_current_users_page(message: Message, state: FSMContext,
+                                  services: ServiceContainer):
+    # Сразу после бана/назначения читаем из primary: реплика может отставать
+    data = await state.get_data()
+    await show_users_page(message,
+                          state,
+                          services.user_service,
+                          role_filter=data.get('users_role_filter', "all"),
+                          after_id=data.get('users_page_after'),
+                          before_id=data.get('users_page_before'))
 
 
 @admin_router.callback_query(F.data.startswith("ban_user:"))
-async def handle_ban_user(callback: CallbackQuery, state: FSMContext):
+async def handle_ban_user(callback: CallbackQuery, state: FSMContext,
+                          services: ServiceContainer):
     try:
         if not callback.data:
             await callback.answer("Не удалось получить сообщение")
@@ -529,24 +489,21 @@ async def handle_ban_user(callback: CallbackQuery, state: FSMContext):
 
         user_id = int(callback.data.split(":")[1])
 
-        async with get_async_session() as session:
-            await session.execute(
-                update(User).where(User.id == user_id).values(
-                    role=UserRole.BANNED))
-            await session.commit()
-
-            await callback.answer("Пользователь забанен", show_alert=True)
-
-            current_state = await state.get_state()
-            if current_state == AdminStates.users_list:
-                if callback.message and not isinstance(callback.message,
-                                                       InaccessibleMessage):
-                    await callback.message.delete()
-                    await show_users_page(callback.message, state, page=0)
-                else:
-                    await callback.answer(
-                        "Не возможно отобразить список пользователей",
-                        show_alert=True)
+        await services.user_service.ban_user(user_id)
+
+        await callback.answer("Пользователь забанен", show_alert=True)
+
+        current_state = await state.get_state()
+        if current_state == AdminStates.users_list:
+            if callback.message and not isinstance(callback.message,
+                                                   InaccessibleMessage):
+                await callback.message.delete()
+                await show_current_users_page(callback.message, state,
+                                              services)
+            else:
+                await callback.answer(
+                    "Не возможно отобразить список пользователей",
+                    show_alert=True)
 
     except Exception as e:
         logger.error(f"Error banning user: {e}")
@@ -554,13 +511,18 @@ async def handle_ban_user(callback: CallbackQuery, state: FSMContext):
 
 
 @admin_router.callback_query(F.data.startswith("users_page:"))
-async def handle_users_page(callback: CallbackQuery, state: FSMContext):
+async def handle_users_page(callback: CallbackQuery, state: FSMContext,
+                            services: ServiceContainer):
     try:
         if not callback.data:
             await callback.answer("Нет данных")
             return
 
-        page = int(callback.data.split(":")[1])
+        _, role_filter, direction, cursor = callback.data.split(":")
+        cursor_id = int(cursor)
+        if role_filter not in ("all", *(role.value for role in UserRole)):
+            await callback.answer("Неизвестный фильтр")
+            return
 
         if not callback.message:
             await callback.answer("Нет сообщения")
@@ -569,7 +531,18 @@ async def handle_users_page(callback: CallbackQuery, state: FSMContext):
         if not isinstance(callback.message, InaccessibleMessage):
             await callback.message.delete()
         if isinstance(callback.message, Message):
-            await show_users_page(callback.message, state, page)
+            if direction == "p":
+                await show_users_page(callback.message,
+                                      state,
+                                      services.read.user_service,
+                                      role_filter,
+                                      before_id=cursor_id)
+            else:
+                await show_users_page(callback.message,
+                                      state,
+                                      services.read.user_service,
+                                      role_filter,
+                                      after_id=cursor_id or None)
         else:
             await callback.answer("Не могу отобразить пользователей")
     except Exception as e:
@@ -578,31 +551,28 @@ async def handle_users_page(callback: CallbackQuery, state: FSMContext):
 
 
 @admin_router.callback_query(F.data.startswith("make_admin:"))
-async def handle_select_user(callback: CallbackQuery, state: FSMContext):
+async def handle_select_user(callback: CallbackQuery, state: FSMContext,
+                             services: ServiceContainer):
     try:
         if not callback.data:
             await callback.answer("Нет никаких данных")
             return
         user_id = int(callback.data.split(":")[1])
 
-        async with get_async_session() as session:
-
-            await session.execute(
-                update(User).where(User.id == user_id).values(
-                    role=UserRole.ADMIN))
-            await session.commit()
+        await services.user_service.promote_to_admin(user_id)
 
-            await callback.answer("Пользователь теперь администратор",
-                                  show_alert=True)
+        await callback.answer("Пользователь теперь администратор",
+                              show_alert=True)
 
-            current_state = await state.get_state()
-            if current_state == AdminStates.users_list:
-                if callback.message and not isinstance(callback.message,
-                                                       InaccessibleMessage):
-                    await callback.message.delete()
-                    await show_users_page(callback.message, state, page=0)
-                else:
-                    await callback.answer("Не могу отобразить пользователей")
+        current_state = await state.get_state()
+        if current_state == AdminStates.users_list:
+            if callback.message and not isinstance(callback.message,
+                                                   InaccessibleMessage):
+                await callback.message.delete()
+                await show_current_users_page(callback.message, state,
+                                              services)
+            else:
+                await callback.answer("Не могу отобразить пользователей")
 
     except Exception as e:
         logger.error(f"Error promoting user: {e}")
@@ -611,11 +581,12 @@ async def handle_select_user(callback: CallbackQuery, state: FSMContext):
 
 
 @admin_router.callback_query(F.data == "back_to_admin")
-async def handle_back_to_admin(callback: CallbackQuery, state: FSMContext):
+async def handle_back_to_admin(callback: CallbackQuery, state: FSMContext,
+                               user_profile: Optional[UserProfile] = None):
     if callback.message and not isinstance(callback.message,
                                            InaccessibleMessage):
         await callback.message.delete()
-        await admin_panel(callback.message, state)
+        await admin_panel(callback.message, state, user_profile=user_profile)
     else:
         logger.error("Cannot access message in handle_back_to_admin")
         await callback.answer("Не возможно вернуться в панель",
@@ -623,7 +594,8 @@ async def handle_back_to_admin(callback: CallbackQuery, state: FSMContext):
 
 
 @admin_router.callback_query(F.data.startswith("user_info:"))
-async def handle_user_info(callback: CallbackQuery, state: FSMContext):
+async def handle_user_info(callback: CallbackQuery, state: FSMContext,
+                           services: ServiceContainer):
     try:
         if not callback.data:
             await callback.answer("Нет данных")
@@ -631,60 +603,283 @@ async def handle_user_info(callback: CallbackQuery, state: FSMContext):
 
         user_id = int(callback.data.split(":")[1])
 
-        async with get_async_session() as session:
-            user_result = await session.execute(
-                select(User).where(User.id == user_id))
-            user = user_result.scalars().first()
+        user = await user_profile_cache.get(user_id, session=services.session)
+        if not user:
+            await callback.answer("Пользователь не найден", show_alert=True)
+            return
 
-            if not user:
-                await callback.answer("Пользователь не найден",
-                                      show_alert=True)
-                return
+        stats = await services.read.user_stats.get_by_user_id(user_id)
 
-            test_results_query = await session.execute(
-                select(TestResults).where(
-                    TestResults.user_id == user_id).order_by(
-                        TestResults.test_date.desc()))
-            test_results = test_results_query.scalars().all()
+        if not stats or not stats.tests_taken:
+            await callback.answer(
+                f"Пользователь  {user.username or user.id} не имеет результатов тестирования",
+                show_alert=True)
+            return
 
-            if not test_results:
-                await callback.answer(
-                    f"Пользователь  {user.username or user.id} не имеет результатов тестирования",
-                    show_alert=True)
-                return
+        # Последние тесты ищем в горячих секциях, не трогая остальные
+        hot_start = datetime.combine(
+            add_months(month_start(datetime.utcnow().date()),
+                       -Config.RESULTS_HOT_MONTHS), time.min)
+        test_results = await _load_user_results(
+            services.read.session, user_id, 5,
+            TestResults.test_date >= hot_start)
+        if (len(test_results) < 5
+                and stats.tests_taken > len(test_results)):
+            # Старые месяцы, еще не ушедшие в архив
+            test_results += await _load_user_results(
+                services.read.session, user_id, 5 - len(test_results),
+                TestResults.test_date < hot_start)
+        # Отчеты рендерятся по запросу, только для результатов из БД
+        report_ids = [result['id'] for result in test_results]
+
+        if (len(test_results) < 5
+                and stats.tests_taken > len(test_results)):
+            # Старые тесты могли уйти в архив: добираем историю оттуда
+            archived = await results_archive.load_user_results(
+                services.read.session, user_id, 5 - len(test_results))
+            if archived:
+                role_names = await services.read.dictionaries.get_role_names()
+                competence_names = (
+                    await services.read.dictionaries.get_competence_names())
+                for row in archived:
+                    if 'competence_id' in row:
+                        row['dama_role'] = role_names.get(row['role_id'])
+                        row['dama_competence'] = competence_names.get(
+                            row['competence_id'], (None, None))[1]
+                test_results += archived
+
+        message_text = (
+            f"👤 Пользователь: {user.display_name}\n"
+            f"📊 Средняя оценка: {stats.avg_score:.2f}\n"
+            f"🏆 Лучшая оценка: {stats.best_score:.2f}\n"
+            f"📝 Всего тестов: {stats.tests_taken}\n"
+            f"🎓 Эксперт: {'да' if stats.is_expert else 'нет'}\n\n"
+            "Последние результаты тестов:\n")
+
+        for i, result in enumerate(test_results):
+            if result.get('report_path'):
+                # Отчеты, сохраненные до рендера по запросу
+                s3_link = await minio_service.get_report_url(
+                    result['report_path'])
+                report_link_text = s3_link if s3_link else "Ссылка недоступна"
+            elif i < len(report_ids):
+                report_link_text = "кнопками ниже"
+            else:
+                report_link_text = "в архиве"
+
+            message_text += (
+                f"{i+1}) Тест\n"
+                f"Роль: {result['dama_role']}\n"
+                f"Компетенция: {result['dama_competence']}\n"
+                f"Оценка: {result['total_score']}\n"
+                f"Дата проведения: {result['test_date'].strftime('%Y-%m-%d %H:%M')}\n"  # Formatted date
+                f"Отчет: {report_link_text}\n\n")
 
-            avg_score = sum(r.total_score
-                            for r in test_results) / len(test_results)
+        if not callback.message:
+            logger.error("Callback not defined")
+            return
 
-            message_text = (
-                f"👤 Пользователь: {user.username or user.first_name + ' ' + user.last_name}\n"
-                f"📊 Средняя оценка: {avg_score:.2f}\n"
-                f"📝 Всего тестов: {len(test_results)}\n\n"
-                "Последние результаты тестов:\n")
+        await callback.message.answer(
+            message_text,
+            parse_mode=None,
+            reply_markup=build_report_keyboard(report_ids)
+            if report_ids else None)
 
-            for i, result in enumerate(test_results[:5]):
-                s3_link = await minio_service.get_report_url(result.report_path
-                                                             )
+    except Exception as e:
+        logger.error(f"Error showing user details: {e}")
+        await callback.answer(
+            "Ошибка при отображении результатов пользователя", show_alert=True)
+    finally:
+        await callback.answer()
 
-                report_link_text = s3_link if s3_link else "Ссылка недоступна"
 
-                message_text += (
-                    f"{i+1}) Тест\n"
-                    f"Роль: {result.dama_role}\n"
-                    f"Компетенция: {result.dama_competence}\n"
-                    f"Оценка: {result.total_score}\n"
-                    f"Дата проведения: {result.test_date.strftime('%Y-%m-%d %H:%M')}\n"  # Formatted date
-                    f"Отчет: {report_link_text}\n\n")
+@admin_router.message(F.text == "Аналитика")
+async def analytics_menu(message: Message, state: FSMContext):
+    await message.answer(
+        f"Аналитика за последние {Config.ANALYTICS_WINDOW_DAYS} дней:",
+        reply_markup=build_analytics_keyboard())
+
+
+@admin_router.callback_query(F.data.startswith("analytics:"))
+async def handle_analytics(callback: CallbackQuery, state: FSMContext,
+                           services: ServiceContainer):
+    try:
+        if not callback.data:
+            await callback.answer("Нет данных")
+            return
+
+        dimension = callback.data.split(":")[1]
+        titles = dict(ANALYTICS_DIMENSIONS)
+        if dimension not in titles:
+            await callback.answer("Неизвестный раздел")
+            return
+
+        since = (datetime.utcnow() -
+                 timedelta(days=Config.ANALYTICS_WINDOW_DAYS)).date()
+        stats = await services.read.rollups.summary(dimension, since)
 
-            if not callback.message:
-                logger.error("Callback not defined")
-                return
+        if not stats:
+            await callback.answer("Нет данных за период", show_alert=True)
+            return
 
-            await callback.message.answer(message_text, parse_mode=None)
+        unit = "ответов" if dimension == 'area' else "тестов"
+        message_text = f"📈 {titles[dimension]}\n\n"
+        for item in stats[:15]:
+            histogram = " ".join(f"{i}-{i + 1}: {count}"
+                                 for i, count in enumerate(item.buckets))
+            message_text += (f"<b>{html.escape(item.label)}</b>\n"
+                             f"{unit.capitalize()}: {item.count}, "
+                             f"средняя: {item.mean:.2f} ± {item.std:.2f}")
+            if item.experts is not None:
+                message_text += f", экспертов: {item.experts}"
+            message_text += f"\n{histogram}\n\n"
+        if len(stats) > 15:
+            message_text += f"...и еще {len(stats) - 15}"
 
+        if isinstance(callback.message, Message):
+            await callback.message.answer(message_text)
     except Exception as e:
-        logger.error(f"Error showing user details: {e}")
-        await callback.answer(
-            "Ошибка при отображении результатов пользователя", show_alert=True)
+        logger.error(f"Error showing analytics: {e}")
+        await callback.answer("Ошибка при загрузке аналитики",
+                              show_alert=True)
     finally:
         await callback.answer()
+
+
+def parse_export_request(text: str):
+    """Первая строка - период и формат, следующие - роль и компетенция"""
+    lines = [line.strip() for line in text.strip().splitlines()]
+    parts = lines[0].split()
+    if len(parts) not in (2, 3):
+        raise ValueError("Укажите период: две даты в формате ГГГГ-ММ-ДД")
+    try:
+        date_from, date_to = (datetime.strptime(part, "%Y-%m-%d").date()
+                              for part in parts[:2])
+    except ValueError:
+        raise ValueError("Даты должны быть в формате ГГГГ-ММ-ДД")
+    if date_from > date_to:
+        raise ValueError("Дата начала позже даты окончания")
+    file_format = parts[2].lower() if len(parts) == 3 else 'csv.gz'
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(
+            f"Формат должен быть одним из: {', '.join(EXPORT_FORMATS)}")
+    return ExportFilter(date_from=date_from,
+                        date_to=date_to,
+                        role=lines[1] if len(lines) > 1 and lines[1] else None,
+                        competence=lines[2]
+                        if len(lines) > 2 and lines[2] else None), file_format
+
+
+@admin_router.message(F.text == "Выгрузка результатов")
+async def export_results_start(message: Message, state: FSMContext,
+                               user_profile: Optional[UserProfile] = None):
+    if not await is_admin(message, state=state, user_profile=user_profile):
+        return
+
+    await state.set_state(AdminStates.export_filter)
+    await message.answer(
+        "Введите период выгрузки и, при необходимости, фильтры:\n\n"
+        "2025-01-01 2025-03-31 [формат]\n"
+        "Роль (необязательно)\n"
+        "Компетенция (необязательно)\n\n"
+        f"Форматы: {', '.join(EXPORT_FORMATS)}, по умолчанию csv.gz",
+        parse_mode=None)
+
+
+@admin_router.message(AdminStates.export_filter)
+async def process_export_results(message: Message, state: FSMContext):
+    if not message.text or not message.from_user:
+        await message.answer("Произошла ошибка: параметры не указаны")
+        return
+
+    try:
+        export_filter, file_format = parse_export_request(message.text)
+    except ValueError as e:
+        await message.answer(f"Неверные параметры выгрузки: {e}")
+        return
+
+    await state.clear()
+    await message.answer("Готовлю выгрузку, пришлю ссылку, когда она "
+                         "будет готова")
+    results_export.start(message.bot, message.chat.id, export_filter,
+                         file_format)
+
+
+@admin_router.message(F.text == "Рассылка")
+async def broadcast_start(message: Message, state: FSMContext,
+                          user_profile: Optional[UserProfile] = None):
+    if not await is_admin(message, state=state, user_profile=user_profile):
+        return
+
+    await state.set_state(AdminStates.broadcast_text)
+    await message.answer(
+        "Отправьте текст рассылки. Его получат все пользователи, "
+        "кроме забаненных.")
+
+
+@admin_router.message(AdminStates.broadcast_text)
+async def process_broadcast_text(message: Message, state: FSMContext,
+                                 services: ServiceContainer):
+    if not message.text:
+        await message.answer("Рассылка поддерживает только текст")
+        return
+
+    # html_text сохраняет форматирование сообщения админа
+    await state.update_data(broadcast_text=message.html_text)
+    recipients = await services.broadcasts.count_recipients()
+    await message.answer(message.html_text)
+    await message.answer(
+        f"Отправить это сообщение {recipients} пользователям?",
+        reply_markup=build_broadcast_confirm_keyboard())
+
+
+@admin_router.callback_query(F.data.in_({"broadcast:confirm",
+                                         "broadcast:cancel"}))
+async def handle_broadcast_confirm(callback: CallbackQuery, state: FSMContext,
+                                   services: ServiceContainer,
+                                   user_profile: Optional[UserProfile] = None):
+    if not user_profile or not user_profile.is_admin:
+        await callback.answer("У вас нет прав администратора",
+                              show_alert=True)
+        return
+    if not callback.message or isinstance(callback.message,
+                                          InaccessibleMessage):
+        await callback.answer("Не удалось получить сообщение")
+        return
+
+    text = (await state.get_data()).get('broadcast_text')
+    await state.clear()
+    if callback.data == "broadcast:cancel" or not text:
+        await callback.message.edit_text("Рассылка отменена")
+        await callback.answer()
+        return
+
+    try:
+        await callback.message.edit_text("⏳ Рассылка запускается...")
+        broadcast = await services.broadcasts.create(
+            text=text,
+            created_by=callback.from_user.id,
+            status_message_id=callback.message.message_id)
+        await callback.message.edit_reply_markup(
+            reply_markup=build_broadcast_keyboard(broadcast.id))
+        await callback.answer("Рассылка запущена")
+    except Exception as e:
+        logger.error(f"Error starting broadcast: {e}")
+        await callback.answer("Ошибка при запуске рассылки", show_alert=True)
+
+
+@admin_router.callback_query(F.data.startswith("broadcast:stop:"))
+async def handle_broadcast_stop(callback: CallbackQuery,
+                                services: ServiceContainer,
+                                user_profile: Optional[UserProfile] = None):
+    if not user_profile or not user_profile.is_admin:
+        await callback.answer("У вас нет прав администратора",
+                              show_alert=True)
+        return
+
+    broadcast_id = int((callback.data or "").split(":")[2])
+    if await services.broadcasts.set_status(broadcast_id, 'cancelled'):
+        # Рассылка остановится после текущей пачки
+        await callback.answer("Рассылка останавливается")
+    else:
+        await callback.answer("Рассылка уже завершена")
@@ -1,10 +1,10 @@
+from typing import Optional
 from aiogram import types, Router
 from aiogram.filters import Command
-from db.enums import UserRole
-from db.database import get_async_session
-from db.models import User
+from db.database import rollback
 from services.logger import logger
-from sqlalchemy import select
+from services.service_container import ServiceContainer
+from services.user_cache import UserProfile
 from aiogram.fsm.context import FSMContext
 from services.keyboard import build_start_buttons
 from aiogram import F, Router
@@ -13,43 +13,38 @@ common_router = Router()
 
 
 @common_router.message(Command('start'))
-async def cmd_start(message: types.Message, state: FSMContext):
+async def cmd_start(message: types.Message, state: FSMContext,
+                    services: ServiceContainer,
+                    user_profile: Optional[UserProfile] = None):
     if not message.from_user:
         await message.answer("Не удалось определить отправителя.")
         return
 
-    async with get_async_session() as session:
-        try:
-            await state.clear()
-            
-            result = await session.execute(select(User).where(User.id == message.from_user.id))
-            existing_user = result.scalars().first()
+    try:
+        await state.clear()
 
-            # Проверяем бан для команды /start, чтобы показать сообщение
-            if existing_user and str(existing_user.role) == UserRole.BANNED:
-                await message.answer("Вы заблокированы и не можете использовать бота.")
-                return
+        # Проверяем бан для команды /start, чтобы показать сообщение
+        if user_profile and user_profile.is_banned:
+            await message.answer("Вы заблокированы и не можете использовать бота.")
+            return
 
-            if not existing_user:
-                new_user = User(
-                    id=message.from_user.id,
-                    first_name=message.from_user.first_name or '',
-                    last_name=message.from_user.last_name or '',
-                    username=message.from_user.username or '',
-                    role='user'
-                )
-                session.add(new_user)
-                await session.commit()
-                welcome_message = "Привет! Твой профиль создан в системе."
-            else:
-                welcome_message = "С возвращением! Твой профиль уже есть в системе."
-
-            await message.answer(
-                f"{welcome_message}\n\n"
-                "Для начала тестирования компетенций DAMA нажмите кнопку ниже: ⬇️",
-                reply_markup=build_start_buttons()
+        if not user_profile:
+            await services.user_service.get_or_create_user(
+                telegram_id=message.from_user.id,
+                first_name=message.from_user.first_name or '',
+                last_name=message.from_user.last_name or '',
+                username=message.from_user.username or ''
             )
-        except Exception as e:
-            await session.rollback()
-            logger.error(f"Error while saving data: {e}")
-            await message.answer("Произошла ошибка при сохранении данных.")
+            welcome_message = "Привет! Твой профиль создан в системе."
+        else:
+            welcome_message = "С возвращением! Твой профиль уже есть в системе."
+
+        await message.answer(
+            f"{welcome_message}\n\n"
+            "Для начала тестирования компетенций DAMA нажмите кнопку ниже: ⬇️",
+            reply_markup=build_start_buttons()
+        )
+    except Exception as e:
+        await rollback(services.session)
+        logger.error(f"Error while saving data: {e}")
+        await message.answer("Произошла ошибка при сохранении данных.")
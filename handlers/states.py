@@ -20,4 +20,6 @@ class AdminStates(StatesGroup):
     model_name = State()
     update_temperature = State()
     update_prompt = State()
-    users_list = State()
\ No newline at end of file
+    users_list = State()
+    export_filter = State()
+    broadcast_text = State()
\ No newline at end of file
@@ -1,21 +1,26 @@
 import asyncio
+import uuid
 from aiogram import types, Router, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from datetime import datetime
+from config import Config
 from services.gpt import analyze_with_chatgpt
 from services.logger import logger
-from services.minio_service import MinioService
-from services.test_service import prepare_test_data, generate_test_report, get_competencies_for_role, \
-    get_available_roles
+from services.question_catalog import question_catalog
+from services.adaptive_testing import normalize_score
+from services.test_service import prepare_test_data, collect_exam, next_adaptive_question
 from services.keyboard import build_start_test_keyboard, build_start_buttons
 from handlers.states import TestStates, MainMenuStates
 from services.redis_service import RedisService
-from db.models import DAMAQuestion, DAMACase, TestResults
+from services.report_queue import report_queue
+from db.database import end_transaction
+from db.models import DAMAQuestion, DAMACase
 from services.state_service import state_storage
-from typing import Dict, Any, Callable, Coroutine
+from typing import Dict, Any, Callable, Coroutine, Optional
 
-from db.database import get_async_session
-from sqlalchemy import update
+from services.service_container import ServiceContainer
+from services.user_cache import UserProfile
 
 test_router = Router()
 
@@ -62,9 +67,10 @@ async def start_test(message: types.Message, state: FSMContext, **kwargs):
         await message.answer("Не удалось определить пользователя.")
         return
 
-    ai_model_name = await redis_service.load_selected_ai_model()
-    ai_token = await redis_service.load_openai_token()
-    ai_url = await redis_service.load_selected_url()
+    session = kwargs.get('session')
+    ai_model_name = await redis_service.load_selected_ai_model(session)
+    ai_token = await redis_service.load_openai_token(session)
+    ai_url = await redis_service.load_selected_url(session)
 
     if not ai_model_name or not ai_token or not ai_url:
         await message.answer("Не установлена модель для тестирования, "
@@ -98,9 +104,7 @@ async def process_name(message: types.Message, state: FSMContext, **kwargs):
     await redis_service.save_user_metadata(message.from_user.id,
                                            {'user_name': user_name})
 
-    valid_roles = await get_available_roles()
-    roles_list = "\n".join(f"{i+1}. {role}"
-                           for i, role in enumerate(valid_roles))
+    roles_list = question_catalog.get().roles_menu
 
     await message.answer(
         "Выберите вашу роль DAMA из списка ниже:\n\n"
@@ -116,7 +120,8 @@ async def process_role(message: types.Message, state: FSMContext):
             await message.answer("Не удалось получить роль")
             return
 
-        valid_roles = await get_available_roles()
+        catalog = question_catalog.get()
+        valid_roles = catalog.roles
 
         if message.text.strip().isdigit():
             role_index = int(message.text.strip()) - 1
@@ -129,11 +134,9 @@ async def process_role(message: types.Message, state: FSMContext):
         else:
             selected_role = message.text.strip()
             if selected_role not in valid_roles:
-                roles_list = "\n".join(f"{i+1}. {role}"
-                                       for i, role in enumerate(valid_roles))
                 await message.answer(
                     f"Пожалуйста, выберите роль из списка, введя соответствующее число:\n\n"
-                    f"{roles_list}")
+                    f"{catalog.roles_menu}")
                 return
 
         await state.update_data(selected_role=selected_role)
@@ -148,9 +151,7 @@ async def process_role(message: types.Message, state: FSMContext):
         await redis_service.save_user_metadata(
             message.from_user.id, {'selected_role': selected_role})
 
-        valid_comps = await get_competencies_for_role(selected_role)
-        comps_list = "\n".join(f"{i+1}. {comp}"
-                               for i, comp in enumerate(valid_comps))
+        comps_list = catalog.get_competencies_menu(selected_role)
 
         await message.answer(
             f"Вы выбрали роль: <b>{selected_role}</b>\n\n"
@@ -175,7 +176,9 @@ async def process_competency(message: types.Message, state: FSMContext):
             await message.answer("Не удалось выбрать роль")
             return
 
-        valid_comps = await get_competencies_for_role(data['selected_role'])
+        catalog = question_catalog.get()
+        valid_comps = catalog.get_competencies(data['selected_role'])
+        comps_list = catalog.get_competencies_menu(data['selected_role'])
 
         if not message.text:
             await message.answer("Не удалось выбрать компетенцию")
@@ -186,8 +189,6 @@ async def process_competency(message: types.Message, state: FSMContext):
             if 0 <= comp_index < len(valid_comps):
                 selected_comp = valid_comps[comp_index]
             else:
-                comps_list = "\n".join(f"{i+1}. {comp}"
-                                       for i, comp in enumerate(valid_comps))
                 await message.answer(
                     f"Пожалуйста, выберите компетенцию из списка, введя соответствующее число:\n\n"
                     f"{comps_list}")
@@ -195,15 +196,20 @@ async def process_competency(message: types.Message, state: FSMContext):
         else:
             selected_comp = message.text.strip()
             if selected_comp not in valid_comps:
-                comps_list = "\n".join(f"{i+1}. {comp}"
-                                       for i, comp in enumerate(valid_comps))
                 await message.answer(
                     f"Пожалуйста, выберите компетенцию из списка, введя соответствующее число:\n\n"
                     f"{comps_list}")
                 return
 
+        if not message.from_user:
+            await message.answer(
+                "Не удалось определить пользователя. Пожалуйста, попробуйте позже."
+            )
+            return
+
         test_data = await prepare_test_data(data['selected_role'],
-                                            selected_comp)
+                                            selected_comp,
+                                            user_id=message.from_user.id)
 
         if not test_data['questions']:
             await message.answer(
@@ -213,44 +219,41 @@ async def process_competency(message: types.Message, state: FSMContext):
             return
 
         serialized_test_data = {
-            'questions': [{
-                c.name: getattr(q, c.name)
-                for c in q.__table__.columns
-            } for q in test_data['questions']],
-            'case': {
-                c.name: getattr(test_data['case'], c.name)
-                for c in test_data['case'].__table__.columns
-            } if test_data.get('case') else None
+            'questions': [q.as_dict() for q in test_data['questions']],
+            'case': test_data['case'].as_dict()
+            if test_data.get('case') else None
         }
 
         await state.update_data({
             'selected_comp': selected_comp,
             'total_questions': len(test_data['questions']),
             'has_case': bool(test_data['case']),
+            'selection_seed': str(test_data['seed']),
+            'adaptive': test_data['adaptive'],
             'prepared_data': serialized_test_data
         })
 
-        if not message.from_user:
-            await message.answer(
-                "Не удалось определить пользователя. Пожалуйста, попробуйте позже."
-            )
-            return
-
         await redis_service.save_user_metadata(
             message.from_user.id, {
                 'selected_comp': selected_comp,
                 'selected_role': data['selected_role'],
-                'user_name': data['user_name']
+                'user_name': data['user_name'],
+                'exam_mode': 'adaptive' if test_data['adaptive'] else 'fixed'
             })
 
         await state.set_state(TestStates.ready_to_start)
 
+        questions_total = (
+            f"от {Config.ADAPTIVE_MIN_QUESTIONS} до {Config.ADAPTIVE_MAX_QUESTIONS} "
+            "(подбираются по вашим ответам)"
+            if test_data['adaptive'] else len(test_data['questions']))
+
         confirmation_msg = (
             f"<b>Подтвердите выбор:</b>\n\n"
             f"👤 Тестируемый: {data['user_name']}\n"
             f"🏢 Роль: {data['selected_role']}\n"
             f"📚 Компетенция: {selected_comp}\n\n"
-            f"Всего вопросов: {len(test_data['questions'])}\n"
+            f"Всего вопросов: {questions_total}\n"
             f"Сценарный кейс: {'есть' if test_data['case'] else 'нет'}\n\n"
             "Готовы начать тестирование?")
 
@@ -280,7 +283,8 @@ async def start_testing(message: types.Message, state: FSMContext):
             'awaiting_clarification': False,
             'clarification_count': 0,
             'selected_role': data['selected_role'],
-            'selected_comp': data['selected_comp']
+            'selected_comp': data['selected_comp'],
+            'ability_responses': []
         }
 
         await state.update_data(serialized_data)
@@ -297,7 +301,9 @@ async def start_testing(message: types.Message, state: FSMContext):
             message.from_user.id, {
                 'user_name': data['user_name'],
                 'selected_role': data['selected_role'],
-                'selected_comp': data['selected_comp']
+                'selected_comp': data['selected_comp'],
+                'exam_mode': 'adaptive' if data.get('adaptive') else 'fixed',
+                'exam_id': uuid.uuid4().hex
             })
         await ask_question(message, state)
     except Exception as e:
@@ -318,9 +324,12 @@ async def ask_question(message: types.Message, state: FSMContext):
         return
 
     current_question = _deserialize_question(questions[current_idx])
+    questions_total = (f"{current_idx + 1} (не более {Config.ADAPTIVE_MAX_QUESTIONS})"
+                       if data.get('adaptive') else
+                       f"{current_idx + 1}/{len(questions)}")
 
     question_msg = (
-        f"<b>Вопрос {current_idx + 1}/{len(questions)}</b>\n\n"
+        f"<b>Вопрос {questions_total}</b>\n\n"
         f"<i>Тип:</i> {current_question.question_type}\n"
         f"<i>Область знаний:</i> {current_question.dama_knowledge_area}\n"
         f"<i>Основные работы:</i> {current_question.dama_main_job}\n\n"
@@ -352,6 +361,8 @@ async def process_answer(message: types.Message, state: FSMContext, **kwargs):
     await state.update_data(processing=True)
     try:
         user_id = message.from_user.id
+        # Оценка ответа LLM идет секунды: транзакцию апдейта не держим
+        await end_transaction(kwargs.get('session'))
 
         if data.get('awaiting_clarification', False):
             return await handle_clarification_response(message, state)
@@ -381,6 +392,7 @@ async def process_answer(message: types.Message, state: FSMContext, **kwargs):
             'knowledge_area': current_question.dama_knowledge_area,
             'main_job': current_question.dama_main_job,
             'question_type': current_question.question_type,
+            'difficulty': current_question.difficulty,
             'timestamp': datetime.now().isoformat(),
             'clarification_used': data.get('clarification_count', 0) > 0
         }
@@ -427,6 +439,10 @@ async def process_answer(message: types.Message, state: FSMContext, **kwargs):
         }
         await state.update_data(new_data)
 
+        if data.get('adaptive'):
+            questions = await _advance_adaptive_exam(user_id, state,
+                                                     answer_data)
+
         feedback_msg = format_feedback(analysis)
         await message.answer(feedback_msg, parse_mode="HTML")
 
@@ -498,6 +514,7 @@ async def handle_clarification_response(message: types.Message,
                 'knowledge_area': prev_answer.get('knowledge_area', ''),
                 'main_job': prev_answer.get('main_job', ''),
                 'question_type': prev_answer.get('question_type', ''),
+                'difficulty': prev_answer.get('difficulty'),
                 'timestamp': datetime.now().isoformat(),
                 'clarification_response': message.text,
                 'is_clarified': True
@@ -523,6 +540,13 @@ async def handle_clarification_response(message: types.Message,
         }
         await state.update_data(new_data)
 
+        if data.get('adaptive'):
+            questions = await _advance_adaptive_exam(
+                user_id, state, updated_answer if prev_answer else {
+                    'score': analysis['score'],
+                    'difficulty': current_question.difficulty
+                })
+
         feedback_msg = (
             f"<b>Ваш уточненный ответ оценен на {analysis['score']:.1f}/5.0</b>\n\n"
             f"<i>Исходный ответ:</i>\n{data['previous_answer']}\n\n"
@@ -553,6 +577,31 @@ async def handle_clarification_response(message: types.Message,
         await state.update_data(processing=False)
 
 
+async def _advance_adaptive_exam(user_id: int, state: FSMContext,
+                                 answer: Dict[str, Any]) -> list:
+    """Учесть оценку ответа и добавить следующий вопрос адаптивного экзамена"""
+    data = await state.get_data()
+    questions = data['questions']
+    responses = data.get('ability_responses', []) + [[
+        float(answer.get('difficulty') or 0.0),
+        normalize_score(answer.get('score', 0))
+    ]]
+
+    estimate, next_question = await next_adaptive_question(
+        data['selected_role'], data['selected_comp'], user_id, questions,
+        responses, data.get('selection_seed'))
+    if next_question:
+        questions = questions + [next_question]
+
+    logger.info(
+        f"Adaptive exam for user {user_id}: theta={estimate.theta:.2f}, "
+        f"se={estimate.se:.2f}, answered={estimate.answered}, "
+        f"finished={next_question is None}")
+
+    await state.update_data(ability_responses=responses, questions=questions)
+    return questions
+
+
 async def handle_case_presentation(message: types.Message, state: FSMContext):
     data = await state.get_data()
 
@@ -577,7 +626,8 @@ async def handle_case_presentation(message: types.Message, state: FSMContext):
 
 
 @test_router.message(TestStates.answering_case)
-async def process_case_answer(message: types.Message, state: FSMContext):
+async def process_case_answer(message: types.Message, state: FSMContext,
+                              **kwargs):
     data = await state.get_data()
 
     if not message.from_user:
@@ -595,6 +645,7 @@ async def process_case_answer(message: types.Message, state: FSMContext):
 
     await state.update_data(processing=True)
     try:
+        await end_transaction(kwargs.get('session'))
         case = _deserialize_case(data['case'])
 
         analysis = await analyze_with_chatgpt(
@@ -644,54 +695,22 @@ async def process_case_answer(message: types.Message, state: FSMContext):
 
 async def generate_report(message: types.Message, user_id: int,
                           state: FSMContext):
-    minio_service = MinioService()
-
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    user_meta = await redis_service.get_user_metadata(user_id)
+    """Поставить сохранение результатов и отчет в фоновую очередь.
 
+    Кандидат сразу получает сообщение, которое воркер report_queue
+    обновляет по ходу обработки и в конце заменяет итогами теста.
+    """
     try:
-        report = await generate_test_report(user_id)
-        if not report:
-            raise ValueError("Не удалось сгенерировать отчет")
-
-        safe_name = "".join(c for c in user_meta.get('user_name', 'user')
-                            if c.isalnum() or c in (' ', '_')).rstrip()
-        download_file_name = f"DAMA_Report_{safe_name}_{timestamp}.xlsx"
-
-        success, filename = await minio_service.upload_report(
-            user_id=user_id, file_data=report['excel_file'])
-
-        if not success:
-            raise ValueError("Не удалось загрузить отчет в хранилище")
-
-        async with get_async_session() as session:
-            update_stmt = update(TestResults).where(
-                TestResults.user_id == user_id).values(report_path=filename)
-
-            await session.execute(update_stmt)
-            await session.commit()
-            logger.info(
-                f"Saved test result for user {user_id} with report path {filename}"
-            )
-
-        excel_file = types.BufferedInputFile(report['excel_file'].getvalue(),
-                                             filename=download_file_name)
-
-        await message.answer_document(
-            excel_file, caption="Ваш отчет об оценке компетенций DAMA")
-
-        result_msg = (
-            "<b>Тестирование завершено!</b>\n\n"
-            f"<b>Средний балл:</b> {report['avg_score']:.2f}\n"
-            f"<b>Уровень эксперта:</b> {'достигнут' if report['is_expert'] else 'не достигнут'}\n\n"
-            "Выберите действие:")
-
-        await message.answer(result_msg, reply_markup=build_start_buttons())
+        exam = await collect_exam(user_id)
+        progress = await message.answer("⏳ Результаты в очереди на обработку")
+        await report_queue.enqueue(exam, progress.chat.id, progress.message_id)
+        await message.answer("Выберите действие:",
+                             reply_markup=build_start_buttons())
 
     except Exception as e:
-        logger.error(f"Error while generating report: {e}")
+        logger.error(f"Error while queueing test results: {e}")
         await message.answer(
-            "Произошла ошибка при загрузке в облачное хранилище.\n"
+            "Произошла ошибка при сохранении результатов.\n"
             "Пожалуйста передайте результаты тестирования администратору!",
             reply_markup=build_start_buttons())
     finally:
@@ -722,3 +741,67 @@ def format_feedback(analysis: dict, is_case: bool = False) -> str:
         feedback_parts.append(f"\n\n<i>Рекомендации:</i>\n{recommendations}")
 
     return "".join(feedback_parts)
+
+
+@test_router.callback_query(F.data.startswith("report:"))
+async def handle_report_download(callback: types.CallbackQuery,
+                                 services: ServiceContainer,
+                                 user_profile: Optional[UserProfile] = None):
+    """Отчет по результату в выбранном формате. Админ может скачать
+    любой отчет, пользователь - только свой.
+
+    Однажды загруженный в Telegram отчет дальше отправляется по file_id,
+    без чтения из MinIO и повторной загрузки.
+    """
+    try:
+        _, test_result_id, file_format = (callback.data or "").split(":")
+        owner_id = (None if user_profile and user_profile.is_admin else
+                    callback.from_user.id)
+        report = await services.reports.find_report(int(test_result_id),
+                                                    file_format, owner_id)
+        # Для рендера и отправки отчета база не нужна
+        await end_transaction(services.session)
+        if not report:
+            await callback.answer("Отчет не найден", show_alert=True)
+            return
+        if not callback.message:
+            logger.error("Callback not defined")
+            return
+
+        caption = "Отчет об оценке компетенций DAMA"
+        file_id = await redis_service.load_report_file_id(report.object_name)
+        if file_id:
+            try:
+                await callback.message.answer_document(file_id,
+                                                       caption=caption)
+                await callback.answer()
+                return
+            except TelegramBadRequest as e:
+                # Например, сменился токен бота: загрузим файл заново
+                logger.warning(f"Stale file_id for {report.object_name}: {e}")
+                await redis_service.clear_report_file_id(report.object_name)
+
+        content = await services.reports.load_cached(report)
+        if content is None:
+            content = await services.reports.render(report)
+            # Отправка в Telegram и сохранение в MinIO друг от друга не
+            # зависят
+            sent, _ = await asyncio.gather(
+                callback.message.answer_document(
+                    types.BufferedInputFile(content,
+                                            filename=report.file_name),
+                    caption=caption),
+                services.reports.store(report, content))
+        else:
+            # bytes из MinIO уходят в Telegram без копирования
+            sent = await callback.message.answer_document(
+                types.BufferedInputFile(content, filename=report.file_name),
+                caption=caption)
+        if sent.document:
+            await redis_service.save_report_file_id(report.object_name,
+                                                    sent.document.file_id)
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Error while sending report: {e}")
+        await callback.answer("Не удалось получить отчет, попробуйте позже",
+                              show_alert=True)
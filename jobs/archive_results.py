@@ -0,0 +1,46 @@
+"""Архивация тестов старше ARCHIVE_AFTER_MONTHS в MinIO с удалением из базы.
+
+Запуск: poetry run python -m jobs.archive_results
+"""
+import asyncio
+from datetime import date, datetime
+from typing import List, Optional
+
+from config import Config
+from db.database import get_async_session
+from db.partitions import add_months, drop_month, month_start, partition_months
+from services.archive_service import ResultsArchive
+from services.logger import logger
+from services.minio_service import minio_service
+
+
+async def archive_old_results(after_months: Optional[int] = None) -> List[date]:
+    after_months = (Config.ARCHIVE_AFTER_MONTHS
+                    if after_months is None else after_months)
+    if after_months <= 0:
+        return []
+
+    cutoff = add_months(month_start(datetime.utcnow().date()), -after_months)
+    archive = ResultsArchive(minio_service)
+    archived = []
+
+    async with get_async_session() as session:
+        await archive.index_archived_months(session)
+        await session.commit()
+        conn = await session.connection()
+        for month in await partition_months(conn):
+            if month >= cutoff:
+                continue
+            # Секции удаляются только после успешной выгрузки всех трех таблиц
+            await archive.archive_month(session, month)
+            await drop_month(conn, month)
+            await session.commit()
+            conn = await session.connection()
+            archived.append(month)
+
+    logger.info(f"Archived {len(archived)} months of results")
+    return archived
+
+
+if __name__ == "__main__":
+    asyncio.run(archive_old_results())
@@ -0,0 +1,26 @@
+"""Пересчет dama_user_stats по всем результатам тестов.
+
+Тесты из архивированных и удаленных секций учитываются по итогам
+индекса архива dama_archived_user_months. Секция, которая уже
+отсоединена, но еще не архивирована, в пересчет не попадет: запускайте
+после archive_results.
+
+Запуск: poetry run python -m jobs.backfill_user_stats
+"""
+import asyncio
+
+from db.database import get_async_session
+from repositories.user_stats_repository import UserStatsRepository
+from services.logger import logger
+
+
+async def backfill_user_stats() -> int:
+    async with get_async_session() as session:
+        updated = await UserStatsRepository(session).backfill()
+        await session.commit()
+    logger.info(f"Backfilled stats for {updated} users")
+    return updated
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_user_stats())
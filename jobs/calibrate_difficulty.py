@@ -0,0 +1,65 @@
+"""Офлайн-калибровка трудности вопросов по историческим ответам.
+
+Запуск: poetry run python -m jobs.calibrate_difficulty
+"""
+import asyncio
+
+from sqlalchemy import update
+from sqlalchemy.future import select
+from sqlalchemy.orm import aliased
+
+from db.database import get_async_session
+from db.models import DAMAQuestion, TestAnswer
+from services.adaptive_testing import calibrate_difficulties, normalize_score
+from services.logger import logger
+
+
+async def calibrate_question_difficulty(min_responses: int = 5) -> int:
+    async with get_async_session() as session:
+        responses = []
+        stream = await session.stream(
+            select(TestAnswer.test_result_id, TestAnswer.question_id,
+                   TestAnswer.score).where(
+                       TestAnswer.question_id.is_not(None)).execution_options(
+                           yield_per=5000))
+        async for test_result_id, question_id, score in stream:
+            responses.append(
+                (test_result_id, question_id, normalize_score(score)))
+
+        if not responses:
+            logger.info("No historical answers to calibrate difficulty")
+            return 0
+
+        difficulties = calibrate_difficulties(responses,
+                                              min_responses=min_responses)
+        if not difficulties:
+            logger.info("Not enough answers per question to calibrate")
+            return 0
+
+        await session.execute(update(DAMAQuestion), [{
+            'id': question_id,
+            'difficulty': difficulty
+        } for question_id, difficulty in difficulties.items()])
+
+        # Повторные импорты из Excel создают копии вопросов: переносим им оценку
+        source = aliased(DAMAQuestion)
+        await session.execute(
+            update(DAMAQuestion).where(
+                DAMAQuestion.difficulty.is_(None),
+                source.difficulty.is_not(None),
+                source.question == DAMAQuestion.question,
+                source.dama_role_name == DAMAQuestion.dama_role_name,
+                source.dama_competence_name ==
+                DAMAQuestion.dama_competence_name).values(
+                    difficulty=source.difficulty).execution_options(
+                        synchronize_session=False))
+        await session.commit()
+
+    logger.info(
+        f"Calibrated difficulty for {len(difficulties)} questions "
+        f"from {len(responses)} answers")
+    return len(difficulties)
+
+
+if __name__ == "__main__":
+    asyncio.run(calibrate_question_difficulty())
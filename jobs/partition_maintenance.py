@@ -0,0 +1,25 @@
+"""Обслуживание месячных секций: создание будущих и отсоединение старых.
+
+Запуск: poetry run python -m jobs.partition_maintenance
+"""
+import asyncio
+from typing import List
+
+from db.database import get_async_session
+from db.partitions import detach_expired_partitions, ensure_partitions
+from services.logger import logger
+
+
+async def maintain_partitions() -> List[str]:
+    async with get_async_session() as session:
+        conn = await session.connection()
+        await ensure_partitions(conn)
+        detached = await detach_expired_partitions(conn)
+        await session.commit()
+
+    logger.info(f"Partitions maintained, detached: {len(detached)}")
+    return detached
+
+
+if __name__ == "__main__":
+    asyncio.run(maintain_partitions())
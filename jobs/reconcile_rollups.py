@@ -0,0 +1,79 @@
+"""Сверка агрегатов аналитики с сырыми таблицами за последние дни.
+
+Расхождения логируются, окно пересобирается из dama_test_results,
+dama_test_answers и ai_analytics.
+
+Запуск: poetry run python -m jobs.reconcile_rollups
+"""
+import asyncio
+import math
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.future import select
+
+from config import Config
+from db.database import get_async_session
+from db.models import AnswerRollup, ResultRollup
+from repositories.rollup_repository import ANSWER_KEY, RESULT_KEY, RollupRepository, raw_answer_rollups, \
+    raw_result_rollups
+from services.logger import logger
+
+
+def _as_dict(rows, key_columns: Tuple[str, ...]) -> Dict[tuple, dict]:
+    result = {}
+    for row in rows:
+        values = dict(row._mapping)
+        result[tuple(values[column] for column in key_columns)] = values
+    return result
+
+
+def _same(left: Optional[dict], right: Optional[dict]) -> bool:
+    if left is None or right is None:
+        return left is right
+    for column, value in left.items():
+        other = right.get(column)
+        if isinstance(value, float) or isinstance(other, float):
+            if not math.isclose(float(value or 0), float(other or 0),
+                                rel_tol=1e-9, abs_tol=1e-6):
+                return False
+        elif value != other:
+            return False
+    return True
+
+
+async def reconcile_rollups(days: Optional[int] = None) -> int:
+    days = Config.ROLLUP_RECONCILE_DAYS if days is None else days
+    since: date = (datetime.utcnow() - timedelta(days=days)).date()
+    mismatches = 0
+
+    async with get_async_session() as session:
+        for model, raw, key_columns in (
+                (ResultRollup, raw_result_rollups, RESULT_KEY),
+                (AnswerRollup, raw_answer_rollups, ANSWER_KEY)):
+            query = raw(since)
+            stored = _as_dict(
+                (await session.execute(
+                    select(*(getattr(model, column.name)
+                             for column in query.selected_columns)).where(
+                                 model.day >= since))).all(), key_columns)
+            expected = _as_dict((await session.execute(query)).all(),
+                                key_columns)
+
+            for key in stored.keys() | expected.keys():
+                if not _same(stored.get(key), expected.get(key)):
+                    mismatches += 1
+                    logger.warning(
+                        f"Rollup mismatch in {model.__tablename__} {key}: "
+                        f"stored={stored.get(key)} expected={expected.get(key)}")
+
+        await RollupRepository(session).rebuild(since)
+        await session.commit()
+
+    logger.info(
+        f"Reconciled analytics rollups since {since}: {mismatches} mismatches")
+    return mismatches
+
+
+if __name__ == "__main__":
+    asyncio.run(reconcile_rollups())
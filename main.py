@@ -1,10 +1,34 @@
 from bot.bot import init_bot
 import asyncio
 from db.database import init_db
+from config import Config
+from jobs.archive_results import archive_old_results
+from jobs.partition_maintenance import maintain_partitions
+from jobs.reconcile_rollups import reconcile_rollups
+from services.question_catalog import question_catalog
+from services.report_renderer import report_renderer
+from services.scheduler import scheduler
+
+async def archive_and_maintain_partitions():
+    # Архивация идет первой: секцию не отсоединяют и не удаляют раньше,
+    # чем она выгружена. Будущие секции создаются и при сбое архивации
+    try:
+        await archive_old_results()
+    finally:
+        await maintain_partitions()
 
 async def main():
     await init_db()
-    await init_bot()
+    await question_catalog.reload()
+    scheduler.daily("reconcile_rollups", Config.ROLLUP_RECONCILE_HOUR,
+                    reconcile_rollups)
+    scheduler.daily("partition_maintenance", Config.PARTITION_MAINTENANCE_HOUR,
+                    archive_and_maintain_partitions)
+    try:
+        await init_bot()
+    finally:
+        await scheduler.stop()
+        report_renderer.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -2,20 +2,36 @@
 from typing import Optional, List
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import and_
+from sqlalchemy import Row, and_, true, update
 
 from db.models import AiCreators, Models, AiSettings
 from repositories.base import BaseRepository
 
+# Запросы без параметров собираются один раз: ключ кэша компиляции
+# у готового select запоминается, а строки не превращаются в сущности
+SELECTED_CONNECTION = select(AiCreators.token, AiCreators.url).join(
+    Models, Models.ai_creator_id == AiCreators.id).where(
+        Models.selected == true()).limit(1)
+SELECTED_MODEL_NAME = select(Models.name).where(
+    Models.selected == true()).limit(1)
+SETTINGS_VALUES = select(AiSettings.temperature, AiSettings.prompt).limit(1)
+
 class AiCreatorRepository(BaseRepository[AiCreators]):
     def __init__(self, session: AsyncSession):
         super().__init__(session, AiCreators)
 
     async def get_selected(self) -> Optional[AiCreators]:
+        """Провайдер выбранной модели"""
         result = await self.session.execute(
-            select(self.model).where(self.model.selected == True)
-        )
-        return result.scalar_one_or_none()
+            select(self.model).join(
+                Models, Models.ai_creator_id == self.model.id).where(
+                    Models.selected == True))
+        return result.scalars().first()
+
+    async def get_selected_connection(self) -> Optional[Row]:
+        """token и url провайдера выбранной модели"""
+        result = await self.session.execute(SELECTED_CONNECTION)
+        return result.first()
 
 class ModelRepository(BaseRepository[Models]):
     def __init__(self, session: AsyncSession):
@@ -33,19 +49,39 @@ class ModelRepository(BaseRepository[Models]):
         )
         return result.scalar_one_or_none()
 
+    async def get_selected_name(self) -> Optional[str]:
+        result = await self.session.execute(SELECTED_MODEL_NAME)
+        return result.scalar_one_or_none()
+
+    async def select(self, model: Models) -> None:
+        await self.session.execute(update(self.model).values(selected=False))
+        model.selected = True
+        await self.session.flush()
+
 class AiSettingsRepository(BaseRepository[AiSettings]):
     def __init__(self, session: AsyncSession):
         super().__init__(session, AiSettings)
 
     async def get_settings(self) -> Optional[AiSettings]:
         result = await self.session.execute(select(self.model))
-        return result.scalar_one_or_none()
+        return result.scalars().first()
+
+    async def get_values(self) -> Optional[Row]:
+        """Температура и промпт одной строкой"""
+        result = await self.session.execute(SETTINGS_VALUES)
+        return result.first()
+
+    async def get_or_create(self, **defaults) -> AiSettings:
+        settings = await self.get_settings()
+        if not settings:
+            settings = await self.create(**defaults)
+        return settings
 
     async def update_prompt(self, prompt: str) -> bool:
         settings = await self.get_settings()
         if settings:
             settings.prompt = prompt
-            await self.session.commit()
+            await self.session.flush()
             return True
         return False
 
@@ -53,6 +89,6 @@ class AiSettingsRepository(BaseRepository[AiSettings]):
         settings = await self.get_settings()
         if settings:
             settings.temperature = temperature
-            await self.session.commit()
+            await self.session.flush()
             return True
         return False
@@ -0,0 +1,59 @@
+from datetime import date
+from typing import List, Set
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from db.models import ArchivedUserMonth
+
+INDEX_COLUMNS = ('tests_taken', 'total_score', 'best_score', 'last_test_date',
+                 'is_expert')
+
+
+def _upsert(stmt):
+    # Повторная архивация месяца заменяет его итоги, а не прибавляет
+    return stmt.on_conflict_do_update(
+        index_elements=['user_id', 'month'],
+        set_={column: getattr(stmt.excluded, column)
+              for column in INDEX_COLUMNS})
+
+
+class ArchiveIndexRepository:
+    """Индекс архива: user_id -> месяцы с итогами"""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_user_months(self, user_id: int) -> List[date]:
+        """Месяцы архива с тестами пользователя, от новых к старым"""
+        result = await self.session.execute(
+            select(ArchivedUserMonth.month).where(
+                ArchivedUserMonth.user_id == user_id).order_by(
+                    ArchivedUserMonth.month.desc()))
+        return list(result.scalars().all())
+
+    async def get_indexed_months(self) -> Set[date]:
+        result = await self.session.execute(
+            select(ArchivedUserMonth.month).distinct())
+        return set(result.scalars().all())
+
+    async def index_partition(self, partition: str, month: date) -> None:
+        """Итоги месяца из секции результатов, перед ее удалением"""
+        await self.session.execute(
+            text("INSERT INTO dama_archived_user_months (user_id, month, "
+                 f"{', '.join(INDEX_COLUMNS)}) "
+                 "SELECT user_id, :month, count(*), sum(total_score), "
+                 "max(total_score), max(test_date), bool_or(is_expert) "
+                 f"FROM {partition} GROUP BY user_id "
+                 "ON CONFLICT (user_id, month) DO UPDATE SET " +
+                 ", ".join(f"{column} = EXCLUDED.{column}"
+                           for column in INDEX_COLUMNS)), {"month": month})
+
+    async def add_month(self, month: date, rows: List[dict]) -> None:
+        """Итоги месяца, посчитанные по уже выгруженному архиву"""
+        if rows:
+            await self.session.execute(
+                _upsert(insert(ArchivedUserMonth).values(
+                    [dict(row, month=month) for row in rows])))
@@ -25,7 +25,7 @@ class BaseRepository(ABC, Generic[T]):
     async def create(self, **kwargs) -> T:
         instance = self.model(**kwargs)
         self.session.add(instance)
-        await self.session.commit()
+        await self.session.flush()
         await self.session.refresh(instance)
         return instance
 
@@ -33,14 +33,12 @@ class BaseRepository(ABC, Generic[T]):
         await self.session.execute(
             update(self.model).where(self.model.id == id).values(**kwargs)
         )
-        await self.session.commit()
         return await self.get_by_id(id)
 
     async def delete_by_id(self, id: Any) -> bool:
         result = await self.session.execute(
             delete(self.model).where(self.model.id == id)
         )
-        await self.session.commit()
         return result.rowcount > 0
 
     async def exists(self, id: Any) -> bool:
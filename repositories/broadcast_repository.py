@@ -0,0 +1,60 @@
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from db.enums import UserRole
+from db.models import Broadcast, User
+from repositories.base import BaseRepository
+
+
+class BroadcastRepository(BaseRepository[Broadcast]):
+    def __init__(self, session: AsyncSession):
+        super().__init__(session, Broadcast)
+
+    async def get_running_ids(self) -> List[int]:
+        result = await self.session.execute(
+            select(Broadcast.id).where(Broadcast.status == 'running').order_by(
+                Broadcast.id))
+        return list(result.scalars().all())
+
+    async def get_status(self, broadcast_id: int) -> Optional[str]:
+        result = await self.session.execute(
+            select(Broadcast.status).where(Broadcast.id == broadcast_id))
+        return result.scalar_one_or_none()
+
+    async def count_recipients(self) -> int:
+        result = await self.session.execute(
+            select(func.count()).select_from(User).where(
+                User.role != UserRole.BANNED))
+        return result.scalar_one()
+
+    async def get_recipients(self, after_id: int, limit: int) -> List[int]:
+        """Следующая пачка получателей по ключу id (keyset), без
+        забаненных"""
+        result = await self.session.execute(
+            select(User.id).where(User.id > after_id,
+                                  User.role != UserRole.BANNED).order_by(
+                                      User.id).limit(limit))
+        return list(result.scalars().all())
+
+    async def checkpoint(self, broadcast_id: int, last_user_id: int,
+                         delivered: int, blocked: int, failed: int) -> None:
+        """Сдвинуть чекпоинт и прибавить счетчики отправленной пачки"""
+        await self.session.execute(
+            update(Broadcast).where(Broadcast.id == broadcast_id).values(
+                last_user_id=last_user_id,
+                delivered=Broadcast.delivered + delivered,
+                blocked=Broadcast.blocked + blocked,
+                failed=Broadcast.failed + failed))
+
+    async def set_status(self, broadcast_id: int, status: str) -> bool:
+        """Завершить или отменить рассылку, если она еще идет"""
+        result = await self.session.execute(
+            update(Broadcast).where(Broadcast.id == broadcast_id,
+                                    Broadcast.status == 'running').values(
+                                        status=status,
+                                        finished_at=datetime.utcnow()))
+        return result.rowcount > 0
@@ -0,0 +1,74 @@
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from db.models import DAMACompetenceKey, DAMACompetency, DAMARoleKey, DMARoles
+
+CATALOG_ROLES = select(DMARoles.dama_role_name)
+CATALOG_COMPETENCIES = select(DAMACompetency.dama_role_name,
+                              DAMACompetency.dama_competence_name)
+
+
+class DictionaryRepository:
+    """Справочники ролей и компетенций"""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_role_names(self) -> Dict[int, str]:
+        result = await self.session.execute(
+            select(DAMARoleKey.id, DAMARoleKey.name))
+        return dict(result.tuples().all())
+
+    async def get_competence_names(self) -> Dict[int, Tuple[str, str]]:
+        result = await self.session.execute(
+            select(DAMACompetenceKey.id, DAMARoleKey.name,
+                   DAMACompetenceKey.name).join(
+                       DAMARoleKey,
+                       DAMARoleKey.id == DAMACompetenceKey.role_id))
+        return {
+            competence_id: (role_name, competence_name)
+            for competence_id, role_name, competence_name in result.tuples()
+        }
+
+    async def get_keys(self, role_name: str, competence_name: str
+                       ) -> Tuple[Optional[int], Optional[int]]:
+        """id роли и компетенции по именам; None, если имени нет в
+        справочнике"""
+        result = await self.session.execute(
+            select(DAMARoleKey.id, DAMACompetenceKey.id).outerjoin(
+                DAMACompetenceKey,
+                (DAMACompetenceKey.role_id == DAMARoleKey.id) &
+                (DAMACompetenceKey.name == competence_name)).where(
+                    DAMARoleKey.name == role_name))
+        keys = result.first()
+        return tuple(keys) if keys else (None, None)
+
+    async def add_keys(self, role_name: str,
+                       competence_name: str) -> Tuple[int, int]:
+        """Добавить имена в справочники, если их там нет"""
+        await self.session.execute(
+            insert(DAMARoleKey).values(name=role_name).on_conflict_do_nothing(
+                index_elements=['name']))
+        role_id = await self.session.scalar(
+            select(DAMARoleKey.id).where(DAMARoleKey.name == role_name))
+        await self.session.execute(
+            insert(DAMACompetenceKey).values(
+                role_id=role_id, name=competence_name).on_conflict_do_nothing(
+                    index_elements=['role_id', 'name']))
+        competence_id = await self.session.scalar(
+            select(DAMACompetenceKey.id).where(
+                DAMACompetenceKey.role_id == role_id,
+                DAMACompetenceKey.name == competence_name))
+        return role_id, competence_id
+
+    async def get_catalog_roles(self) -> List[str]:
+        """Роли из загруженного банка вопросов"""
+        result = await self.session.execute(CATALOG_ROLES)
+        return list(result.scalars().all())
+
+    async def get_catalog_competencies(self) -> List[Tuple[str, str]]:
+        result = await self.session.execute(CATALOG_COMPETENCIES)
+        return list(result.tuples().all())
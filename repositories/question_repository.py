@@ -1,60 +1,58 @@
-
-from typing import Optional, List
+from typing import List
+from sqlalchemy import Row, lambda_stmt
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import and_, func
 
 from db.models import DAMAQuestion, DAMACase
 from repositories.base import BaseRepository
 
+# Колонки совпадают с полями CatalogQuestion и CatalogCase: строки
+# читаются кортежами, без создания ORM-сущностей
+ALL_QUESTIONS = select(DAMAQuestion.id, DAMAQuestion.dama_role_name,
+                       DAMAQuestion.dama_competence_name,
+                       DAMAQuestion.question_type, DAMAQuestion.question,
+                       DAMAQuestion.question_answer,
+                       DAMAQuestion.dama_knowledge_area,
+                       DAMAQuestion.dama_main_job, DAMAQuestion.difficulty)
+ALL_CASES = select(DAMACase.id, DAMACase.dama_role_name,
+                   DAMACase.dama_competence_name, DAMACase.dama_main_job,
+                   DAMACase.situation, DAMACase.case_task,
+                   DAMACase.case_answer, DAMACase.dama_knowledge_area)
+
+
+def questions_stmt(role: str, competence: str):
+    return lambda_stmt(lambda: ALL_QUESTIONS.where(
+        DAMAQuestion.dama_role_name == role,
+        DAMAQuestion.dama_competence_name == competence))
+
+
+def cases_stmt(role: str, competence: str):
+    return lambda_stmt(lambda: ALL_CASES.where(
+        DAMACase.dama_role_name == role,
+        DAMACase.dama_competence_name == competence))
+
+
 class QuestionRepository(BaseRepository[DAMAQuestion]):
     def __init__(self, session: AsyncSession):
         super().__init__(session, DAMAQuestion)
 
-    async def get_by_role_and_competence(self, role: str, competence: str) -> List[DAMAQuestion]:
-        result = await self.session.execute(
-            select(self.model).where(
-                and_(
-                    self.model.dama_role_name == role,
-                    self.model.dama_competence_name == competence
-                )
-            )
-        )
-        return list(result.scalars().all())
-
-    async def get_random_question(self, role: str, competence: str) -> Optional[DAMAQuestion]:
-        result = await self.session.execute(
-            select(self.model).where(
-                and_(
-                    self.model.dama_role_name == role,
-                    self.model.dama_competence_name == competence
-                )
-            ).order_by(func.random()).limit(1)
-        )
-        return result.scalar_one_or_none()
+    async def get_by_role_and_competence(self, role: str, competence: str) -> List[Row]:
+        result = await self.session.execute(questions_stmt(role, competence))
+        return list(result.all())
+
+    async def get_all_rows(self) -> List[Row]:
+        result = await self.session.execute(ALL_QUESTIONS)
+        return list(result.all())
+
 
 class CaseRepository(BaseRepository[DAMACase]):
     def __init__(self, session: AsyncSession):
         super().__init__(session, DAMACase)
 
-    async def get_by_role_and_competence(self, role: str, competence: str) -> List[DAMACase]:
-        result = await self.session.execute(
-            select(self.model).where(
-                and_(
-                    self.model.dama_role_name == role,
-                    self.model.dama_competence_name == competence
-                )
-            )
-        )
-        return list(result.scalars().all())
-
-    async def get_random_case(self, role: str, competence: str) -> Optional[DAMACase]:
-        result = await self.session.execute(
-            select(self.model).where(
-                and_(
-                    self.model.dama_role_name == role,
-                    self.model.dama_competence_name == competence
-                )
-            ).order_by(func.random()).limit(1)
-        )
-        return result.scalar_one_or_none()
+    async def get_by_role_and_competence(self, role: str, competence: str) -> List[Row]:
+        result = await self.session.execute(cases_stmt(role, competence))
+        return list(result.all())
+
+    async def get_all_rows(self) -> List[Row]:
+        result = await self.session.execute(ALL_CASES)
+        return list(result.all())
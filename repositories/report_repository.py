@@ -0,0 +1,51 @@
+from typing import List, Optional
+
+from sqlalchemy import Row, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from db.models import DAMACase, DAMACompetenceKey, DAMAQuestion, DAMARoleKey, TestAnswer, TestResults, User
+
+REPORT_RESULT = select(
+    TestResults.id, TestResults.user_id, TestResults.test_date,
+    TestResults.total_score, TestResults.is_expert,
+    func.coalesce(TestResults.candidate_name,
+                  func.trim(User.first_name + ' ' +
+                            User.last_name)).label('candidate_name'),
+    DAMARoleKey.name.label('role'),
+    DAMACompetenceKey.name.label('competence')).join(
+        User, User.id == TestResults.user_id).join(
+            DAMARoleKey, DAMARoleKey.id == TestResults.role_id).join(
+                DAMACompetenceKey,
+                DAMACompetenceKey.id == TestResults.competence_id)
+
+# Текст вопроса и область знаний - из вопроса или, для кейса, из кейса
+REPORT_ANSWERS = select(
+    func.coalesce(DAMAQuestion.dama_knowledge_area,
+                  DAMACase.dama_knowledge_area, '').label('knowledge_area'),
+    func.coalesce(DAMAQuestion.question,
+                  DAMACase.situation + '\n\n' + DAMACase.case_task,
+                  '').label('question'), TestAnswer.answer_text,
+    TestAnswer.score, TestAnswer.feedback).outerjoin(
+        DAMAQuestion, DAMAQuestion.id == TestAnswer.question_id).outerjoin(
+            DAMACase, DAMACase.id == TestAnswer.case_id)
+
+
+class ReportRepository:
+    """Сохраненные результаты теста в виде, нужном для отчета"""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get_result(self, test_result_id: int) -> Optional[Row]:
+        result = await self.session.execute(
+            REPORT_RESULT.where(TestResults.id == test_result_id))
+        return result.first()
+
+    async def get_answers(self, test_result: Row) -> List[Row]:
+        result = await self.session.execute(
+            REPORT_ANSWERS.where(
+                TestAnswer.test_result_id == test_result.id,
+                TestAnswer.test_date == test_result.test_date).order_by(
+                    TestAnswer.id))
+        return list(result.all())
@@ -0,0 +1,229 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Date, and_, cast, func, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from db.models import AnswerRollup, Analytics, DAMACase, DAMACompetenceKey, DAMAQuestion, DAMARoleKey, ResultRollup, \
+    TestAnswer, TestResults
+
+BUCKETS = 5
+BUCKET_COLUMNS = tuple(f"bucket_{i}" for i in range(BUCKETS))
+
+
+def score_bucket(score: float) -> int:
+    return min(BUCKETS - 1, max(0, int(score)))
+
+
+def _bucket_counts(scores: Iterable[float]) -> Dict[str, int]:
+    counts = dict.fromkeys(BUCKET_COLUMNS, 0)
+    for score in scores:
+        counts[BUCKET_COLUMNS[score_bucket(score)]] += 1
+    return counts
+
+
+def _upsert_increment(model, rows: List[dict], key_columns: Tuple[str, ...]):
+    stmt = insert(model).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=list(key_columns),
+        set_={
+            column: getattr(model, column) + getattr(stmt.excluded, column)
+            for column in rows[0] if column not in key_columns
+        })
+
+
+def _bucket_aggregates(score) -> list:
+    bucket = func.least(BUCKETS - 1, func.greatest(0, func.floor(score)))
+    return [
+        func.count().filter(bucket == i).label(column)
+        for i, column in enumerate(BUCKET_COLUMNS)
+    ]
+
+
+RESULT_KEY = ('day', 'dama_role', 'dama_competence', 'model')
+ANSWER_KEY = ('day', 'dama_role', 'dama_competence', 'knowledge_area')
+
+
+def _with_names(query):
+    """Имена роли и компетенции результата через справочники"""
+    return query.join(DAMARoleKey, DAMARoleKey.id == TestResults.role_id).join(
+        DAMACompetenceKey, DAMACompetenceKey.id == TestResults.competence_id)
+
+
+def raw_result_rollups(since: date):
+    """Агрегаты ResultRollup, посчитанные заново по сырым таблицам"""
+    day = cast(TestResults.test_date, Date)
+    model = func.coalesce(Analytics.model, literal(''))
+    query = select(
+        day.label('day'),
+        DAMARoleKey.name.label('dama_role'),
+        DAMACompetenceKey.name.label('dama_competence'),
+        model.label('model'),
+        func.count().label('tests'),
+        func.count().filter(TestResults.is_expert).label('experts'),
+        func.sum(TestResults.total_score).label('score_sum'),
+        func.sum(TestResults.total_score *
+                 TestResults.total_score).label('score_sumsq'),
+        *_bucket_aggregates(TestResults.total_score),
+        func.coalesce(func.sum(Analytics.total_tokens),
+                      0).label('total_tokens')).select_from(TestResults)
+    return _with_names(query).outerjoin(
+        Analytics,
+        and_(Analytics.test_result_id == TestResults.id,
+             Analytics.test_date == TestResults.test_date)).where(
+                 TestResults.test_date >= since).group_by(
+                     day, DAMARoleKey.name, DAMACompetenceKey.name, model)
+
+
+def raw_answer_rollups(since: date):
+    """Агрегаты AnswerRollup, посчитанные заново по сырым таблицам"""
+    day = cast(TestResults.test_date, Date)
+    area = func.coalesce(DAMAQuestion.dama_knowledge_area,
+                         DAMACase.dama_knowledge_area, literal(''))
+    query = select(
+        day.label('day'),
+        DAMARoleKey.name.label('dama_role'),
+        DAMACompetenceKey.name.label('dama_competence'),
+        area.label('knowledge_area'),
+        func.count().label('answers'),
+        func.sum(TestAnswer.score).label('score_sum'),
+        func.sum(TestAnswer.score * TestAnswer.score).label('score_sumsq'),
+        *_bucket_aggregates(TestAnswer.score)).select_from(TestAnswer).join(
+            TestResults,
+            and_(TestResults.id == TestAnswer.test_result_id,
+                 TestResults.test_date == TestAnswer.test_date))
+    return _with_names(query).outerjoin(
+        DAMAQuestion, DAMAQuestion.id == TestAnswer.question_id).outerjoin(
+            DAMACase, DAMACase.id == TestAnswer.case_id).where(
+                TestAnswer.test_date >= since).group_by(
+                    day, DAMARoleKey.name, DAMACompetenceKey.name, area)
+
+
+@dataclass(frozen=True)
+class RollupStats:
+    label: str
+    count: int
+    score_sum: float
+    score_sumsq: float
+    buckets: Tuple[int, ...]
+    experts: Optional[int] = None
+
+    @property
+    def mean(self) -> float:
+        return self.score_sum / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        if not self.count:
+            return 0.0
+        return max(0.0, self.score_sumsq / self.count - self.mean**2)**0.5
+
+
+class RollupRepository:
+    """Инкрементальные агрегаты для админской аналитики"""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def record_test(self, test_date: datetime, dama_role: str,
+                          dama_competence: str, model: Optional[str],
+                          total_score: float, is_expert: bool,
+                          total_tokens: int, answers: List[dict]) -> None:
+        """Учесть завершенный тест. Не коммитит: вызывается в транзакции,
+        которая пишет TestResults"""
+        key = {
+            'day': test_date.date(),
+            'dama_role': dama_role,
+            'dama_competence': dama_competence
+        }
+        await self.session.execute(
+            _upsert_increment(ResultRollup, [{
+                **key, 'model': model or '',
+                'tests': 1,
+                'experts': int(is_expert),
+                'score_sum': total_score,
+                'score_sumsq': total_score * total_score,
+                **_bucket_counts([total_score]), 'total_tokens': total_tokens
+            }], RESULT_KEY))
+
+        scores_by_area = defaultdict(list)
+        for answer in answers:
+            scores_by_area[answer.get('knowledge_area') or ''].append(
+                float(answer.get('score', 0)))
+        if not scores_by_area:
+            return
+
+        await self.session.execute(
+            _upsert_increment(AnswerRollup, [{
+                **key, 'knowledge_area': area,
+                'answers': len(scores),
+                'score_sum': sum(scores),
+                'score_sumsq': sum(score * score for score in scores),
+                **_bucket_counts(scores)
+            } for area, scores in scores_by_area.items()], ANSWER_KEY))
+
+    async def summary(self, dimension: str, since: date) -> List[RollupStats]:
+        """Сводка за период по одному измерению: role, competence, model
+        или area. Читает только агрегаты, объем не зависит от числа тестов"""
+        if dimension == 'area':
+            model = AnswerRollup
+            labels = (AnswerRollup.knowledge_area, )
+            count = AnswerRollup.answers
+            experts = None
+        else:
+            model = ResultRollup
+            labels = {
+                'role': (ResultRollup.dama_role, ),
+                'competence': (ResultRollup.dama_role,
+                               ResultRollup.dama_competence),
+                'model': (ResultRollup.model, )
+            }[dimension]
+            count = ResultRollup.tests
+            experts = func.sum(ResultRollup.experts)
+
+        columns = [
+            *labels,
+            func.sum(count),
+            func.sum(model.score_sum),
+            func.sum(model.score_sumsq),
+            *(func.sum(getattr(model, column)) for column in BUCKET_COLUMNS)
+        ]
+        if experts is not None:
+            columns.append(experts)
+
+        result = await self.session.execute(
+            select(*columns).where(model.day >= since).group_by(
+                *labels).order_by(func.sum(count).desc()))
+
+        stats = []
+        for row in result.all():
+            values = list(row)
+            label = " / ".join(value or "—" for value in values[:len(labels)])
+            values = values[len(labels):]
+            stats.append(
+                RollupStats(label=label,
+                            count=int(values[0]),
+                            score_sum=float(values[1]),
+                            score_sumsq=float(values[2]),
+                            buckets=tuple(
+                                int(value)
+                                for value in values[3:3 + BUCKETS]),
+                            experts=int(values[3 + BUCKETS])
+                            if experts is not None else None))
+        return stats
+
+    async def rebuild(self, since: date) -> None:
+        """Пересобрать агрегаты начиная с since по сырым таблицам"""
+        for model, raw in ((ResultRollup, raw_result_rollups),
+                           (AnswerRollup, raw_answer_rollups)):
+            query = raw(since)
+            await self.session.execute(
+                model.__table__.delete().where(model.day >= since))
+            await self.session.execute(
+                insert(model).from_select(
+                    [column.name for column in query.selected_columns],
+                    query))
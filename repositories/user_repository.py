@@ -2,20 +2,39 @@
 from typing import Optional, List
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import and_
+from sqlalchemy import Row, and_, func, lambda_stmt, update
 
 from db.models import User, TestResults
 from db.enums import UserRole
 from repositories.base import BaseRepository
 
+
+def profile_stmt(user_id: int):
+    """Поля профиля без ORM-сущности. lambda_stmt кэширует собранный
+    запрос по месту в коде, user_id уходит в него параметром"""
+    return lambda_stmt(lambda: select(
+        User.id, User.first_name, User.last_name, User.username,
+        User.role).where(User.id == user_id))
+
+
+def role_stmt(user_id: int):
+    return lambda_stmt(lambda: select(User.role).where(User.id == user_id))
+
+
 class UserRepository(BaseRepository[User]):
     def __init__(self, session: AsyncSession):
         super().__init__(session, User)
 
     async def get_by_telegram_id(self, telegram_id: int) -> Optional[User]:
-        result = await self.session.execute(
-            select(self.model).where(self.model.telegram_id == telegram_id)
-        )
+        # id пользователя совпадает с его Telegram id
+        return await self.get_by_id(telegram_id)
+
+    async def get_profile(self, telegram_id: int) -> Optional[Row]:
+        result = await self.session.execute(profile_stmt(telegram_id))
+        return result.first()
+
+    async def get_role(self, telegram_id: int) -> Optional[UserRole]:
+        result = await self.session.execute(role_stmt(telegram_id))
         return result.scalar_one_or_none()
 
     async def get_by_role(self, role: UserRole) -> List[User]:
@@ -25,42 +44,49 @@ class UserRepository(BaseRepository[User]):
         return list(result.scalars().all())
 
     async def get_banned_users(self) -> List[User]:
+        return await self.get_by_role(UserRole.BANNED)
+
+    async def set_role(self, telegram_id: int, role: UserRole) -> bool:
         result = await self.session.execute(
-            select(self.model).where(self.model.is_banned == True)
-        )
-        return list(result.scalars().all())
+            update(self.model).where(self.model.id == telegram_id).values(
+                role=role))
+        return result.rowcount > 0
 
     async def ban_user(self, telegram_id: int) -> bool:
-        user = await self.get_by_telegram_id(telegram_id)
-        if user:
-            user.is_banned = True
-            await self.session.commit()
-            return True
-        return False
+        return await self.set_role(telegram_id, UserRole.BANNED)
 
     async def unban_user(self, telegram_id: int) -> bool:
-        user = await self.get_by_telegram_id(telegram_id)
-        if user:
-            user.is_banned = False
-            await self.session.commit()
-            return True
-        return False
-
-    async def get_paginated(self, page: int, page_size: int = 10) -> tuple[List[User], int]:
-        offset = page * page_size
-        
-        # Get users for current page
-        result = await self.session.execute(
-            select(self.model)
-            .offset(offset)
-            .limit(page_size)
-        )
+        return await self.set_role(telegram_id, UserRole.USER)
+
+    async def get_page(self,
+                       page_size: int = 10,
+                       after_id: Optional[int] = None,
+                       before_id: Optional[int] = None,
+                       role: Optional[str] = None) -> tuple[List[User], bool]:
+        """Страница по ключу id (keyset) и признак, что дальше есть еще записи"""
+        query = select(self.model)
+        if role:
+            query = query.where(self.model.role == role)
+
+        if before_id is not None:
+            query = query.where(self.model.id < before_id).order_by(
+                self.model.id.desc())
+        else:
+            if after_id is not None:
+                query = query.where(self.model.id > after_id)
+            query = query.order_by(self.model.id)
+
+        result = await self.session.execute(query.limit(page_size + 1))
         users = list(result.scalars().all())
-        
-        # Get total count
-        count_result = await self.session.execute(
-            select(self.model.id)
-        )
-        total_count = len(list(count_result.scalars().all()))
-        
-        return users, total_count
+        has_more = len(users) > page_size
+        users = users[:page_size]
+        if before_id is not None:
+            users.reverse()
+        return users, has_more
+
+    async def count(self, role: Optional[str] = None) -> int:
+        query = select(func.count()).select_from(self.model)
+        if role:
+            query = query.where(self.model.role == role)
+        result = await self.session.execute(query)
+        return result.scalar_one()
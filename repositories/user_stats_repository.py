@@ -0,0 +1,96 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, or_, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from db.models import ArchivedUserMonth, TestResults, UserStats
+from repositories.base import BaseRepository
+
+
+def build_user_stats_backfill():
+    """INSERT ... SELECT, пересчитывающий агрегаты по всем TestResults.
+
+    Тесты из уже удаленных секций берутся из итогов индекса архива
+    dama_archived_user_months, иначе пересчет после архивации занизил бы
+    статистику.
+    """
+    live = select(TestResults.user_id,
+                  func.count(TestResults.id).label('tests_taken'),
+                  func.sum(TestResults.total_score).label('total_score'),
+                  func.max(TestResults.total_score).label('best_score'),
+                  func.max(TestResults.test_date).label('last_test_date'),
+                  func.bool_or(TestResults.is_expert).label('is_expert')
+                  ).group_by(TestResults.user_id)
+    archived = select(ArchivedUserMonth.user_id,
+                      ArchivedUserMonth.tests_taken,
+                      ArchivedUserMonth.total_score,
+                      ArchivedUserMonth.best_score,
+                      ArchivedUserMonth.last_test_date,
+                      ArchivedUserMonth.is_expert)
+    totals = union_all(live, archived).subquery()
+    aggregated = select(
+        totals.c.user_id, func.sum(totals.c.tests_taken),
+        func.sum(totals.c.total_score),
+        func.sum(totals.c.total_score) / func.sum(totals.c.tests_taken),
+        func.max(totals.c.best_score), func.max(totals.c.last_test_date),
+        func.bool_or(totals.c.is_expert)).group_by(totals.c.user_id)
+    stmt = insert(UserStats).from_select([
+        'user_id', 'tests_taken', 'total_score', 'avg_score', 'best_score',
+        'last_test_date', 'is_expert'
+    ], aggregated)
+    return stmt.on_conflict_do_update(
+        index_elements=[UserStats.user_id],
+        set_={
+            'tests_taken': stmt.excluded.tests_taken,
+            'total_score': stmt.excluded.total_score,
+            'avg_score': stmt.excluded.avg_score,
+            'best_score': stmt.excluded.best_score,
+            'last_test_date': stmt.excluded.last_test_date,
+            'is_expert': stmt.excluded.is_expert
+        })
+
+
+class UserStatsRepository(BaseRepository[UserStats]):
+    def __init__(self, session: AsyncSession):
+        super().__init__(session, UserStats)
+
+    async def get_by_user_id(self, user_id: int) -> Optional[UserStats]:
+        result = await self.session.execute(
+            select(self.model).where(self.model.user_id == user_id))
+        return result.scalar_one_or_none()
+
+    async def record_result(self, user_id: int, score: float,
+                            is_expert: bool, test_date: datetime) -> None:
+        """Учесть новый результат. Не коммитит: вызывается в транзакции,
+        которая пишет сам TestResults"""
+        stmt = insert(self.model).values(user_id=user_id,
+                                         tests_taken=1,
+                                         total_score=score,
+                                         avg_score=score,
+                                         best_score=score,
+                                         last_test_date=test_date,
+                                         is_expert=is_expert)
+        total = self.model.total_score + stmt.excluded.total_score
+        taken = self.model.tests_taken + 1
+        await self.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[self.model.user_id],
+                set_={
+                    'tests_taken': taken,
+                    'total_score': total,
+                    'avg_score': total / taken,
+                    'best_score': func.greatest(self.model.best_score,
+                                                stmt.excluded.best_score),
+                    'last_test_date': func.greatest(
+                        self.model.last_test_date,
+                        stmt.excluded.last_test_date),
+                    'is_expert': or_(self.model.is_expert,
+                                     stmt.excluded.is_expert)
+                }))
+
+    async def backfill(self) -> int:
+        result = await self.session.execute(build_user_stats_backfill())
+        return result.rowcount
@@ -0,0 +1,159 @@
+import heapq
+import math
+import random
+from collections import defaultdict
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Collection, Dict, Hashable, Iterable, Optional, Sequence, Tuple
+
+from config import Config
+from services.question_catalog import CatalogQuestion, QuestionCatalog, THEORY, PRACTICE
+
+MAX_SCORE = 5.0
+EXPERT_SCORE = 4.5
+ABILITY_PRIOR_SD = 2.0
+DIFFICULTY_PRIOR_SD = 1.5
+
+# Порог экспертности в логитах: ожидаемый балл 4.5/5 на вопросе средней трудности
+EXPERT_THRESHOLD = math.log((EXPERT_SCORE / MAX_SCORE) /
+                            (1 - EXPERT_SCORE / MAX_SCORE))
+
+
+@dataclass(frozen=True)
+class AbilityEstimate:
+    theta: float
+    se: float
+    answered: int
+
+    @property
+    def is_expert(self) -> bool:
+        return self.theta >= EXPERT_THRESHOLD
+
+
+def normalize_score(score: float) -> float:
+    return min(1.0, max(0.0, float(score) / MAX_SCORE))
+
+
+def _sigmoid(x: float) -> float:
+    if x >= 0:
+        return 1.0 / (1.0 + math.exp(-x))
+    z = math.exp(x)
+    return z / (1.0 + z)
+
+
+def estimate_ability(responses: Sequence[Tuple[float, float]],
+                     prior_sd: float = ABILITY_PRIOR_SD) -> AbilityEstimate:
+    """MAP-оценка способности по модели Раша с частичным баллом.
+
+    responses - пары (трудность вопроса, балл в долях 0..1).
+    """
+    theta = 0.0
+    prior_precision = 1.0 / (prior_sd * prior_sd)
+    information = prior_precision
+    for _ in range(50):
+        gradient = -theta * prior_precision
+        information = prior_precision
+        for difficulty, score in responses:
+            p = _sigmoid(theta - difficulty)
+            gradient += score - p
+            information += p * (1.0 - p)
+        step = max(-1.0, min(1.0, gradient / information))
+        theta += step
+        if abs(step) < 1e-6:
+            break
+    return AbilityEstimate(theta=theta,
+                           se=1.0 / math.sqrt(information),
+                           answered=len(responses))
+
+
+def should_stop(estimate: AbilityEstimate) -> bool:
+    """Остановить экзамен, когда доверительный интервал не содержит порог"""
+    if estimate.answered >= Config.ADAPTIVE_MAX_QUESTIONS:
+        return True
+    if estimate.answered < Config.ADAPTIVE_MIN_QUESTIONS:
+        return False
+    z = NormalDist().inv_cdf(0.5 + Config.ADAPTIVE_CONFIDENCE / 2)
+    return (estimate.theta - z * estimate.se > EXPERT_THRESHOLD
+            or estimate.theta + z * estimate.se < EXPERT_THRESHOLD)
+
+
+def pick_next_question(catalog: QuestionCatalog,
+                       role: str,
+                       competence: str,
+                       theta: float,
+                       asked: Sequence[CatalogQuestion | dict],
+                       recent: Collection[int] = (),
+                       rng: Optional[random.Random] = None,
+                       top_k: int = 3) -> Optional[CatalogQuestion]:
+    """Вопрос с трудностью, ближайшей к текущей оценке способности.
+
+    Типы вопросов чередуются, а среди top_k ближайших берется случайный,
+    чтобы кандидаты с одинаковыми ответами не получали одинаковый экзамен.
+    """
+    rng = rng or random.Random()
+    asked_ids = set()
+    type_counts = {THEORY: 0, PRACTICE: 0}
+    for question in asked:
+        question_id = question['id'] if isinstance(question, dict) else question.id
+        question_type = (question['question_type'] if isinstance(
+            question, dict) else question.question_type)
+        asked_ids.add(question_id)
+        type_counts[question_type] = type_counts.get(question_type, 0) + 1
+
+    for allow_recent in (False, True):
+        for question_type in sorted(type_counts, key=type_counts.get):
+            candidates = [
+                catalog.questions_by_id[question_id]
+                for question_id in catalog.get_question_ids(
+                    role, competence, question_type)
+                if question_id not in asked_ids and (
+                    allow_recent or question_id not in recent)
+            ]
+            if candidates:
+                nearest = heapq.nsmallest(
+                    top_k,
+                    candidates,
+                    key=lambda q: abs((q.difficulty or 0.0) - theta))
+                return rng.choice(nearest)
+    return None
+
+
+def calibrate_difficulties(
+        responses: Iterable[Tuple[Hashable, Hashable, float]],
+        min_responses: int = 5,
+        iterations: int = 30) -> Dict[Hashable, float]:
+    """Совместная MAP-калибровка трудностей по историческим ответам.
+
+    responses - тройки (id прохождения, id вопроса, балл в долях 0..1).
+    Возвращает трудности только для вопросов с достаточным числом ответов.
+    """
+    by_person = defaultdict(list)
+    by_item = defaultdict(list)
+    for person, item, score in responses:
+        by_person[person].append((item, score))
+        by_item[item].append((person, score))
+
+    theta = {person: 0.0 for person in by_person}
+    difficulty = {item: 0.0 for item in by_item}
+
+    for _ in range(iterations):
+        for person, answers in by_person.items():
+            theta[person] = estimate_ability(
+                [(difficulty[item], score) for item, score in answers]).theta
+
+        # Трудность - это способность с обратным знаком с точки зрения вопроса
+        for item, answers in by_item.items():
+            difficulty[item] = -estimate_ability(
+                [(-theta[person], score) for person, score in answers],
+                prior_sd=DIFFICULTY_PRIOR_SD).theta
+
+        # Средняя трудность = 0, чтобы порог экспертности не «уплывал»
+        shift = sum(difficulty.values()) / len(difficulty) if difficulty else 0.0
+        for item in difficulty:
+            difficulty[item] -= shift
+
+    return {
+        item: round(value, 4)
+        for item, value in difficulty.items()
+        if len(by_item[item]) >= min_responses
+    }
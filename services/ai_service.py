@@ -3,6 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from repositories.ai_repository import AiCreatorRepository, ModelRepository, AiSettingsRepository
 from db.models import AiCreators, Models, AiSettings
+from config import Config
 from services.redis_service import RedisService
 from services.logger import logger
 
@@ -21,6 +22,18 @@ class AiService:
         """Получить выбранную модель"""
         return await self.model_repo.get_selected()
 
+    async def get_ai_creators(self) -> List[AiCreators]:
+        """Получить всех AI провайдеров"""
+        return await self.ai_creator_repo.get_all()
+
+    async def get_ai_creator(self, creator_id: int) -> Optional[AiCreators]:
+        """Получить AI провайдера по ID"""
+        return await self.ai_creator_repo.get_by_id(creator_id)
+
+    async def get_model(self, model_id: int) -> Optional[Models]:
+        """Получить модель по ID"""
+        return await self.model_repo.get_by_id(model_id)
+
     async def get_models_by_creator(self, creator_id: int) -> List[Models]:
         """Получить модели по ID провайдера"""
         return await self.model_repo.get_by_creator_id(creator_id)
@@ -29,6 +42,12 @@ class AiService:
         """Получить настройки AI"""
         return await self.settings_repo.get_settings()
 
+    async def get_or_create_settings(self) -> AiSettings:
+        """Получить настройки AI, создав их со значениями по умолчанию"""
+        return await self.settings_repo.get_or_create(
+            temperature=Config.DEFAULT_TEMPERATURE,
+            prompt=Config.DEFAULT_PROMPT)
+
     async def update_prompt(self, prompt: str) -> bool:
         """Обновить системный промпт"""
         if len(prompt) > 4000:
@@ -56,48 +75,35 @@ class AiService:
         creator = await self.ai_creator_repo.create(
             name=name,
             token=token,
-            url=url,
-            selected=False
+            url=url
         )
+        await self.redis_service.save_openai_token(token)
+        await self.redis_service.save_selected_url(url)
         logger.info(f"Created AI creator: {name}")
         return creator
 
-    async def select_ai_creator(self, creator_id: int) -> bool:
-        """Выбрать AI провайдера"""
-        # Сначала снимаем выделение со всех
-        creators = await self.ai_creator_repo.get_all()
-        for creator in creators:
-            creator.selected = False
-
-        # Выделяем нужного
-        creator = await self.ai_creator_repo.get_by_id(creator_id)
-        if creator:
-            creator.selected = True
-            await self.ai_creator_repo.session.commit()
-
-            # Обновляем Redis
-            await self.redis_service.save_openai_token(creator.token)
-            await self.redis_service.save_selected_url(creator.url)
-            return True
-        return False
-
-    async def select_model(self, model_id: int) -> bool:
-        """Выбрать модель"""
-        # Снимаем выделение со всех моделей
-        models = await self.model_repo.get_all()
-        for model in models:
-            model.selected = False
-
-        # Выделяем нужную
-        model = await self.model_repo.get_by_id(model_id)
-        if model:
-            model.selected = True
-            await self.model_repo.session.commit()
-
-            # Обновляем Redis
-            await self.redis_service.save_selected_ai_model(model.name)
-            return True
-        return False
+    async def select_model(self, model: Models,
+                           creator: AiCreators) -> float:
+        """Выбрать модель и сохранить ее настройки в Redis.
+
+        Возвращает температуру, с которой будет работать модель.
+        """
+        settings = await self.get_or_create_settings()
+        await self.model_repo.select(model)
+
+        try:
+            temperature = float(
+                settings.temperature
+            ) if settings.temperature is not None else 0.0
+        except (TypeError, ValueError):
+            logger.error("Invalid temperature value in settings")
+            temperature = 0.0
+
+        await self.redis_service.save_openai_token(str(creator.token))
+        await self.redis_service.save_selected_url(str(creator.url))
+        await self.redis_service.save_selected_ai_model(str(model.name))
+        await self.redis_service.save_model_temperature(temperature)
+        return temperature
 
     async def get_ai_configuration(self) -> Dict[str, Any]:
         """Получить полную конфигурацию AI"""
@@ -0,0 +1,195 @@
+import json
+import tempfile
+from datetime import date, datetime
+from typing import BinaryIO, Dict, List
+
+import pyarrow as pa
+import pyarrow.compute
+import pyarrow.parquet as pq
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Analytics, TestAnswer, TestResults
+from db.partitions import PARTITIONED_TABLES, partition_name
+from repositories.archive_repository import ArchiveIndexRepository
+from services.logger import logger
+from services.minio_service import MinioService
+
+ARCHIVE_PREFIX = "results"
+MODELS = {
+    'dama_test_results': TestResults,
+    'dama_test_answers': TestAnswer,
+    'ai_analytics': Analytics
+}
+INDEX_BATCH_SIZE = 1000
+# Результаты сортируются по пользователю, чтобы фильтр по user_id
+# отсекал группы строк по статистике Parquet
+ORDER_BY = {
+    'dama_test_results': "user_id, test_date",
+    'dama_test_answers': "test_result_id, id",
+    'ai_analytics': "test_result_id, id"
+}
+
+
+def archive_object_name(month: date, table: str) -> str:
+    return f"{ARCHIVE_PREFIX}/month={month:%Y-%m}/{table}.parquet"
+
+
+def _arrow_schema(table: str):
+    types = {
+        int: pa.int64(),
+        float: pa.float64(),
+        bool: pa.bool_(),
+        str: pa.string()
+    }
+    fields = []
+    for column in MODELS[table].__table__.columns:
+        python_type = column.type.python_type
+        if python_type is datetime:
+            arrow_type = pa.timestamp('us')
+        else:
+            # JSONB сохраняется строкой с исходным JSON
+            arrow_type = types.get(python_type, pa.string())
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def _archive_row(row) -> dict:
+    return {
+        key: json.dumps(value, ensure_ascii=False) if isinstance(
+            value, (dict, list)) else value
+        for key, value in row.items()
+    }
+
+
+def _read_user_rows(file: BinaryIO, user_id: int) -> List[dict]:
+    """Строки пользователя из Parquet-файла результатов.
+
+    Читаются только футер и группы строк, в диапазон user_id которых
+    попадает пользователь: архив отсортирован по user_id.
+    """
+    parquet = pq.ParquetFile(file)
+    column = parquet.schema_arrow.get_field_index('user_id')
+    row_groups = []
+    for index in range(parquet.metadata.num_row_groups):
+        stats = parquet.metadata.row_group(index).column(column).statistics
+        if (stats is None or not stats.has_min_max
+                or stats.min <= user_id <= stats.max):
+            row_groups.append(index)
+    if not row_groups:
+        return []
+    table = parquet.read_row_groups(row_groups)
+    return table.filter(pa.compute.equal(table['user_id'],
+                                         user_id)).to_pylist()
+
+
+def _month_totals(file: BinaryIO) -> List[dict]:
+    """Итоги пользователей за месяц по архиву результатов, для индекса"""
+    table = pq.read_table(
+        file, columns=['user_id', 'total_score', 'test_date', 'is_expert'])
+    totals = table.group_by('user_id').aggregate([
+        ('total_score', 'count'), ('total_score', 'sum'),
+        ('total_score', 'max'), ('test_date', 'max'), ('is_expert', 'any')
+    ])
+    return [{
+        'user_id': row['user_id'],
+        'tests_taken': row['total_score_count'],
+        'total_score': row['total_score_sum'],
+        'best_score': row['total_score_max'],
+        'last_test_date': row['test_date_max'],
+        'is_expert': row['is_expert_any']
+    } for row in totals.to_pylist()]
+
+
+class ResultsArchive:
+    """Холодный архив завершенных тестов в MinIO: Parquet (zstd) по месяцам"""
+
+    def __init__(self, minio_service: MinioService):
+        self.minio_service = minio_service
+
+    async def archive_month(self, session: AsyncSession,
+                            month: date) -> Dict[str, int]:
+        """Выгрузить секции месяца в MinIO и записать месяц в индекс
+        архива. Строки из базы не удаляются"""
+        counts = {}
+        for table in PARTITIONED_TABLES:
+            schema = _arrow_schema(table)
+            query = text(f"SELECT {', '.join(schema.names)} "
+                         f"FROM {partition_name(table, month)} "
+                         f"ORDER BY {ORDER_BY[table]}")
+            rows = 0
+            with tempfile.SpooledTemporaryFile(max_size=64 * 1024 *
+                                               1024) as buffer:
+                with pq.ParquetWriter(buffer, schema,
+                                      compression='zstd') as writer:
+                    stream = await session.stream(
+                        query.execution_options(yield_per=5000))
+                    async for batch in stream.mappings().partitions():
+                        writer.write_table(
+                            pa.Table.from_pylist([_archive_row(row) for row in batch],
+                                                 schema=schema))
+                        rows += len(batch)
+                length = buffer.tell()
+                if not await self.minio_service.upload_archive(
+                        archive_object_name(month, table), buffer, length):
+                    raise RuntimeError(
+                        f"Failed to archive {table} for {month:%Y-%m}")
+            counts[table] = rows
+        await ArchiveIndexRepository(session).index_partition(
+            partition_name('dama_test_results', month), month)
+        logger.info(f"Archived {month:%Y-%m}: {counts}")
+        return counts
+
+    async def archived_months(self) -> List[date]:
+        months = set()
+        for name in await self.minio_service.list_archive(f"{ARCHIVE_PREFIX}/"):
+            part = name.split("/")[1]
+            if part.startswith("month="):
+                year, month = part[len("month="):].split("-")
+                months.add(date(int(year), int(month), 1))
+        return sorted(months, reverse=True)
+
+    async def index_archived_months(self, session: AsyncSession) -> int:
+        """Дописать в индекс месяцы, выгруженные до его появления"""
+        index = ArchiveIndexRepository(session)
+        indexed = await index.get_indexed_months()
+        added = 0
+        for month in await self.archived_months():
+            if month in indexed:
+                continue
+            totals = await self.minio_service.read_archive(
+                archive_object_name(month, 'dama_test_results'), _month_totals)
+            if totals is None:
+                continue
+            for start in range(0, len(totals), INDEX_BATCH_SIZE):
+                await index.add_month(month,
+                                      totals[start:start + INDEX_BATCH_SIZE])
+            added += 1
+        if added:
+            logger.info(f"Indexed {added} archived months")
+        return added
+
+    async def load_user_results(self, session: AsyncSession, user_id: int,
+                                limit: int) -> List[dict]:
+        """Последние результаты пользователя из архива, от новых к старым.
+
+        Читаются только месяцы, в которых по индексу архива есть тесты
+        пользователя. Архивы до перехода на справочники хранят имена роли
+        и компетенции, более новые - role_id и competence_id.
+        """
+        if limit <= 0:
+            return []
+
+        results = []
+        months = await ArchiveIndexRepository(session).get_user_months(user_id)
+        for month in months:
+            rows = await self.minio_service.read_archive(
+                archive_object_name(month, 'dama_test_results'),
+                lambda file: _read_user_rows(file, user_id))
+            if not rows:
+                continue
+            rows.sort(key=lambda row: row['test_date'], reverse=True)
+            results.extend(rows)
+            if len(results) >= limit:
+                break
+        return results[:limit]
@@ -0,0 +1,159 @@
+"""Рассылка админа всем пользователям.
+
+Получатели читаются из dama_users пачками по BROADCAST_BATCH_SIZE по
+ключу id и отправляются не быстрее BROADCAST_RATE сообщений в секунду с
+приоритетом BULK, поэтому ответы кандидатам во время рассылки идут
+первыми. После каждой пачки чекпоинт и счетчики сохраняются в
+dama_broadcasts: прерванную рассылку любая реплика продолжает с
+чекпоинта, повторно могут уйти сообщения только из последней пачки.
+Одну рассылку в каждый момент ведет одна реплика - владелец аренды в
+Redis.
+"""
+import asyncio
+from collections import Counter
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError
+from redis.asyncio import Redis
+
+from config import Config
+from db.database import session_scope
+from db.models import Broadcast
+from repositories.broadcast_repository import BroadcastRepository
+from services.keyboard import build_broadcast_keyboard
+from services.logger import logger
+from services.outbound import BULK, TokenBucket, outbound
+from services.redis_lease import RedisLease
+
+LEASE_TTL = 30
+STATUS_TITLES = {
+    'running': "⏳ Рассылка идет",
+    'done': "✅ Рассылка завершена",
+    'cancelled': "⏹ Рассылка остановлена",
+}
+
+
+def format_broadcast_status(status: str, delivered: int, blocked: int,
+                            failed: int) -> str:
+    return (f"{STATUS_TITLES[status]}\n\n"
+            f"Доставлено: {delivered}\n"
+            f"Заблокировали бота: {blocked}\n"
+            f"Ошибки: {failed}")
+
+
+class Broadcaster:
+    """Фоновое выполнение рассылок. Используйте общий экземпляр
+    broadcaster"""
+
+    def __init__(self):
+        self.redis_client = Redis(host=Config.REDIS_HOST,
+                                  port=Config.REDIS_PORT,
+                                  db=0,
+                                  password=Config.REDIS_USER_PASSWORD,
+                                  username=Config.REDIS_USER,
+                                  decode_responses=False)
+        self._rate = TokenBucket(Config.BROADCAST_RATE, Config.BROADCAST_RATE)
+        self._task = None
+
+    async def _send(self, bot: Bot, user_id: int, text: str) -> str:
+        await self._rate.acquire(BULK)
+        try:
+            await bot.send_message(user_id, text)
+            return 'delivered'
+        except TelegramForbiddenError:
+            # Пользователь заблокировал бота или удалил аккаунт
+            return 'blocked'
+        except TelegramAPIError as e:
+            logger.warning(f"Broadcast to {user_id} failed: {e}")
+            return 'failed'
+
+    @staticmethod
+    async def _show_status(bot: Bot, broadcast: Broadcast, status: str,
+                           totals: Counter) -> None:
+        if not broadcast.status_message_id:
+            return
+        try:
+            await bot.edit_message_text(
+                format_broadcast_status(status, totals['delivered'],
+                                        totals['blocked'], totals['failed']),
+                chat_id=broadcast.created_by,
+                message_id=broadcast.status_message_id,
+                reply_markup=(build_broadcast_keyboard(broadcast.id)
+                              if status == 'running' else None))
+        except TelegramBadRequest as e:
+            logger.warning(f"Cannot update broadcast status: {e}")
+
+    async def _run(self, bot: Bot, broadcast_id: int) -> None:
+        async with session_scope() as session:
+            broadcast = await BroadcastRepository(session).get_by_id(
+                broadcast_id)
+        if broadcast is None:
+            return
+        last_user_id = broadcast.last_user_id
+        totals = Counter(delivered=broadcast.delivered,
+                         blocked=broadcast.blocked,
+                         failed=broadcast.failed)
+        logger.info(f"Running broadcast {broadcast_id} "
+                    f"from user {last_user_id}")
+
+        while True:
+            async with session_scope() as session:
+                repo = BroadcastRepository(session)
+                status = await repo.get_status(broadcast_id)
+                if status != 'running':
+                    break
+                recipients = await repo.get_recipients(
+                    last_user_id, Config.BROADCAST_BATCH_SIZE)
+                if not recipients:
+                    await repo.set_status(broadcast_id, 'done')
+                    status = 'done'
+                    break
+
+            # Соединение с БД на время отправки пачки не держим
+            outcomes = Counter(await asyncio.gather(
+                *(self._send(bot, user_id, broadcast.text)
+                  for user_id in recipients)))
+            last_user_id = recipients[-1]
+            totals.update(outcomes)
+            async with session_scope() as session:
+                await BroadcastRepository(session).checkpoint(
+                    broadcast_id, last_user_id, outcomes['delivered'],
+                    outcomes['blocked'], outcomes['failed'])
+            await self._show_status(bot, broadcast, 'running', totals)
+
+        if status in STATUS_TITLES:
+            await self._show_status(bot, broadcast, status, totals)
+        logger.info(f"Broadcast {broadcast_id} {status}: {dict(totals)}")
+
+    async def _loop(self, bot: Bot) -> None:
+        # Рассылка уступает и ответам на апдейты, и фоновым задачам
+        with outbound.priority(BULK):
+            while True:
+                try:
+                    async with session_scope() as session:
+                        running = await BroadcastRepository(
+                            session).get_running_ids()
+                    for broadcast_id in running:
+                        lease = RedisLease(self.redis_client,
+                                           f"broadcast:{broadcast_id}",
+                                           LEASE_TTL)
+                        if await lease.acquire():
+                            await lease.hold(
+                                lambda: self._run(bot, broadcast_id))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Broadcast error: {e}")
+                await asyncio.sleep(Config.BROADCAST_POLL_SECONDS)
+
+    def start(self, bot: Bot) -> None:
+        self._task = asyncio.create_task(self._loop(bot))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+broadcaster = Broadcaster()
@@ -0,0 +1,179 @@
+import asyncio
+import csv
+import gzip
+import io
+import tempfile
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from aiogram import Bot
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from config import Config
+from db.database import get_read_session
+from db.models import DAMACompetenceKey, DAMARoleKey, TestResults
+from services.keyboard import build_admin_keyboard
+from services.logger import logger
+from services.minio_service import MinioService
+from services.outbound import BACKGROUND, outbound
+
+EXPORT_FORMATS = ('csv.gz', 'parquet')
+# Больше этого размера выгрузка уходит из памяти во временный файл
+SPOOL_SIZE = 8 * 1024 * 1024
+
+EXPORT_COLUMNS = (
+    TestResults.id,
+    TestResults.test_date,
+    TestResults.user_id,
+    TestResults.candidate_name,
+    DAMARoleKey.name.label('role'),
+    DAMACompetenceKey.name.label('competence'),
+    TestResults.total_score,
+    TestResults.is_expert,
+)
+
+
+@dataclass(frozen=True)
+class ExportFilter:
+    """Период включительно и необязательные роль и компетенция"""
+    date_from: date
+    date_to: date
+    role: Optional[str] = None
+    competence: Optional[str] = None
+
+
+def build_export_query(export_filter: ExportFilter):
+    # Границы по test_date отсекают лишние месячные секции
+    query = select(*EXPORT_COLUMNS).join(
+        DAMARoleKey, DAMARoleKey.id == TestResults.role_id).join(
+            DAMACompetenceKey,
+            DAMACompetenceKey.id == TestResults.competence_id).where(
+                TestResults.test_date >= export_filter.date_from,
+                TestResults.test_date
+                < export_filter.date_to + timedelta(days=1))
+    if export_filter.role:
+        query = query.where(DAMARoleKey.name == export_filter.role)
+    if export_filter.competence:
+        query = query.where(DAMACompetenceKey.name == export_filter.competence)
+    return query.order_by(TestResults.test_date)
+
+
+def _arrow_schema():
+    return pa.schema([
+        pa.field('id', pa.int64()),
+        pa.field('test_date', pa.timestamp('us')),
+        pa.field('user_id', pa.int64()),
+        pa.field('candidate_name', pa.string()),
+        pa.field('role', pa.string()),
+        pa.field('competence', pa.string()),
+        pa.field('total_score', pa.float64()),
+        pa.field('is_expert', pa.bool_()),
+    ])
+
+
+class ResultsExport:
+    """Выгрузка результатов для админов: gzip CSV или Parquet в MinIO.
+
+    Строки читаются серверным курсором пачками по EXPORT_BATCH_SIZE и
+    сразу пишутся в файл, поэтому память не растет с числом строк.
+    """
+
+    def __init__(self, minio_service: MinioService):
+        self.minio_service = minio_service
+        self._tasks: set[asyncio.Task] = set()
+
+    async def _write_csv(self, stream, buffer) -> int:
+        rows = 0
+        with gzip.GzipFile(fileobj=buffer, mode='wb') as archive:
+            text = io.TextIOWrapper(archive, encoding='utf-8', newline='')
+            writer = csv.writer(text)
+            writer.writerow(column.key for column in EXPORT_COLUMNS)
+            async for batch in stream.partitions():
+                writer.writerows(batch)
+                rows += len(batch)
+            text.flush()
+            text.detach()
+        return rows
+
+    async def _write_parquet(self, stream, buffer) -> int:
+        rows = 0
+        schema = _arrow_schema()
+        with pq.ParquetWriter(buffer, schema, compression='zstd') as writer:
+            async for batch in stream.mappings().partitions():
+                writer.write_table(
+                    pa.Table.from_pylist([dict(row) for row in batch],
+                                         schema=schema))
+                rows += len(batch)
+        return rows
+
+    async def export(self, session: AsyncSession, export_filter: ExportFilter,
+                     file_format: str, requested_by: int
+                     ) -> Optional[Tuple[str, int]]:
+        """Выгрузить результаты и вернуть временную ссылку и число строк"""
+        if file_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format {file_format}")
+
+        query = build_export_query(export_filter).execution_options(
+            yield_per=Config.EXPORT_BATCH_SIZE)
+        object_name = (f"exports/{requested_by}/"
+                       f"{datetime.utcnow():%Y%m%d_%H%M%S}_"
+                       f"{export_filter.date_from:%Y%m%d}-"
+                       f"{export_filter.date_to:%Y%m%d}.{file_format}")
+
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as buffer:
+            stream = await session.stream(query)
+            if file_format == 'parquet':
+                rows = await self._write_parquet(stream, buffer)
+            else:
+                rows = await self._write_csv(stream, buffer)
+            length = buffer.tell()
+            url = await self.minio_service.upload_export(
+                object_name, buffer, length, file_format)
+
+        if url is None:
+            return None
+        logger.info(f"Exported {rows} results to {object_name} "
+                    f"({length} bytes)")
+        return url, rows
+
+    async def _export_and_notify(self, bot: Bot, chat_id: int,
+                                 export_filter: ExportFilter,
+                                 file_format: str) -> None:
+        try:
+            # Выгрузка - длинное чтение, поэтому с реплики
+            async with get_read_session() as session:
+                exported = await self.export(session, export_filter,
+                                             file_format, chat_id)
+            if not exported:
+                text = "Не удалось загрузить выгрузку в хранилище"
+            else:
+                url, rows = exported
+                text = (f"Выгружено результатов: {rows}\n"
+                        f"Ссылка действует {Config.EXPORT_LINK_TTL // 3600} "
+                        f"ч:\n{url}")
+        except Exception as e:
+            logger.error(f"Error exporting results: {e}")
+            text = "Ошибка при выгрузке результатов"
+        with outbound.priority(BACKGROUND):
+            await bot.send_message(chat_id,
+                                   text,
+                                   parse_mode=None,
+                                   reply_markup=build_admin_keyboard())
+
+    def start(self, bot: Bot, chat_id: int, export_filter: ExportFilter,
+              file_format: str) -> None:
+        """Выгрузить в фоне и прислать ссылку в чат chat_id: хендлер не
+        держит сессию апдейта и слот обработки до конца выгрузки"""
+        task = asyncio.create_task(
+            self._export_and_notify(bot, chat_id, export_filter, file_format))
+        self._tasks.add(task)
+        task.add_done_callback(self._forget)
+
+    def _forget(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Export notification failed: {task.exception()}")
@@ -10,6 +10,26 @@ def build_start_buttons() -> types.ReplyKeyboardMarkup:
     return builder.as_markup(resize_keyboard=True)
 
 
+REPORT_FORMAT_TITLES = (
+    ("xlsx", "📄 Excel"),
+    ("csv", "CSV"),
+    ("html", "HTML"),
+)
+
+
+def build_report_keyboard(test_result_ids: list) -> InlineKeyboardMarkup:
+    """Кнопки скачивания отчета, по ряду на результат. Если результатов
+    несколько, кнопки нумеруются как в списке"""
+    builder = InlineKeyboardBuilder()
+    for i, test_result_id in enumerate(test_result_ids):
+        prefix = f"{i + 1}) " if len(test_result_ids) > 1 else ""
+        for file_format, title in REPORT_FORMAT_TITLES:
+            builder.button(text=f"{prefix}{title}",
+                           callback_data=f"report:{test_result_id}:{file_format}")
+    builder.adjust(len(REPORT_FORMAT_TITLES))
+    return builder.as_markup()
+
+
 def build_start_test_keyboard():
     builder = ReplyKeyboardBuilder()
     builder.add(types.KeyboardButton(text="✅ Начать тестирование"))
@@ -23,6 +43,9 @@ def build_admin_keyboard():
     builder.add(types.KeyboardButton(text="Изменить температуру"))
     builder.add(types.KeyboardButton(text="Изменить промпт"))
     builder.add(types.KeyboardButton(text="Список пользователей"))
+    builder.add(types.KeyboardButton(text="Аналитика"))
+    builder.add(types.KeyboardButton(text="Выгрузка результатов"))
+    builder.add(types.KeyboardButton(text="Рассылка"))
     builder.add(types.KeyboardButton(text="Назад"))
     builder.adjust(1)
     return builder.as_markup(resize_keyboard=True)
@@ -52,25 +75,69 @@ def build_model_choice_keyboard(models):
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def build_users_keyboard(users: list, page: int, page_size: int = 10):
+ANALYTICS_DIMENSIONS = (
+    ("role", "По ролям"),
+    ("competence", "По компетенциям"),
+    ("area", "По областям знаний"),
+    ("model", "По моделям"),
+)
+
+
+def build_analytics_keyboard() -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    for value, title in ANALYTICS_DIMENSIONS:
+        builder.button(text=title, callback_data=f"analytics:{value}")
+    builder.adjust(2)
+    return builder.as_markup()
+
+
+USER_ROLE_FILTERS = (
+    ("all", "Все"),
+    ("user", "Пользователи"),
+    ("admin", "Админы"),
+    ("banned", "Забаненные"),
+)
+
+
+def build_users_keyboard(users: list,
+                         role_filter: str = "all",
+                         has_prev: bool = False,
+                         has_next: bool = False):
     keyboard = InlineKeyboardMarkup(inline_keyboard=[])
 
+    keyboard.inline_keyboard.append([
+        InlineKeyboardButton(
+            text=f"• {title}" if value == role_filter else title,
+            callback_data=f"users_page:{value}:n:0")
+        for value, title in USER_ROLE_FILTERS
+    ])
+
     for user in users:
         keyboard.inline_keyboard.append([
             InlineKeyboardButton(
-                text=f"{user.id} - {user.username or 'No username'}",
-                callback_data=f"select_user:{user.id}")
+                text=
+                f"{user.id} - {user.username or 'No username'} - {user.role.value}",
+                callback_data=f"user_info:{user.id}")
+        ])
+        keyboard.inline_keyboard.append([
+            InlineKeyboardButton(text="Сделать Админом",
+                                 callback_data=f"make_admin:{user.id}"),
+            InlineKeyboardButton(text="Забанить пользователя",
+                                 callback_data=f"ban_user:{user.id}")
         ])
 
+    # Курсор - id крайнего пользователя на странице: n - дальше, p - назад
     pagination_row = []
-    if page > 0:
+    if has_prev and users:
         pagination_row.append(
-            InlineKeyboardButton(text="⬅️ Назад",
-                                 callback_data=f"users_page:{page - 1}"))
-    if len(users) == page_size:
+            InlineKeyboardButton(
+                text="⬅️ Назад",
+                callback_data=f"users_page:{role_filter}:p:{users[0].id}"))
+    if has_next and users:
         pagination_row.append(
-            InlineKeyboardButton(text="Вперед ➡️",
-                                 callback_data=f"users_page:{page + 1}"))
+            InlineKeyboardButton(
+                text="Вперед ➡️",
+                callback_data=f"users_page:{role_filter}:n:{users[-1].id}"))
 
     if pagination_row:
         keyboard.inline_keyboard.append(pagination_row)
@@ -79,3 +146,18 @@ def build_users_keyboard(users: list, page: int, page_size: int = 10):
         [InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_admin")])
 
     return keyboard
+
+
+def build_broadcast_confirm_keyboard():
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="✅ Отправить всем",
+                             callback_data="broadcast:confirm"),
+        InlineKeyboardButton(text="Отмена", callback_data="broadcast:cancel")
+    ]])
+
+
+def build_broadcast_keyboard(broadcast_id: int):
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="⏹ Остановить",
+                             callback_data=f"broadcast:stop:{broadcast_id}")
+    ]])
@@ -1,15 +1,69 @@
+import asyncio
 from typing import Callable, Dict, Any, Awaitable
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery, TelegramObject
-from sqlalchemy import select
-from db.database import get_async_session
-from db.models import User
-from db.enums import UserRole
+from db.database import commit, get_async_session, rollback
 from services.logger import logger
+from services.service_container import ServiceContainer
+from services.user_cache import user_profile_cache
+
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """Не больше limit апдейтов в обработке одновременно.
+
+    И polling, и webhook запускают задачу на каждый апдейт без
+    ограничения; лишние апдейты ждут здесь, до того как займут
+    соединение из пула БД.
+    """
+
+    def __init__(self, limit: int):
+        self._slots = asyncio.Semaphore(limit)
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]],
+                                         Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        async with self._slots:
+            return await handler(event, data)
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Одна сессия БД (unit of work) на апдейт.
+
+    Соединение берется из пула только при первом запросе, так что апдейты
+    без обращения к базе пул не трогают. Хендлеры получают сессию в
+    data['session'] и сервисы в data['services']. Транзакцией владеет
+    middleware: после хендлера она коммитится, при исключении
+    откатывается; репозитории и сервисы сами не коммитят. Читающая
+    сессия services.read, если хендлер ее открывал, закрывается.
+    """
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]],
+                                         Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        async with get_async_session() as session:
+            services = ServiceContainer(session)
+            data['session'] = session
+            data['services'] = services
+            try:
+                result = await handler(event, data)
+            except Exception:
+                await rollback(session)
+                raise
+            finally:
+                await services.close()
+            if session.in_transaction():
+                await commit(session)
+            return result
 
 
 class BanCheckMiddleware(BaseMiddleware):
-    """Middleware для проверки забаненных пользователей"""
+    """Middleware для проверки забаненных пользователей.
+
+    Профиль пользователя загружается один раз на апдейт и передается
+    хендлерам в data['user_profile'].
+    """
 
     async def __call__(self,
                        handler: Callable[[TelegramObject, Dict[str, Any]],
@@ -17,18 +71,25 @@ class BanCheckMiddleware(BaseMiddleware):
                        event: TelegramObject, data: Dict[str, Any]) -> Any:
         user_id = None
 
-        if isinstance(event, Message) and event.from_user:
+        if isinstance(event, (Message, CallbackQuery)) and event.from_user:
             user_id = event.from_user.id
 
-            # Пропускаем команду /start для забаненных пользователей
-            # чтобы они могли получить уведомление о бане
-            if event.text and event.text.startswith('/start'):
-                return await handler(event, data)
+        profile = None
+        if user_id:
+            try:
+                profile = await user_profile_cache.get(
+                    user_id, session=data.get('session'))
+            except Exception as e:
+                logger.error(f"Error checking user ban status: {e}")
+        data['user_profile'] = profile
 
-        elif isinstance(event, CallbackQuery) and event.from_user:
-            user_id = event.from_user.id
+        # Пропускаем команду /start для забаненных пользователей
+        # чтобы они могли получить уведомление о бане
+        if (isinstance(event, Message) and event.text
+                and event.text.startswith('/start')):
+            return await handler(event, data)
 
-        if user_id and await self.is_user_banned(user_id):
+        if profile and profile.is_banned:
             if isinstance(event, Message):
                 await event.answer(
                     "Вы заблокированы и не можете использовать бота.")
@@ -39,15 +100,3 @@ class BanCheckMiddleware(BaseMiddleware):
             return
 
         return await handler(event, data)
-
-    async def is_user_banned(self, user_id: int) -> bool:
-        """Проверяет, забанен ли пользователь"""
-        try:
-            async with get_async_session() as session:
-                result = await session.execute(
-                    select(User).where(User.id == user_id))
-                user = result.scalars().first()
-                return user and str(user.role) == UserRole.BANNED
-        except Exception as e:
-            logger.error(f"Error checking user ban status: {e}")
-            return False
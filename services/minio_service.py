@@ -1,15 +1,84 @@
 from minio import Minio
 from minio.error import S3Error
-from io import BytesIO
-from datetime import datetime
-from dotenv import load_dotenv
-from typing import Optional, Tuple
+import asyncio
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+from typing import BinaryIO, Callable, Dict, List, Optional, TypeVar
 from config import Config
 from services.logger import logger
 
-load_dotenv()
+T = TypeVar('T')
+# Минимальный объем одного ranged GET: мелкие чтения Parquet склеиваются
+ARCHIVE_READ_SIZE = 256 * 1024
+
+
+class _RangedObject(io.RawIOBase):
+    """Объект MinIO как файл только для чтения: каждое чтение - ranged GET"""
+
+    def __init__(self, client: Minio, bucket: str, object_name: str,
+                 size: int):
+        self.client = client
+        self.bucket = bucket
+        self.object_name = object_name
+        self.size = size
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position,
+                io.SEEK_END: self.size}[whence]
+        self.position = base + offset
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        length = min(len(buffer), self.size - self.position)
+        if length <= 0:
+            return 0
+        response = self.client.get_object(self.bucket,
+                                          self.object_name,
+                                          offset=self.position,
+                                          length=length)
+        try:
+            data = response.read()
+        finally:
+            response.close()
+            response.release_conn()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+CONTENT_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+    "html": "text/html; charset=utf-8",
+    "pdf": "application/pdf",
+    "csv.gz": "application/gzip",
+    "parquet": "application/vnd.apache.parquet"
+}
+
 
 class MinioService:
+    """Асинхронная обертка над синхронным клиентом minio.
+
+    Сетевые вызовы идут в отдельном пуле на MINIO_MAX_WORKERS потоков,
+    чтобы загрузки не блокировали event loop и не занимали общий пул
+    asyncio.to_thread. Бакеты проверяются и создаются один раз, при
+    первом обращении. Используйте общий экземпляр minio_service.
+    """
+
     def __init__(self):
         self.client = Minio(
             f"{Config.MINIO_HOST}:{Config.MINIO_PORT}",
@@ -18,19 +87,34 @@ class MinioService:
             secure=Config.SECURE
         )
         self.bucket_name = "user-reports"
-        self._ensure_bucket_exists()
-        self._make_bucket_public()
+        self._executor = ThreadPoolExecutor(
+            max_workers=Config.MINIO_MAX_WORKERS, thread_name_prefix="minio")
+        self._ready_buckets = set()
+        self._bucket_locks: Dict[str, asyncio.Lock] = {}
 
-    def _ensure_bucket_exists(self):
-        try:
-            if not self.client.bucket_exists(self.bucket_name):
-                self.client.make_bucket(self.bucket_name)
-                logger.info(f"Bucket '{self.bucket_name}' create")
-        except S3Error as e:
-            logger.error(f"Error while creating bucket: {e}")
-            raise
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor,
+                                          partial(func, *args, **kwargs))
+
+    async def _ensure_bucket(self, bucket: str, public: bool) -> None:
+        if bucket in self._ready_buckets:
+            return
+        lock = self._bucket_locks.setdefault(bucket, asyncio.Lock())
+        async with lock:
+            if bucket in self._ready_buckets:
+                return
+            await self._run(self._create_bucket, bucket, public)
+            self._ready_buckets.add(bucket)
+
+    def _create_bucket(self, bucket: str, public: bool) -> None:
+        if not self.client.bucket_exists(bucket):
+            self.client.make_bucket(bucket)
+            logger.info(f"Bucket '{bucket}' create")
+        if public:
+            self._make_bucket_public(bucket)
 
-    def _make_bucket_public(self):
+    def _make_bucket_public(self, bucket: str) -> None:
         try:
             policy = {
                 "Version": "2012-10-17",
@@ -39,43 +123,62 @@ class MinioService:
                         "Action": ["s3:GetObject"],
                         "Effect": "Allow",
                         "Principal": {"AWS": ["*"]},
-                        "Resource": [f"arn:aws:s3:::{self.bucket_name}/*"],
+                        "Resource": [f"arn:aws:s3:::{bucket}/*"],
                         "Sid": ""
                     }
                 ]
             }
-            import json
-            self.client.set_bucket_policy(self.bucket_name, json.dumps(policy))
-            logger.info(f"Bucker '{self.bucket_name}' now public (read-only)")
+            self.client.set_bucket_policy(bucket, json.dumps(policy))
+            logger.info(f"Bucker '{bucket}' now public (read-only)")
         except S3Error as e:
             logger.error(f"Error while making public: {e}")
 
-    async def upload_report(self, user_id: int, file_data: BytesIO, file_extension: str = "xlsx") -> Tuple[bool, str]:
-        try:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"reports/{user_id}/DAMA_Report_{user_id}_{timestamp}.{file_extension}"
-
-            file_data.seek(0)
-            file_size = file_data.getbuffer().nbytes
+    async def _put(self, bucket: str, object_name: str, data: BinaryIO,
+                   length: Optional[int], content_type: str) -> None:
+        """Загрузить поток. Если длина неизвестна, minio грузит его
+        multipart-частями по MINIO_PART_SIZE, не читая целиком в память;
+        известная длина больше части тоже уходит multipart"""
+        if length is None and data.seekable():
+            position = data.tell()
+            length = data.seek(0, os.SEEK_END) - position
+            data.seek(position)
+        await self._run(self.client.put_object,
+                        bucket,
+                        object_name,
+                        data,
+                        -1 if length is None else length,
+                        content_type=content_type,
+                        part_size=Config.MINIO_PART_SIZE)
 
-            content_type_map = {
-                "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                "csv": "text/csv",
-                "pdf": "application/pdf"
-            }
+    async def put_report(self, object_name: str, content: bytes,
+                         file_extension: str) -> bool:
+        try:
+            await self._ensure_bucket(self.bucket_name, public=True)
+            await self._put(self.bucket_name, object_name,
+                            io.BytesIO(content), len(content),
+                            CONTENT_TYPES.get(file_extension,
+                                              "application/octet-stream"))
+            return True
+        except S3Error as e:
+            logger.error(f"Error while sending file: {e}")
+            return False
 
-            self.client.put_object(
-                self.bucket_name,
-                filename,
-                file_data,
-                file_size,
-                content_type=content_type_map.get(file_extension, "application/octet-stream")
-            )
+    async def read_report(self, object_name: str) -> Optional[bytes]:
+        def read():
+            response = self.client.get_object(self.bucket_name, object_name)
+            try:
+                return response.read()
+            finally:
+                response.close()
+                response.release_conn()
 
-            return True, filename
+        try:
+            return await self._run(read)
         except S3Error as e:
-            logger.error(f"Error while sending file: {e}")
-            return False, str(e)
+            # Отчета еще нет - это обычный промах кэша
+            if e.code not in ("NoSuchKey", "NoSuchBucket"):
+                logger.error(f"Error while reading report {object_name}: {e}")
+            return None
 
     async def get_report_url(self, filename: str) -> Optional[str]:
         try:
@@ -87,8 +190,80 @@ class MinioService:
 
     async def delete_report(self, filename: str) -> bool:
         try:
-            self.client.remove_object(self.bucket_name, filename)
+            await self._run(self.client.remove_object, self.bucket_name,
+                            filename)
             return True
         except S3Error as e:
             logger.error(f"Error while deleting file: {e}")
             return False
+
+    async def upload_archive(self, object_name: str, file_data: BinaryIO,
+                             length: int) -> bool:
+        try:
+            # Архив приватный, в отличие от бакета с отчетами
+            await self._ensure_bucket(Config.ARCHIVE_BUCKET, public=False)
+            file_data.seek(0)
+            await self._put(Config.ARCHIVE_BUCKET, object_name, file_data,
+                            length, "application/vnd.apache.parquet")
+            return True
+        except S3Error as e:
+            logger.error(f"Error while archiving {object_name}: {e}")
+            return False
+
+    async def upload_export(self, object_name: str, file_data: BinaryIO,
+                            length: int,
+                            file_extension: str) -> Optional[str]:
+        """Загрузить выгрузку в приватный бакет и вернуть временную ссылку"""
+        try:
+            await self._ensure_bucket(Config.EXPORT_BUCKET, public=False)
+            file_data.seek(0)
+            await self._put(Config.EXPORT_BUCKET, object_name, file_data,
+                            length,
+                            CONTENT_TYPES.get(file_extension,
+                                              "application/octet-stream"))
+            return await self._run(
+                self.client.presigned_get_object,
+                Config.EXPORT_BUCKET,
+                object_name,
+                expires=timedelta(seconds=Config.EXPORT_LINK_TTL))
+        except S3Error as e:
+            logger.error(f"Error while uploading export {object_name}: {e}")
+            return None
+
+    async def list_archive(self, prefix: str) -> List[str]:
+        def list_objects():
+            if not self.client.bucket_exists(Config.ARCHIVE_BUCKET):
+                return []
+            return [
+                item.object_name for item in self.client.list_objects(
+                    Config.ARCHIVE_BUCKET, prefix=prefix, recursive=True)
+            ]
+
+        try:
+            return await self._run(list_objects)
+        except S3Error as e:
+            logger.error(f"Error while listing archive: {e}")
+            return []
+
+    async def read_archive(self, object_name: str,
+                           reader: Callable[[BinaryIO], T]) -> Optional[T]:
+        """Прочитать архив функцией reader, не скачивая объект целиком:
+        файл отдает только запрошенные диапазоны байт"""
+
+        def read():
+            size = self.client.stat_object(Config.ARCHIVE_BUCKET,
+                                           object_name).size
+            with io.BufferedReader(_RangedObject(self.client,
+                                                 Config.ARCHIVE_BUCKET,
+                                                 object_name, size),
+                                   buffer_size=ARCHIVE_READ_SIZE) as file:
+                return reader(file)
+
+        try:
+            return await self._run(read)
+        except S3Error as e:
+            logger.error(f"Error while reading archive {object_name}: {e}")
+            return None
+
+
+minio_service = MinioService()
@@ -0,0 +1,294 @@
+"""Исходящие запросы к Telegram с учетом flood control.
+
+Все запросы бота с chat_id (сообщения, правки, документы) проходят через
+OutboundScheduler - request middleware сессии бота, поэтому хендлеры
+по-прежнему вызывают message.answer и edit_text напрямую. Запрос ждет
+токен в бакете своего чата и в общем бакете бота - одном на все процессы
+и реплики, он хранится в Redis; при 429 чат и общий бакет ставятся на
+паузу на retry_after, и запрос повторяется. Ожидающие токен
+обслуживаются по приоритету: ответы пользователям раньше фоновых задач,
+фоновые задачи раньше рассылок.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from config import Config
+from services.logger import logger
+
+INTERACTIVE = 0
+BACKGROUND = 1
+BULK = 2
+
+# Лимит Telegram для групп - 20 сообщений в минуту
+GROUP_RATE = 20 / 60
+# Бакеты чатов, из которых давно не отправляли, вытесняются
+MAX_CHAT_BUCKETS = 10000
+GLOBAL_BUCKET_KEY = "outbound:global"
+GLOBAL_PAUSE_KEY = "outbound:global:paused"
+# Столько секунд после ошибки Redis общий бакет не опрашивается
+REDIS_RETRY_SECONDS = 5
+
+# Взять токен из общего бакета: 0 - токен взят, иначе сколько мс ждать.
+# Время берется у Redis, чтобы часы процессов не расходились
+TAKE_SCRIPT = """
+local paused = redis.call('pttl', KEYS[2])
+if paused > 0 then
+    return paused
+end
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local time = redis.call('time')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local state = redis.call('hmget', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate / 1000)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'updated', now)
+redis.call('pexpire', KEYS[1], math.ceil(capacity * 1000 / rate) + 1000)
+return wait
+"""
+# Продлить паузу, но не сократить уже установленную
+PAUSE_SCRIPT = """
+if redis.call('pttl', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('set', KEYS[1], 1, 'px', ARGV[1])
+end
+return 0
+"""
+
+T = TypeVar('T')
+
+_priority: ContextVar[int] = ContextVar('outbound_priority',
+                                        default=INTERACTIVE)
+
+
+class TokenBucket:
+    """Бакет на rate токенов в секунду с запасом capacity.
+
+    Ожидающие получают токены по приоритету, при равном - в порядке
+    очереди.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._waiters = []
+        self._order = itertools.count()
+        self._pump: Optional[asyncio.Task] = None
+
+    def _refill(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return now
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until,
+                                time.monotonic() + seconds)
+
+    @property
+    def idle(self) -> bool:
+        self._refill()
+        return not self._waiters and self.tokens >= self.capacity
+
+    def _delay(self) -> float:
+        now = self._refill()
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        return 0.0
+
+    async def _take(self) -> float:
+        """Взять токен: 0 - взят, иначе сколько секунд ждать"""
+        delay = self._delay()
+        if delay == 0:
+            self.tokens -= 1
+        return delay
+
+    async def acquire(self, priority: int = INTERACTIVE) -> None:
+        if not self._waiters and await self._take() == 0:
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run())
+        await future
+
+    async def _run(self) -> None:
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done():
+                # Запрос отменили, пока он ждал
+                heapq.heappop(self._waiters)
+                continue
+            delay = await self._take()
+            if delay > 0:
+                # После паузы снова смотрим на голову очереди: за это
+                # время мог прийти запрос важнее
+                await asyncio.sleep(delay)
+                continue
+            heapq.heappop(self._waiters)
+            future.set_result(None)
+
+
+class SharedTokenBucket(TokenBucket):
+    """Бакет, общий для всех процессов, в Redis.
+
+    Очередь ожидающих в каждом процессе своя, по приоритету. Если Redis
+    недоступен, процесс ограничивает себя локальным бакетом с тем же
+    rate, чтобы отправка не вставала.
+    """
+
+    def __init__(self, redis_client: Redis, rate: float, capacity: float):
+        super().__init__(rate, capacity)
+        self.redis_client = redis_client
+        self._redis_retry_at = 0.0
+
+    async def _take(self) -> float:
+        if time.monotonic() < self._redis_retry_at:
+            return await super()._take()
+        try:
+            wait_ms = await self.redis_client.eval(TAKE_SCRIPT, 2,
+                                                   GLOBAL_BUCKET_KEY,
+                                                   GLOBAL_PAUSE_KEY,
+                                                   self.rate, self.capacity)
+        except RedisError as e:
+            logger.warning(f"Shared outbound bucket unavailable, "
+                           f"using local limit: {e}")
+            self._redis_retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+            return await super()._take()
+        return int(wait_ms) / 1000
+
+    async def pause_all(self, seconds: float) -> None:
+        """Пауза для всех процессов бота"""
+        self.pause(seconds)
+        try:
+            await self.redis_client.eval(PAUSE_SCRIPT, 1, GLOBAL_PAUSE_KEY,
+                                         int(seconds * 1000))
+        except RedisError as e:
+            logger.warning(f"Cannot share flood control pause: {e}")
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Лимиты исходящих запросов: бакеты чатов в процессе, общий бакет -
+    в Redis. Используйте общий экземпляр outbound"""
+
+    def __init__(self):
+        self._global = SharedTokenBucket(
+            Redis(host=Config.REDIS_HOST,
+                  port=Config.REDIS_PORT,
+                  db=0,
+                  password=Config.REDIS_USER_PASSWORD,
+                  username=Config.REDIS_USER,
+                  decode_responses=False), Config.OUTBOUND_GLOBAL_RATE,
+            Config.OUTBOUND_GLOBAL_RATE)
+        self._chats: OrderedDict[int, TokenBucket] = OrderedDict()
+        self._background: set[asyncio.Task] = set()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = (TokenBucket(GROUP_RATE, 1) if chat_id < 0 else
+                      TokenBucket(Config.OUTBOUND_CHAT_RATE,
+                                  Config.OUTBOUND_CHAT_BURST))
+            self._chats[chat_id] = bucket
+            if len(self._chats) > MAX_CHAT_BUCKETS:
+                oldest, oldest_bucket = next(iter(self._chats.items()))
+                if oldest_bucket.idle:
+                    del self._chats[oldest]
+        self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def __call__(self,
+                       make_request: NextRequestMiddlewareType[TelegramType],
+                       bot: Bot, method: TelegramMethod[TelegramType]
+                       ) -> Response[TelegramType]:
+        chat_id = getattr(method, 'chat_id', None)
+        if not isinstance(chat_id, int):
+            # getUpdates, answerCallbackQuery и запросы по @username
+            # идут без ожидания
+            return await make_request(bot, method)
+
+        priority = _priority.get()
+        chat = self._chat_bucket(chat_id)
+        retries = 0
+        while True:
+            await chat.acquire(priority)
+            await self._global.acquire(priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                retries += 1
+                if retries > Config.OUTBOUND_MAX_RETRIES:
+                    raise
+                logger.warning(f"Flood control for chat {chat_id}: "
+                               f"retry {method.__api_method__} "
+                               f"after {e.retry_after}s")
+                chat.pause(e.retry_after)
+                # 429 может относиться и к общему лимиту бота: остальные
+                # чаты тоже ждут, иначе Telegram продлит блокировку
+                await self._global.pause_all(e.retry_after)
+
+    @staticmethod
+    @contextmanager
+    def priority(priority: int):
+        """Приоритет запросов, отправленных внутри блока"""
+        token = _priority.set(priority)
+        try:
+            yield
+        finally:
+            _priority.reset(token)
+
+    async def send(self,
+                   request: Awaitable[T],
+                   priority: int = INTERACTIVE,
+                   wait: bool = True) -> Optional[T]:
+        """Выполнить запрос к боту с приоритетом priority.
+
+        wait=False - не ждать доставки: запрос уходит в фоне, ошибка
+        только логируется, результат - None.
+        """
+
+        async def run():
+            with self.priority(priority):
+                return await request
+
+        if wait:
+            return await run()
+
+        task = asyncio.create_task(run())
+        self._background.add(task)
+        task.add_done_callback(self._forget)
+        return None
+
+    def _forget(self, task: asyncio.Task) -> None:
+        self._background.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Background send failed: {task.exception()}")
+
+
+outbound = OutboundScheduler()
@@ -0,0 +1,177 @@
+import asyncio
+from dataclasses import dataclass, asdict
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+
+from db.database import get_async_session
+from repositories.dictionary_repository import DictionaryRepository
+from repositories.question_repository import CaseRepository, QuestionRepository
+from services.logger import logger
+
+THEORY = "Теория"
+PRACTICE = "Практика"
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogQuestion:
+    """Неизменяемая копия строки dama_questions"""
+    id: int
+    dama_role_name: str
+    dama_competence_name: str
+    question_type: str
+    question: str
+    question_answer: str
+    dama_knowledge_area: Optional[str]
+    dama_main_job: Optional[str]
+    difficulty: Optional[float] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogCase:
+    """Неизменяемая копия строки dama_cases"""
+    id: int
+    dama_role_name: str
+    dama_competence_name: str
+    dama_main_job: str
+    situation: str
+    case_task: str
+    case_answer: str
+    dama_knowledge_area: Optional[str]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def render_menu(items: Iterable[str]) -> str:
+    return "\n".join(f"{i + 1}. {item}" for i, item in enumerate(items))
+
+
+@dataclass(frozen=True)
+class QuestionCatalog:
+    """Снимок банка вопросов, проиндексированный по роли и компетенции"""
+    roles: Tuple[str, ...]
+    roles_menu: str
+    competencies: Mapping[str, Tuple[str, ...]]
+    competencies_menus: Mapping[str, str]
+    questions: Mapping[Tuple[str, str, str], Tuple[CatalogQuestion, ...]]
+    question_ids: Mapping[Tuple[str, str, str], Tuple[int, ...]]
+    questions_by_id: Mapping[int, CatalogQuestion]
+    cases: Mapping[Tuple[str, str], Tuple[CatalogCase, ...]]
+
+    @classmethod
+    def empty(cls) -> 'QuestionCatalog':
+        return cls.build([], [], [], [])
+
+    @classmethod
+    def build(cls, roles: Iterable[str],
+              competencies: Iterable[Tuple[str, str]],
+              questions: Iterable[CatalogQuestion],
+              cases: Iterable[CatalogCase]) -> 'QuestionCatalog':
+        role_names = tuple(sorted({role for role in roles if role}))
+
+        comps_by_role: Dict[str, set] = {}
+        for role, comp in competencies:
+            if role and comp:
+                comps_by_role.setdefault(role, set()).add(comp)
+        comps = {
+            role: tuple(sorted(names))
+            for role, names in comps_by_role.items()
+        }
+
+        # Банк дозагружается из Excel при каждом старте, поэтому одинаковые
+        # вопросы могут встречаться несколько раз: оставляем первый по id
+        by_stratum: Dict[Tuple[str, str, str], list] = {}
+        seen = set()
+        for question in sorted(questions, key=lambda q: q.id):
+            stratum = (question.dama_role_name,
+                       question.dama_competence_name, question.question_type)
+            if (stratum, question.question) in seen:
+                continue
+            seen.add((stratum, question.question))
+            by_stratum.setdefault(stratum, []).append(question)
+
+        cases_by_pair: Dict[Tuple[str, str], list] = {}
+        for case in sorted(cases, key=lambda c: c.id):
+            cases_by_pair.setdefault(
+                (case.dama_role_name, case.dama_competence_name),
+                []).append(case)
+
+        frozen_questions = {k: tuple(v) for k, v in by_stratum.items()}
+
+        return cls(
+            roles=role_names,
+            roles_menu=render_menu(role_names),
+            competencies=MappingProxyType(comps),
+            competencies_menus=MappingProxyType(
+                {role: render_menu(names)
+                 for role, names in comps.items()}),
+            questions=MappingProxyType(frozen_questions),
+            question_ids=MappingProxyType({
+                k: tuple(q.id for q in v)
+                for k, v in frozen_questions.items()
+            }),
+            questions_by_id=MappingProxyType({
+                q.id: q
+                for stratum in frozen_questions.values() for q in stratum
+            }),
+            cases=MappingProxyType(
+                {k: tuple(v)
+                 for k, v in cases_by_pair.items()}))
+
+    def get_competencies(self, role: str) -> Tuple[str, ...]:
+        return self.competencies.get(role, ())
+
+    def get_competencies_menu(self, role: str) -> str:
+        return self.competencies_menus.get(role, "")
+
+    def get_questions(self, role: str, competence: str,
+                      question_type: str) -> Tuple[CatalogQuestion, ...]:
+        return self.questions.get((role, competence, question_type), ())
+
+    def get_question_ids(self, role: str, competence: str,
+                         question_type: str) -> Tuple[int, ...]:
+        return self.question_ids.get((role, competence, question_type), ())
+
+    def get_case(self, role: str, competence: str) -> Optional[CatalogCase]:
+        cases = self.cases.get((role, competence), ())
+        return cases[0] if cases else None
+
+
+class QuestionCatalogService:
+    """Держит текущий снимок банка вопросов и атомарно подменяет его"""
+
+    def __init__(self):
+        self._catalog = QuestionCatalog.empty()
+        self._reload_lock = asyncio.Lock()
+
+    def get(self) -> QuestionCatalog:
+        return self._catalog
+
+    async def reload(self) -> QuestionCatalog:
+        async with self._reload_lock:
+            catalog = await self._load()
+            self._catalog = catalog
+            logger.info(
+                f"Question catalog loaded: {len(catalog.roles)} roles, "
+                f"{len(catalog.questions_by_id)} questions")
+            return catalog
+
+    async def _load(self) -> QuestionCatalog:
+        async with get_async_session() as session:
+            dictionaries = DictionaryRepository(session)
+            roles = await dictionaries.get_catalog_roles()
+            competencies = await dictionaries.get_catalog_competencies()
+            questions = await QuestionRepository(session).get_all_rows()
+            cases = await CaseRepository(session).get_all_rows()
+
+        return QuestionCatalog.build(
+            roles=roles,
+            competencies=competencies,
+            questions=[CatalogQuestion(**row._mapping) for row in questions],
+            cases=[CatalogCase(**row._mapping) for row in cases])
+
+
+question_catalog = QuestionCatalogService()
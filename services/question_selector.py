@@ -0,0 +1,117 @@
+import random
+from dataclasses import dataclass, field
+from typing import Collection, Dict, Iterator, List, Mapping, Optional, Sequence
+
+from config import Config
+from services.question_catalog import CatalogCase, CatalogQuestion, QuestionCatalog, THEORY, PRACTICE
+
+
+def _draw_without_replacement(ids: Sequence[int],
+                              rng: random.Random) -> Iterator[int]:
+    """Ленивый Фишер-Йетс: каждый следующий id за O(1), без копии массива"""
+    n = len(ids)
+    swapped: Dict[int, int] = {}
+    for i in range(n):
+        j = rng.randrange(i, n)
+        picked = swapped.get(j, j)
+        swapped[j] = swapped.get(i, i)
+        yield ids[picked]
+
+
+@dataclass
+class SelectionPlan:
+    """Квоты на один экзамен"""
+    type_quotas: Mapping[str, int] = field(default_factory=lambda: {
+        THEORY: Config.THEORY_QUESTIONS,
+        PRACTICE: Config.PRACTICE_QUESTIONS
+    })
+    knowledge_area_quota: int = field(
+        default_factory=lambda: Config.KNOWLEDGE_AREA_QUOTA)
+
+    @property
+    def total(self) -> int:
+        return sum(self.type_quotas.values())
+
+
+class QuestionSelector:
+    """Стратифицированная случайная выборка вопросов из снимка банка"""
+
+    def __init__(self, catalog: QuestionCatalog):
+        self.catalog = catalog
+
+    def select(self,
+               role: str,
+               competence: str,
+               plan: Optional[SelectionPlan] = None,
+               seed: Optional[int | str] = None,
+               recent: Collection[int] = ()) -> List[CatalogQuestion]:
+        """Выбрать вопросы по квотам типов и областей знаний.
+
+        Недавно виденные вопросы берутся только если без них квоту не набрать,
+        а недобор одного типа добирается вопросами другого.
+        """
+        plan = plan or SelectionPlan()
+        rng = random.Random(seed)
+        area_counts: Dict[Optional[str], int] = {}
+        chosen: Dict[str, List[CatalogQuestion]] = {
+            question_type: []
+            for question_type in plan.type_quotas
+        }
+        taken = set()
+
+        def fill(question_type: str, limit: int, allow_recent: bool,
+                 respect_areas: bool) -> None:
+            bucket = chosen.setdefault(question_type, [])
+            if len(bucket) >= limit:
+                return
+            ids = self.catalog.get_question_ids(role, competence,
+                                                question_type)
+            for question_id in _draw_without_replacement(ids, rng):
+                if question_id in taken:
+                    continue
+                if not allow_recent and question_id in recent:
+                    continue
+                question = self.catalog.questions_by_id[question_id]
+                area = question.dama_knowledge_area
+                if (respect_areas and plan.knowledge_area_quota
+                        and area_counts.get(area, 0) >=
+                        plan.knowledge_area_quota):
+                    continue
+                bucket.append(question)
+                taken.add(question_id)
+                area_counts[area] = area_counts.get(area, 0) + 1
+                if len(bucket) >= limit:
+                    return
+
+        # Ослабляем ограничения по очереди, пока квоты не набраны
+        for allow_recent, respect_areas in ((False, True), (True, True),
+                                            (True, False)):
+            for question_type, quota in plan.type_quotas.items():
+                fill(question_type, quota, allow_recent, respect_areas)
+
+        missing = plan.total - len(taken)
+        if missing > 0:
+            for question_type in plan.type_quotas:
+                fill(question_type,
+                     len(chosen[question_type]) + missing,
+                     allow_recent=True,
+                     respect_areas=False)
+                missing = plan.total - len(taken)
+                if missing <= 0:
+                    break
+
+        return [
+            question for question_type in plan.type_quotas
+            for question in chosen[question_type]
+        ]
+
+    def select_case(self,
+                    role: str,
+                    competence: str,
+                    seed: Optional[int | str] = None) -> Optional[CatalogCase]:
+        """Выбрать один кейс для роли и компетенции"""
+        cases = self.catalog.cases.get((role, competence), ())
+        if not cases:
+            return None
+        rng = random.Random(None if seed is None else f"{seed}:case")
+        return cases[rng.randrange(len(cases))]
@@ -0,0 +1,86 @@
+import asyncio
+import uuid
+from typing import Awaitable, Callable
+
+from redis.asyncio import Redis
+
+from services.logger import logger
+
+# Продлить или снять аренду может только ее владелец
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisLease:
+    """Аренда ключа в Redis с TTL: у ключа в каждый момент один владелец.
+
+    Владелец продлевает аренду каждые ttl / 3 секунды. Если процесс
+    завис или упал, ключ истекает и аренду берет другой процесс; если
+    продлить не удалось, работа владельца отменяется, чтобы два процесса
+    не работали одновременно.
+    """
+
+    def __init__(self, redis_client: Redis, key: str, ttl: float):
+        self.redis_client = redis_client
+        self.key = key
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+
+    async def acquire(self) -> bool:
+        return bool(await self.redis_client.set(self.key,
+                                                self.token,
+                                                nx=True,
+                                                px=int(self.ttl * 1000)))
+
+    async def renew(self) -> bool:
+        return bool(await self.redis_client.eval(RENEW_SCRIPT, 1, self.key,
+                                                 self.token,
+                                                 int(self.ttl * 1000)))
+
+    async def release(self) -> None:
+        await self.redis_client.eval(RELEASE_SCRIPT, 1, self.key, self.token)
+
+    async def _keep(self) -> None:
+        loop = asyncio.get_running_loop()
+        renewed_at = loop.time()
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                if not await self.renew():
+                    logger.warning(f"Lease {self.key} lost")
+                    return
+                renewed_at = loop.time()
+            except Exception as e:
+                logger.error(f"Error renewing lease {self.key}: {e}")
+                # Redis недоступен дольше TTL: ключ мог уже взять другой
+                if loop.time() - renewed_at >= self.ttl:
+                    return
+
+    async def hold(self, work: Callable[[], Awaitable[object]]) -> None:
+        """Выполнять work, пока аренда за нами. Аренда уже должна быть
+        взята через acquire"""
+        keeper = asyncio.create_task(self._keep())
+        worker = asyncio.create_task(work())
+        try:
+            await asyncio.wait({keeper, worker},
+                               return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (keeper, worker):
+                task.cancel()
+            await asyncio.gather(keeper, worker, return_exceptions=True)
+            try:
+                await self.release()
+            except Exception as e:
+                logger.error(f"Error releasing lease {self.key}: {e}")
+        if worker.done() and not worker.cancelled() and worker.exception():
+            raise worker.exception()
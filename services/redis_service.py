@@ -1,17 +1,23 @@
 import json
-from typing import Dict, List, Optional
+import time
+from typing import Dict, Iterable, List, Optional, Set
 
 from numpy.f2py.auxfuncs import throw_error
 from redis.asyncio import Redis
 from sqlalchemy import false
 
 from config import Config
-from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.database import get_async_session, get_selected_ai_creator
-from db.models import Models, AiSettings
+from db.database import session_scope
+from repositories.ai_repository import AiCreatorRepository, AiSettingsRepository, ModelRepository
 from services.logger import logger
 
+# Счетчик пользователей для админки допускает отставание на минуту
+USERS_COUNT_TTL = 60
+# file_id Telegram не истекает, TTL только чтобы не копить ключи
+REPORT_FILE_ID_TTL = 90 * 86400
+
 
 class RedisService:
 
@@ -96,6 +102,82 @@ class RedisService:
             logger.error(f"Error clearing user metadata: {e}")
             return 0
 
+    async def save_recent_questions(self, user_id: int,
+                                    question_ids: Iterable[int]) -> bool:
+        try:
+            key = f"user:{user_id}:recent_questions"
+            now = time.time()
+            window = Config.RECENT_QUESTIONS_DAYS * 86400
+            mapping = {str(question_id): now for question_id in question_ids}
+            if not mapping:
+                return True
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.zadd(key, mapping)
+                pipe.zremrangebyscore(key, 0, now - window)
+                pipe.expire(key, window)
+                await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error saving recent questions: {e}")
+            return False
+
+    async def load_recent_questions(self, user_id: int) -> Set[int]:
+        try:
+            key = f"user:{user_id}:recent_questions"
+            since = time.time() - Config.RECENT_QUESTIONS_DAYS * 86400
+            members = await self.redis_client.zrangebyscore(key, since, "+inf")
+            return {int(member) for member in members}
+        except Exception as e:
+            logger.error(f"Error loading recent questions: {e}")
+            return set()
+
+    async def save_users_count(self, role: Optional[str], count: int) -> bool:
+        try:
+            key = f"users:count:{role or 'all'}"
+            result = await self.redis_client.set(key, count,
+                                                 ex=USERS_COUNT_TTL)
+            return bool(result)
+        except Exception as e:
+            logger.error(f"Error saving users count: {e}")
+            return False
+
+    async def load_users_count(self, role: Optional[str]) -> Optional[int]:
+        try:
+            key = f"users:count:{role or 'all'}"
+            data = await self.redis_client.get(key)
+            return int(data) if data is not None else None
+        except Exception as e:
+            logger.error(f"Error loading users count: {e}")
+            return None
+
+    async def save_report_file_id(self, object_name: str,
+                                  file_id: str) -> bool:
+        try:
+            key = f"report:{object_name}:file_id"
+            result = await self.redis_client.set(key, file_id,
+                                                 ex=REPORT_FILE_ID_TTL)
+            return bool(result)
+        except Exception as e:
+            logger.error(f"Error saving report file_id: {e}")
+            return False
+
+    async def load_report_file_id(self, object_name: str) -> Optional[str]:
+        try:
+            key = f"report:{object_name}:file_id"
+            data = await self.redis_client.get(key)
+            return data.decode() if data else None
+        except Exception as e:
+            logger.error(f"Error loading report file_id: {e}")
+            return None
+
+    async def clear_report_file_id(self, object_name: str) -> int:
+        try:
+            return await self.redis_client.delete(
+                f"report:{object_name}:file_id")
+        except Exception as e:
+            logger.error(f"Error clearing report file_id: {e}")
+            return 0
+
     async def save_openai_token(self, token: str) -> bool:
         try:
             key = "openai:token"
@@ -105,7 +187,8 @@ class RedisService:
             logger.error(f"Error saving OpenAI token in redis: {e}")
             return False
 
-    async def load_openai_token(self) -> Optional[str]:
+    async def load_openai_token(
+            self, session: Optional[AsyncSession] = None) -> Optional[str]:
         try:
             key = "openai:token"
             redis_token = await self.redis_client.get(key)
@@ -114,9 +197,11 @@ class RedisService:
                 return redis_token.decode('utf-8') if isinstance(
                     redis_token, bytes) else redis_token
 
-            ai_creator = await get_selected_ai_creator()
-            if ai_creator:
-                token = str(ai_creator.token)
+            async with session_scope(session) as session:
+                connection = await AiCreatorRepository(
+                    session).get_selected_connection()
+            if connection:
+                token = str(connection.token)
                 await self.save_openai_token(token)
                 return token
 
@@ -135,7 +220,8 @@ class RedisService:
             logger.error(f"Error saving model in redis: {e}")
             return False
 
-    async def load_selected_ai_model(self) -> Optional[str]:
+    async def load_selected_ai_model(
+            self, session: Optional[AsyncSession] = None) -> Optional[str]:
         try:
             key = "openai:model"
             redis_model = await self.redis_client.get(key)
@@ -144,12 +230,9 @@ class RedisService:
                 return redis_model.decode('utf-8') if isinstance(
                     redis_model, bytes) else redis_model
 
-            async with get_async_session() as session:
-                result = await session.execute(
-                    select(Models).where(Models.selected == True))
-                selected_model = result.scalar_one_or_none()
-                if selected_model:
-                    model_name = str(selected_model.name)
+            async with session_scope(session) as session:
+                model_name = await ModelRepository(session).get_selected_name()
+                if model_name:
                     await self.save_selected_ai_model(model_name)
                     return model_name
 
@@ -167,7 +250,7 @@ class RedisService:
             logger.error(f"Error saving url in redis: {e}")
             return False
 
-    async def load_selected_url(self):
+    async def load_selected_url(self, session: Optional[AsyncSession] = None):
         try:
             key = "openai:url"
             redis_url = await self.redis_client.get(key)
@@ -175,9 +258,11 @@ class RedisService:
                 return redis_url.decode('utf-8') if isinstance(
                     redis_url, bytes) else redis_url
 
-            ai_creator = await get_selected_ai_creator()
-            if ai_creator:
-                url = str(ai_creator.url)
+            async with session_scope(session) as session:
+                connection = await AiCreatorRepository(
+                    session).get_selected_connection()
+            if connection:
+                url = str(connection.url)
                 await self.save_selected_url(url)
                 return url
             return None
@@ -193,7 +278,8 @@ class RedisService:
             logger.error(f"Error saving model temperature in redis: {e}")
             return False
 
-    async def load_model_temperature(self) -> Optional[float]:
+    async def load_model_temperature(
+            self, session: Optional[AsyncSession] = None) -> Optional[float]:
         try:
             redis_temp = await self.redis_client.get("openai:model_temperature"
                                                      )
@@ -204,9 +290,9 @@ class RedisService:
                 except (ValueError, TypeError) as e:
                     logger.warning(f"Invalid temperature value in Redis: {e}")
 
-            async with get_async_session() as session:
-                result = await session.execute(select(AiSettings.temperature))
-                temp_value = result.scalar_one_or_none()
+            async with session_scope(session) as session:
+                values = await AiSettingsRepository(session).get_values()
+                temp_value = values.temperature if values else None
 
                 if temp_value is not None:
                     try:
@@ -229,18 +315,18 @@ class RedisService:
             logger.error(f"Error saving prompt in redis: {e}")
             return False
 
-    async def load_prompt(self) -> Optional[str]:
+    async def load_prompt(self,
+                          session: Optional[AsyncSession] = None) -> Optional[str]:
         try:
             redis_temp = await self.redis_client.get("prompt")
             if redis_temp:
                 return str(redis_temp.decode('utf-8')) if isinstance(
                     redis_temp, bytes) else str(redis_temp)
 
-            async with get_async_session() as session:
-                result = await session.execute(select(AiSettings))
-                ai_settings = result.scalar_one_or_none()
-                if ai_settings:
-                    prompt = str(ai_settings.prompt)
+            async with session_scope(session) as session:
+                values = await AiSettingsRepository(session).get_values()
+                if values:
+                    prompt = str(values.prompt)
                     await self.save_prompt(prompt)
                     return prompt
 
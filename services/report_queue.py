@@ -0,0 +1,215 @@
+"""Фоновая обработка завершенного теста через Redis Streams.
+
+Хендлер кладет в поток снимок завершенного теста и сразу отвечает
+кандидату, а воркеры сохраняют результаты, отправляют Excel-отчет и
+показывают прогресс, редактируя одно сообщение в чате. Задача подтверждается (XACK) только
+после успеха; упавшую или брошенную остановленной репликой задачу через
+REPORT_JOB_RETRY_SECONDS забирает любой воркер (XAUTOCLAIM). Повтор
+безопасен: save_test_results идемпотентна по exam_id, а уже отправленный
+отчет узнается по file_id в Redis.
+"""
+import asyncio
+import json
+import os
+import socket
+from typing import Dict
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+from config import Config
+from db.database import session_scope
+from services.keyboard import build_report_keyboard
+from services.logger import logger
+from services.outbound import BACKGROUND, outbound
+from services.redis_service import RedisService
+from services.report_service import ReportService
+from services.test_service import save_test_results
+
+STREAM = "jobs:reports"
+GROUP = "report-workers"
+ATTEMPTS = "jobs:reports:attempts"
+DEAD_LETTER = "jobs:reports:dead"
+BLOCK_MS = 5000
+
+
+def format_result_summary(result: Dict) -> str:
+    return (
+        "<b>Тестирование завершено!</b>\n\n"
+        f"<b>Средний балл:</b> {result['avg_score']:.2f}\n"
+        f"<b>Уровень эксперта:</b> {'достигнут' if result['is_expert'] else 'не достигнут'}\n\n"
+        "Отчет в Excel отправлен выше, его можно скачать и в другом формате:")
+
+
+class ReportJobQueue:
+    """Очередь задач сохранения результатов. Используйте общий экземпляр
+    report_queue"""
+
+    def __init__(self):
+        self.redis_client = Redis(host=Config.REDIS_HOST,
+                                  port=Config.REDIS_PORT,
+                                  db=0,
+                                  password=Config.REDIS_USER_PASSWORD,
+                                  username=Config.REDIS_USER,
+                                  decode_responses=False)
+        self.redis_service = RedisService()
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._tasks: list[asyncio.Task] = []
+
+    async def enqueue(self, exam: Dict, chat_id: int, message_id: int) -> str:
+        job = {'exam': exam, 'chat_id': chat_id, 'message_id': message_id}
+        job_id = await self.redis_client.xadd(
+            STREAM, {'job': json.dumps(job, ensure_ascii=False)})
+        logger.info(f"Queued report job {job_id.decode()} "
+                    f"for exam {exam['exam_id']}")
+        return job_id.decode()
+
+    async def _ensure_group(self) -> None:
+        try:
+            await self.redis_client.xgroup_create(STREAM, GROUP, id='0',
+                                                  mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    async def _next(self):
+        # Сначала задачи, которые давно не подтверждены: упавшие попытки
+        # и задачи остановленных реплик
+        claimed = await self.redis_client.xautoclaim(
+            STREAM,
+            GROUP,
+            self.consumer,
+            min_idle_time=Config.REPORT_JOB_RETRY_SECONDS * 1000,
+            start_id='0-0',
+            count=1)
+        if claimed[1]:
+            return claimed[1][0]
+
+        response = await self.redis_client.xreadgroup(GROUP,
+                                                      self.consumer,
+                                                      {STREAM: '>'},
+                                                      count=1,
+                                                      block=BLOCK_MS)
+        return response[0][1][0] if response else None
+
+    @staticmethod
+    async def _progress(bot: Bot, job: Dict, text: str,
+                        reply_markup=None) -> bool:
+        try:
+            await bot.edit_message_text(text,
+                                        chat_id=job['chat_id'],
+                                        message_id=job['message_id'],
+                                        reply_markup=reply_markup)
+            return True
+        except TelegramBadRequest as e:
+            # Сообщение удалено или текст не изменился - не повод
+            # повторять задачу
+            logger.warning(f"Cannot update report progress: {e}")
+            return False
+
+    async def _finish(self, job_id: bytes) -> None:
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.xack(STREAM, GROUP, job_id)
+            pipe.xdel(STREAM, job_id)
+            pipe.hdel(ATTEMPTS, job_id)
+            await pipe.execute()
+
+    async def _send_report(self, bot: Bot, job: Dict,
+                           test_result_id: int) -> None:
+        async with session_scope() as session:
+            reports = ReportService(session)
+            report = await reports.find_report(test_result_id)
+        # Рендер и загрузка сессию не используют: соединение с БД на это
+        # время возвращаем в пул
+        if report is None:
+            raise LookupError(f"Test result {test_result_id} not found")
+        if await self.redis_service.load_report_file_id(report.object_name):
+            # Отправлен в прошлой попытке
+            return
+
+        content = await reports.load_cached(report)
+        fresh = content is None
+        if fresh:
+            content = await reports.render(report)
+        stages = [
+            bot.send_document(
+                job['chat_id'],
+                BufferedInputFile(content, filename=report.file_name),
+                caption="Отчет об оценке компетенций DAMA")
+        ]
+        if fresh:
+            # Отправка в Telegram и сохранение в MinIO друг от друга не
+            # зависят
+            stages.append(reports.store(report, content))
+        sent, *_ = await asyncio.gather(*stages)
+        if sent.document:
+            await self.redis_service.save_report_file_id(
+                report.object_name, sent.document.file_id)
+
+    async def _process(self, bot: Bot, job_id: bytes, fields: Dict) -> None:
+        attempt = await self.redis_client.hincrby(ATTEMPTS, job_id, 1)
+        job = json.loads(fields[b'job'])
+        exam_id = job['exam']['exam_id']
+        retry = ("" if attempt == 1 else
+                 f" (попытка {attempt} из {Config.REPORT_JOB_MAX_ATTEMPTS})")
+
+        try:
+            await self._progress(bot, job, f"⏳ Сохраняю результаты...{retry}")
+            result = await save_test_results(job['exam'])
+            await self._progress(bot, job, f"⏳ Готовлю отчет...{retry}")
+            await self._send_report(bot, job, result['test_result_id'])
+        except Exception as e:
+            logger.error(f"Report job {job_id.decode()} for exam {exam_id} "
+                         f"failed (attempt {attempt}): {e}")
+            if attempt < Config.REPORT_JOB_MAX_ATTEMPTS:
+                # Не подтверждаем: задачу заберет XAUTOCLAIM
+                return
+            await self.redis_client.xadd(DEAD_LETTER, {
+                'job': fields[b'job'],
+                'error': str(e)
+            })
+            await self._progress(
+                bot, job, "Произошла ошибка при сохранении результатов.\n"
+                "Пожалуйста передайте результаты тестирования администратору!")
+            await self._finish(job_id)
+            return
+
+        summary = format_result_summary(result)
+        keyboard = build_report_keyboard([result['test_result_id']])
+        if not await self._progress(bot, job, summary, keyboard):
+            await bot.send_message(job['chat_id'], summary,
+                                   reply_markup=keyboard)
+        await self._finish(job_id)
+        logger.info(f"Processed report job {job_id.decode()}: test result "
+                    f"{result['test_result_id']} for exam {exam_id}")
+
+    async def _worker(self, bot: Bot) -> None:
+        # Сообщения воркеров уступают ответам на апдейты
+        with outbound.priority(BACKGROUND):
+            while True:
+                try:
+                    message = await self._next()
+                    if message:
+                        await self._process(bot, *message)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Report worker error: {e}")
+                    await asyncio.sleep(1)
+
+    async def start(self, bot: Bot) -> None:
+        await self._ensure_group()
+        for _ in range(Config.REPORT_JOB_WORKERS):
+            self._tasks.append(asyncio.create_task(self._worker(bot)))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+
+report_queue = ReportJobQueue()
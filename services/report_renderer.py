@@ -0,0 +1,284 @@
+"""Рендер отчетов вне event loop.
+
+Отчет в каждом формате собирается чистой функцией из неизменяемого
+снимка данных и возвращает байты файла, поэтому рендер можно отдать в пул процессов:
+длинные ответы кандидатов больше не тормозят апдейты остальных.
+"""
+import asyncio
+import csv
+import html
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from config import Config
+from services.logger import logger
+
+
+@dataclass(frozen=True, slots=True)
+class ReportAnswer:
+    """Строка отчета с ответом на вопрос или кейс"""
+    knowledge_area: str
+    question: str
+    user_answer: str
+    recommendations: str
+    score: float
+
+
+@dataclass(frozen=True, slots=True)
+class ReportData:
+    """Все, что нужно для рендера отчета, без обращений к БД и Redis"""
+    tested_at: str
+    user_name: str
+    role: str
+    competence: str
+    avg_score: float
+    is_expert: bool
+    answers: Tuple[ReportAnswer, ...]
+
+
+REPORT_TITLE = "Результаты оценки уровня владения компетенциями по управлению данными в соответствии с фреймворком DAMА"
+META_LABELS = (
+    "Дата и время тестирования",
+    "ФИО тестируемого",
+    "Роль",
+    "Компетенция",
+    "Средняя оценка по компетенции",
+    "Экспертность в управлении данными DAMA (порог экспертности ≥ 4.5)",
+)
+ANSWER_HEADERS = (
+    "Область знаний/Основные работы", "Вопрос", "Пользовательский ответ",
+    "Рекомендуемые материалы для изучения", "Оценка (1-5)"
+)
+COLUMN_WIDTHS = {'A': 35, 'B': 40, 'C': 50, 'D': 50, 'E': 15}
+# Меняется при изменении разметки отчетов: входит в ключ кэша в MinIO
+REPORT_LAYOUT_VERSION = 1
+
+
+def _report_styles():
+    """Стили отчета: создаются один раз на книгу и общие для всех ячеек.
+
+    plain - пустая ячейка таблицы, text - заполненная без рамки,
+    cell - заполненная в рамке. Не заданные атрибуты берутся из
+    стиля книги по умолчанию.
+    """
+    from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+    alignment = Alignment(horizontal='center',
+                          vertical='center',
+                          wrap_text=True)
+    body_font = Font(name='Century Gothic', size=11)
+    fill = PatternFill(start_color='D5FD7B',
+                       end_color='D5FD7B',
+                       fill_type='solid')
+    side = Side(style='thin')
+    border = Border(left=side, right=side, top=side, bottom=side)
+
+    return {
+        'plain': {'alignment': alignment},
+        'text': {'font': body_font, 'alignment': alignment},
+        'cell': {'font': body_font, 'alignment': alignment, 'border': border},
+        'title': {
+            'font': Font(bold=True, name='Century Gothic', size=12),
+            'alignment': alignment,
+            'fill': fill,
+            'border': border
+        },
+        'header': {
+            'font': Font(bold=True, name='Century Gothic', size=11),
+            'alignment': alignment,
+            'fill': fill,
+            'border': border
+        },
+    }
+
+
+def render_xlsx(data: ReportData) -> bytes:
+    """Excel-отчет в потоковом (write-only) режиме openpyxl.
+
+    Строки пишутся сразу в файл книги, без дерева ячеек в памяти.
+    """
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.workbook import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("DAMA Assessment Report")
+    # Индексы стилей в книге вычисляются один раз, ячейки их только
+    # разделяют
+    resolved = {}
+    for name, attributes in _report_styles().items():
+        prototype = WriteOnlyCell(ws)
+        for attribute, value in attributes.items():
+            setattr(prototype, attribute, value)
+        resolved[name] = prototype._style
+    plain, text, cell, title, header = (resolved[name] for name in (
+        'plain', 'text', 'cell', 'title', 'header'))
+
+    def styled(value, style):
+        result = WriteOnlyCell(ws, value=value)
+        result._style = style
+        return result
+
+    def empty_row():
+        return [styled(None, plain) for _ in ANSWER_HEADERS]
+
+    for column, width in COLUMN_WIDTHS.items():
+        ws.column_dimensions[column].width = width
+    ws.merged_cells.add('A1:E1')
+
+    ws.append([styled(REPORT_TITLE, title)] +
+              [styled(None, plain) for _ in ANSWER_HEADERS[1:]])
+    ws.append(empty_row())
+
+    for label, value in zip(META_LABELS, _meta_values(data)):
+        # Пустое значение (в том числе нулевой балл) остается без рамки
+        ws.append([styled(label, cell),
+                   styled(value, cell if value else text)] +
+                  [styled(None, text) for _ in ANSWER_HEADERS[2:]])
+
+    ws.append(empty_row())
+    ws.append([styled(value, header) for value in ANSWER_HEADERS])
+
+    for answer in data.answers:
+        ws.append([
+            styled(answer.knowledge_area, cell),
+            styled(answer.question, cell),
+            styled(answer.user_answer, cell),
+            styled(answer.recommendations, cell),
+            styled(answer.score, cell)
+        ])
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def _meta_values(data: ReportData) -> tuple:
+    return (data.tested_at, data.user_name, data.role, data.competence,
+            data.avg_score, "Да" if data.is_expert else "Нет")
+
+
+def _csv_safe(value):
+    # Ответ кандидата, начинающийся с "=", Excel иначе выполнит как формулу
+    if isinstance(value, str) and value.startswith(('=', '+', '-', '@')):
+        return f"'{value}"
+    return value
+
+
+def render_csv(data: ReportData) -> bytes:
+    """Та же раскладка, что и в Excel. BOM нужен, чтобы Excel открыл
+    кириллицу в UTF-8"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([REPORT_TITLE])
+    writer.writerow([])
+    writer.writerows((label, _csv_safe(value))
+                     for label, value in zip(META_LABELS, _meta_values(data)))
+    writer.writerow([])
+    writer.writerow(ANSWER_HEADERS)
+    writer.writerows(
+        tuple(map(_csv_safe, (answer.knowledge_area, answer.question,
+                              answer.user_answer, answer.recommendations,
+                              answer.score))) for answer in data.answers)
+    return buffer.getvalue().encode('utf-8-sig')
+
+
+HTML_STYLE = (
+    "body{font-family:'Century Gothic',sans-serif;font-size:11pt}"
+    "table{border-collapse:collapse;margin-bottom:16px}"
+    "td,th{border:1px solid #000;padding:4px 8px;text-align:center;"
+    "vertical-align:middle;white-space:pre-wrap}"
+    "th,caption{background:#D5FD7B;font-weight:bold}"
+    "caption{font-size:12pt;border:1px solid #000;padding:4px 8px}")
+
+
+def render_html(data: ReportData) -> bytes:
+    def cells(values, tag='td'):
+        return "".join(f"<{tag}>{html.escape(str(value))}</{tag}>"
+                       for value in values)
+
+    meta = "".join(f"<tr>{cells(row)}</tr>"
+                   for row in zip(META_LABELS, _meta_values(data)))
+    widths = "".join(f'<col style="width:{width * 7}px">'
+                     for width in COLUMN_WIDTHS.values())
+    answers = "".join(
+        "<tr>" + cells((answer.knowledge_area, answer.question,
+                        answer.user_answer, answer.recommendations,
+                        answer.score)) + "</tr>" for answer in data.answers)
+    return (
+        '<!DOCTYPE html><html lang="ru"><head><meta charset="utf-8">'
+        f"<title>{html.escape(REPORT_TITLE)}</title>"
+        f"<style>{HTML_STYLE}</style></head><body>"
+        f"<table><caption>{html.escape(REPORT_TITLE)}</caption>{meta}</table>"
+        f"<table>{widths}<tr>{cells(ANSWER_HEADERS, 'th')}</tr>{answers}"
+        "</table></body></html>").encode('utf-8')
+
+
+RENDERERS = {
+    'xlsx': render_xlsx,
+    'csv': render_csv,
+    'html': render_html,
+}
+
+
+class ReportRenderer:
+    """Пул процессов для рендера отчетов.
+
+    В работе одновременно не больше REPORT_QUEUE_LIMIT отчетов, остальные
+    вызовы ждут свободного места, а не копят задачи в пуле. При
+    REPORT_WORKERS = 0 рендер идет в потоке текущего процесса.
+    Используйте общий экземпляр report_renderer.
+    """
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = asyncio.Semaphore(Config.REPORT_QUEUE_LIMIT)
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: fork процесса с event loop и потоками minio небезопасен
+            self._executor = ProcessPoolExecutor(
+                max_workers=Config.REPORT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def render(self, data: ReportData,
+                     file_format: str = 'xlsx') -> bytes:
+        render = RENDERERS[file_format]
+        if self._slots.locked():
+            logger.warning("Report queue is full, waiting for a free slot")
+        queued_at = time.perf_counter()
+        async with self._slots:
+            started = time.perf_counter()
+            if Config.REPORT_WORKERS > 0:
+                loop = asyncio.get_running_loop()
+                try:
+                    content = await loop.run_in_executor(
+                        self._pool(), render, data)
+                except BrokenProcessPool:
+                    # Упавший воркер ломает весь пул: следующий отчет
+                    # поднимет новый
+                    self._executor = None
+                    raise
+            else:
+                content = await asyncio.to_thread(render, data)
+            finished = time.perf_counter()
+
+        logger.info(f"Report {file_format} rendered in {finished - started:.3f}s "
+                    f"(queued {started - queued_at:.3f}s, "
+                    f"{len(data.answers)} answers, {len(content)} bytes)")
+        return content
+
+    def close(self) -> None:
+        if self._executor is not None:
+            # Без ожидания еще не запустившиеся воркеры пула не выходят, и
+            # процесс зависает на выходе
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+report_renderer = ReportRenderer()
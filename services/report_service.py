@@ -0,0 +1,105 @@
+import hashlib
+import json
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from repositories.report_repository import ReportRepository
+from services.logger import logger
+from services.minio_service import minio_service
+from services.report_renderer import REPORT_LAYOUT_VERSION, RENDERERS, ReportAnswer, ReportData, report_renderer
+
+REPORT_FORMATS = tuple(RENDERERS)
+
+
+@dataclass(frozen=True)
+class ReportRef:
+    """Отчет, найденный по результату: данные и имя объекта в MinIO"""
+    data: ReportData
+    file_format: str
+    object_name: str
+    file_name: str
+
+
+def report_object_name(data: ReportData, file_format: str) -> str:
+    """Имя в MinIO по хэшу содержимого: одинаковые данные и формат -
+    один и тот же объект"""
+    payload = json.dumps([REPORT_LAYOUT_VERSION, file_format, asdict(data)],
+                         ensure_ascii=False,
+                         sort_keys=True)
+    digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    return f"reports/{digest[:2]}/{digest}.{file_format}"
+
+
+def _recommendations(feedback) -> str:
+    recommendations = (feedback or {}).get('recommendations', '')
+    if isinstance(recommendations, list):
+        recommendations = " ".join(recommendations)
+    return recommendations or ''
+
+
+def build_report_data(result: Row, answers) -> ReportData:
+    return ReportData(
+        tested_at=result.test_date.strftime("%Y-%m-%d %H:%M:%S"),
+        user_name=result.candidate_name or '',
+        role=result.role,
+        competence=result.competence,
+        avg_score=result.total_score,
+        is_expert=result.is_expert,
+        answers=tuple(
+            ReportAnswer(knowledge_area=answer.knowledge_area,
+                         question=answer.question,
+                         user_answer=answer.answer_text,
+                         recommendations=_recommendations(answer.feedback),
+                         score=float(answer.score)) for answer in answers))
+
+
+class ReportService:
+    """Отчеты по сохраненным результатам, по запросу.
+
+    Отчет рендерится только при первом запросе в данном формате и
+    кладется в MinIO под хэшем содержимого; повторные запросы админов и
+    самого пользователя отдаются из хранилища без рендера.
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.report_repo = ReportRepository(session)
+
+    async def find_report(self,
+                          test_result_id: int,
+                          file_format: str = 'xlsx',
+                          owner_id: Optional[int] = None
+                          ) -> Optional[ReportRef]:
+        """Отчет в формате file_format, без рендера. owner_id - найти
+        отчет, только если результат принадлежит этому пользователю"""
+        if file_format not in RENDERERS:
+            raise ValueError(f"Unknown report format {file_format}")
+
+        result = await self.report_repo.get_result(test_result_id)
+        if not result or (owner_id is not None and result.user_id != owner_id):
+            return None
+
+        answers = await self.report_repo.get_answers(result)
+        data = build_report_data(result, answers)
+        safe_name = "".join(c for c in data.user_name or 'user'
+                            if c.isalnum() or c in (' ', '_')).rstrip()
+        file_name = (f"DAMA_Report_{safe_name}_"
+                     f"{result.test_date.strftime('%Y%m%d_%H%M%S')}."
+                     f"{file_format}")
+        return ReportRef(data, file_format,
+                         report_object_name(data, file_format), file_name)
+
+    async def load_cached(self, report: ReportRef) -> Optional[bytes]:
+        """Ранее отрендеренный отчет из MinIO или None"""
+        return await minio_service.read_report(report.object_name)
+
+    async def render(self, report: ReportRef) -> bytes:
+        return await report_renderer.render(report.data, report.file_format)
+
+    async def store(self, report: ReportRef, content: bytes) -> None:
+        if not await minio_service.put_report(report.object_name, content,
+                                              report.file_format):
+            # Отчет все равно отдаем, отрендерим снова при следующем запросе
+            logger.warning(f"Report {report.object_name} was not cached")
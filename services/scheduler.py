@@ -0,0 +1,61 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from redis.asyncio import Redis
+
+from config import Config
+from services.logger import logger
+
+
+class DailyScheduler:
+    """Запуск фоновых задач раз в сутки в заданный час (UTC).
+
+    При нескольких репликах бота задачу за конкретный день выполняет
+    только та, что первой взяла ключ в Redis.
+    """
+
+    def __init__(self):
+        self.redis_client = Redis(host=Config.REDIS_HOST,
+                                  port=Config.REDIS_PORT,
+                                  db=0,
+                                  password=Config.REDIS_USER_PASSWORD,
+                                  username=Config.REDIS_USER,
+                                  decode_responses=False)
+        self._tasks: list[asyncio.Task] = []
+
+    @staticmethod
+    def _seconds_until(hour: int) -> float:
+        now = datetime.utcnow()
+        run_at = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+        if run_at <= now:
+            run_at += timedelta(days=1)
+        return (run_at - now).total_seconds()
+
+    async def _run_daily(self, name: str, hour: int,
+                         job: Callable[[], Awaitable[object]]) -> None:
+        while True:
+            await asyncio.sleep(self._seconds_until(hour))
+            key = f"jobs:{name}:{datetime.utcnow().date().isoformat()}"
+            try:
+                if not await self.redis_client.set(key, 1, nx=True,
+                                                   ex=86400 * 2):
+                    continue
+                logger.info(f"Running scheduled job {name}")
+                await job()
+            except Exception as e:
+                logger.error(f"Scheduled job {name} failed: {e}")
+
+    def daily(self, name: str, hour: int,
+              job: Callable[[], Awaitable[object]]) -> None:
+        self._tasks.append(
+            asyncio.create_task(self._run_daily(name, hour, job)))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+
+scheduler = DailyScheduler()
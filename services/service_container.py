@@ -5,16 +5,45 @@ from contextlib import asynccontextmanager
 from services.user_service import UserService
 from services.test_management_service import TestManagementService
 from services.ai_service import AiService
-from db.database import get_async_session
+from services.report_service import ReportService
+from repositories.broadcast_repository import BroadcastRepository
+from repositories.dictionary_repository import DictionaryRepository
+from repositories.rollup_repository import RollupRepository
+from repositories.user_stats_repository import UserStatsRepository
+from db.database import get_async_session, get_read_session
 
 class ServiceContainer:
-    """Контейнер для всех сервисов"""
+    """Контейнер для всех сервисов.
+
+    Сервисы и репозитории создаются лениво и работают в одной сессии,
+    поэтому все, что они делают за апдейт, попадает в одну транзакцию.
+    Тяжелые чтения для админки идут через read - контейнер поверх
+    читающей сессии (реплика или primary в режиме только чтения).
+    """
     
     def __init__(self, session: AsyncSession):
         self.session = session
+        self._read = None
         self._user_service = None
         self._test_service = None
         self._ai_service = None
+        self._user_stats = None
+        self._rollups = None
+        self._dictionaries = None
+        self._reports = None
+        self._broadcasts = None
+
+    @property
+    def read(self) -> 'ServiceContainer':
+        if self._read is None:
+            self._read = ServiceContainer(get_read_session())
+        return self._read
+
+    async def close(self) -> None:
+        """Закрыть читающую сессию, если она открывалась"""
+        if self._read is not None:
+            await self._read.session.close()
+            self._read = None
 
     @property
     def user_service(self) -> UserService:
@@ -34,8 +63,42 @@ class ServiceContainer:
             self._ai_service = AiService(self.session)
         return self._ai_service
 
+    @property
+    def user_stats(self) -> UserStatsRepository:
+        if self._user_stats is None:
+            self._user_stats = UserStatsRepository(self.session)
+        return self._user_stats
+
+    @property
+    def rollups(self) -> RollupRepository:
+        if self._rollups is None:
+            self._rollups = RollupRepository(self.session)
+        return self._rollups
+
+    @property
+    def dictionaries(self) -> DictionaryRepository:
+        if self._dictionaries is None:
+            self._dictionaries = DictionaryRepository(self.session)
+        return self._dictionaries
+
+    @property
+    def reports(self) -> ReportService:
+        if self._reports is None:
+            self._reports = ReportService(self.session)
+        return self._reports
+
+    @property
+    def broadcasts(self) -> BroadcastRepository:
+        if self._broadcasts is None:
+            self._broadcasts = BroadcastRepository(self.session)
+        return self._broadcasts
+
 @asynccontextmanager
 async def get_service_container():
     """Контекстный менеджер для получения контейнера сервисов"""
     async with get_async_session() as session:
-        yield ServiceContainer(session)
+        services = ServiceContainer(session)
+        try:
+            yield services
+        finally:
+            await services.close()
@@ -1,30 +1,38 @@
 
 from typing import Optional, List, Dict, Any
+from sqlalchemy import Row
 from sqlalchemy.ext.asyncio import AsyncSession
 import random
 
 from repositories.question_repository import QuestionRepository, CaseRepository
-from db.models import DAMAQuestion, DAMACase
 from services.logger import logger
+from services.question_catalog import question_catalog, CatalogQuestion, CatalogCase, THEORY, PRACTICE
+from services.question_selector import QuestionSelector
 
 class TestManagementService:
     def __init__(self, session: AsyncSession):
         self.question_repo = QuestionRepository(session)
         self.case_repo = CaseRepository(session)
 
-    async def get_random_question(self, role: str, competence: str) -> Optional[DAMAQuestion]:
+    def get_random_question(self, role: str, competence: str) -> Optional[CatalogQuestion]:
         """Получить случайный вопрос для роли и компетенции"""
-        return await self.question_repo.get_random_question(role, competence)
+        catalog = question_catalog.get()
+        ids = [
+            question_id for question_type in (THEORY, PRACTICE)
+            for question_id in catalog.get_question_ids(role, competence, question_type)
+        ]
+        return catalog.questions_by_id[random.choice(ids)] if ids else None
 
-    async def get_random_case(self, role: str, competence: str) -> Optional[DAMACase]:
+    def get_random_case(self, role: str, competence: str) -> Optional[CatalogCase]:
         """Получить случайный кейс для роли и компетенции"""
-        return await self.case_repo.get_random_case(role, competence)
+        return QuestionSelector(question_catalog.get()).select_case(
+            role, competence, seed=random.getrandbits(64))
 
-    async def get_questions_for_role_competence(self, role: str, competence: str) -> List[DAMAQuestion]:
+    async def get_questions_for_role_competence(self, role: str, competence: str) -> List[Row]:
         """Получить все вопросы для роли и компетенции"""
         return await self.question_repo.get_by_role_and_competence(role, competence)
 
-    async def get_cases_for_role_competence(self, role: str, competence: str) -> List[DAMACase]:
+    async def get_cases_for_role_competence(self, role: str, competence: str) -> List[Row]:
         """Получить все кейсы для роли и компетенции"""
         return await self.case_repo.get_by_role_and_competence(role, competence)
 
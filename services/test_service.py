@@ -1,80 +1,131 @@
-import io
-import json
-
-from openpyxl.workbook import Workbook
-from sqlalchemy import insert
-
-from db.models import DAMAQuestion, DAMACase, TestResults, TestAnswer, Analytics
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-
+import random
+import secrets
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import TestResults, TestAnswer, Analytics
+from repositories.dictionary_repository import DictionaryRepository
+from repositories.rollup_repository import RollupRepository
+from repositories.user_stats_repository import UserStatsRepository
+
+from config import Config
+from services.adaptive_testing import AbilityEstimate, EXPERT_SCORE, estimate_ability, normalize_score, \
+    pick_next_question, should_stop
 from services.logger import logger
+from services.question_catalog import question_catalog
+from services.question_selector import QuestionSelector
 from services.redis_service import RedisService
 from datetime import datetime
-from sqlalchemy.future import select
-from db.database import get_async_session
-from db.models import DMARoles, DAMACompetency
+from db.database import session_scope
 
 
-async def prepare_test_data(selected_role: str, selected_comp: str):
-    async with get_async_session() as session:
-        try:
-            theory_query = select(DAMAQuestion).where(
-                DAMAQuestion.dama_role_name == selected_role,
-                DAMAQuestion.dama_competence_name == selected_comp,
-                DAMAQuestion.question_type == "Теория").distinct()
-            theory_result = await session.execute(theory_query)
-            theory_questions = theory_result.scalars().all()
-
-            practice_query = select(DAMAQuestion).where(
-                DAMAQuestion.dama_role_name == selected_role,
-                DAMAQuestion.dama_competence_name == selected_comp,
-                DAMAQuestion.question_type == "Практика").distinct()
-            practice_result = await session.execute(practice_query)
-            practice_questions = practice_result.scalars().all()
-
-            case_query = select(DAMACase).where(
-                DAMACase.dama_role_name == selected_role,
-                DAMACase.dama_competence_name == selected_comp)
-            case_result = await session.execute(case_query)
-            case = case_result.scalars().first()
-
-            selected_questions = balance_questions(theory_questions,
-                                                   practice_questions)
-
-            return {
-                'questions': selected_questions,
-                'case': case,
-                'total_questions': len(selected_questions),
-                'has_case': bool(case)
-            }
-        except Exception as e:
-            raise e
+def exam_seed(user_id: int, selected_role: str, selected_comp: str):
+    """Сид выборки: фиксированный при QUESTION_SELECTION_SEED, иначе случайный"""
+    if Config.QUESTION_SELECTION_SEED:
+        return f"{Config.QUESTION_SELECTION_SEED}:{user_id}:{selected_role}:{selected_comp}"
+    return secrets.randbits(64)
+
 
+async def prepare_test_data(selected_role: str,
+                            selected_comp: str,
+                            user_id: int,
+                            seed=None):
+    catalog = question_catalog.get()
+    redis_service = RedisService()
 
-def balance_questions(theory_questions, practice_questions):
-    if len(theory_questions) >= 5 and len(practice_questions) >= 5:
-        selected_questions = theory_questions[:5] + practice_questions[:5]
+    if seed is None:
+        seed = exam_seed(user_id, selected_role, selected_comp)
+
+    selector = QuestionSelector(catalog)
+    recent = await redis_service.load_recent_questions(user_id)
+    if Config.ADAPTIVE_TESTING:
+        first_question = pick_next_question(catalog,
+                                            selected_role,
+                                            selected_comp,
+                                            theta=0.0,
+                                            asked=[],
+                                            recent=recent,
+                                            rng=random.Random(f"{seed}:0"))
+        selected_questions = [first_question] if first_question else []
     else:
-        min_count = min(len(theory_questions), len(practice_questions))
-        selected_questions = theory_questions[:
-                                              min_count] + practice_questions[:
-                                                                              min_count]
-        remaining = 10 - len(selected_questions)
-        if remaining > 0:
-            if len(theory_questions) > min_count:
-                selected_questions += theory_questions[min_count:min_count +
-                                                       remaining]
-            else:
-                selected_questions += practice_questions[min_count:min_count +
-                                                         remaining]
-    return selected_questions
-
-
-async def generate_test_report(user_id: int):
+        selected_questions = selector.select(selected_role,
+                                             selected_comp,
+                                             seed=seed,
+                                             recent=recent)
+    case = selector.select_case(selected_role, selected_comp, seed=seed)
+
+    await redis_service.save_recent_questions(
+        user_id, [q.id for q in selected_questions])
+
+    return {
+        'questions': selected_questions,
+        'case': case,
+        'total_questions': len(selected_questions),
+        'has_case': bool(case),
+        'seed': seed,
+        'adaptive': Config.ADAPTIVE_TESTING
+    }
+
+
+async def next_adaptive_question(selected_role: str, selected_comp: str,
+                                 user_id: int, questions: List[Dict],
+                                 responses: List[Tuple[float, float]],
+                                 seed) -> Tuple[AbilityEstimate, Optional[Dict]]:
+    """Пересчитать способность и выбрать следующий вопрос или завершить"""
+    estimate = estimate_ability(responses)
+    if should_stop(estimate):
+        return estimate, None
+
+    redis_service = RedisService()
+    recent = await redis_service.load_recent_questions(user_id)
+    next_question = pick_next_question(
+        question_catalog.get(),
+        selected_role,
+        selected_comp,
+        theta=estimate.theta,
+        asked=questions,
+        recent=recent,
+        rng=random.Random(f"{seed}:{len(questions)}"))
+    if not next_question:
+        return estimate, None
+
+    await redis_service.save_recent_questions(user_id, [next_question.id])
+    return estimate, next_question.as_dict()
+
+
+async def collect_exam(user_id: int) -> Dict:
+    """Снимок завершенного теста из Redis: все, что нужно для сохранения
+    результатов, чтобы не зависеть от состояния пользователя в Redis"""
     redis_service = RedisService()
-    answers = await redis_service.get_user_answers(user_id)
     metadata = await redis_service.get_user_metadata(user_id)
-    analytics = await redis_service.load_analytics(user_id)
+    return {
+        'exam_id': metadata.get('exam_id') or uuid.uuid4().hex,
+        'user_id': user_id,
+        'metadata': metadata,
+        'answers': await redis_service.get_user_answers(user_id),
+        'analytics': await redis_service.load_analytics(user_id),
+        'model': await redis_service.load_selected_ai_model()
+    }
+
+
+async def save_test_results(exam: Dict,
+                            session: Optional[AsyncSession] = None):
+    """Сохранить результаты теста по снимку из collect_exam. Отчеты по
+    ним рендерятся по запросу, см. ReportService.
+
+    Повторный вызов с тем же exam_id не пишет результат второй раз, а
+    возвращает уже сохраненный. session - сессия апдейта, ее коммитит
+    владелец; без нее открывается и коммитится отдельная.
+    """
+    exam_id = exam['exam_id']
+    user_id = exam['user_id']
+    answers = exam['answers']
+    metadata = exam['metadata']
+    analytics = exam['analytics']
+    model = exam['model']
 
     total_score = 0.0
     valid_answers = 0
@@ -104,41 +155,93 @@ async def generate_test_report(user_id: int):
         total_completion_tokens += analytic.get('completion_tokens', 0)
 
     avg = round(total_score / valid_answers, 2) if valid_answers > 0 else 0.0
-    is_expert = avg >= 4.5
-    model = await redis_service.load_selected_ai_model()
-
-    async with get_async_session() as session:
+    is_expert = avg >= EXPERT_SCORE
+    if metadata.get('exam_mode') == 'adaptive' and filtered_answers:
+        # Вопросы подбирались под кандидата, поэтому средний балл смещен:
+        # решение принимаем по оценке способности с учетом трудности
+        is_expert = estimate_ability([
+            (float(answer.get('difficulty') or 0.0),
+             normalize_score(answer.get('score', 0)))
+            for answer in filtered_answers
+        ]).is_expert
+
+    async with session_scope(session) as session:
         try:
+            # Параллельные попытки одного теста ждут друг друга, а
+            # следующая видит уже сохраненный результат
+            await session.execute(
+                select(func.pg_advisory_xact_lock(func.hashtext(exam_id))))
+            saved = (await session.execute(
+                select(TestResults.id, TestResults.test_date,
+                       TestResults.total_score, TestResults.is_expert).where(
+                           TestResults.exam_id == exam_id))).first()
+            if saved:
+                logger.info(f"Test {exam_id} already saved as {saved.id}")
+                return {
+                    'test_result_id': saved.id,
+                    'test_date': saved.test_date,
+                    'avg_score': saved.total_score,
+                    'is_expert': saved.is_expert,
+                    'answers': answers
+                }
 
+            role_name = metadata.get('selected_role', '')
+            competence_name = metadata.get('selected_comp', '')
+            dictionaries = DictionaryRepository(session)
+            role_id, competence_id = await dictionaries.get_keys(
+                role_name, competence_name)
+            if competence_id is None:
+                # Банк вопросов обновили во время теста: результат не
+                # теряем, а заносим имена в справочники
+                logger.warning(f"Role '{role_name}' / competence "
+                               f"'{competence_name}' of test {exam_id} "
+                               "not in dictionaries, adding them")
+                role_id, competence_id = await dictionaries.add_keys(
+                    role_name, competence_name)
             test_result = {
                 'user_id': user_id,
-                'dama_role': metadata.get('selected_role', ''),
-                'dama_competence': metadata.get('selected_comp', ''),
+                'role_id': role_id,
+                'competence_id': competence_id,
                 'total_score': avg,
                 'is_expert': is_expert,
-                'test_date': datetime.utcnow()
+                'test_date': datetime.utcnow(),
+                'candidate_name': metadata.get('user_name') or None,
+                'exam_id': exam_id
             }
             result = await session.execute(
                 insert(TestResults).values(**test_result).returning(
                     TestResults.id))
             test_result_id = result.scalar_one()
+            await UserStatsRepository(session).record_result(
+                user_id, avg, is_expert, test_result['test_date'])
+            await RollupRepository(session).record_test(
+                test_result['test_date'],
+                role_name,
+                competence_name,
+                model,
+                avg,
+                is_expert,
+                total_prompt_tokens + total_completion_tokens if model else 0,
+                filtered_answers)
 
             for answer in filtered_answers:
                 logger.debug(f"Answer: {answer}")
 
                 answer_data = {
                     'test_result_id': test_result_id,
+                    'test_date': test_result['test_date'],
                     'question_id': answer.get('question_id'),
                     'case_id': answer.get('case_id'),
                     'answer_text': answer.get('user_answer', ''),
                     'score': answer.get('score', 0),
-                    'feedback': json.dumps(answer.get('feedback', {}))
+                    'feedback': answer.get('feedback', {})
                 }
                 await session.execute(insert(TestAnswer).values(**answer_data))
 
             if model:
                 analytics_data = {
                     'test_result_id': test_result_id,
+                    'test_date': test_result['test_date'],
                     'prompt_tokens': total_prompt_tokens,
                     'completion_tokens': total_completion_tokens,
                     'total_tokens':
@@ -147,155 +250,14 @@ async def generate_test_report(user_id: int):
                 }
                 await session.execute(
                     insert(Analytics).values(**analytics_data))
-
-            await session.commit()
         except Exception as e:
-            await session.rollback()
             logger.error(f"Error saving test results to DB: {e}")
             raise
 
-    wb = Workbook()
-    ws = wb.active
-
-    if ws is not None:
-        ws.title = "DAMA Assessment Report"
-    else:
-        ws = wb.create_sheet("DAMA Assessment Report")
-
-    header_font = Font(bold=True, name='Century Gothic', size=12)
-    body_font = Font(name='Century Gothic', size=11)
-    center_alignment = Alignment(horizontal='center',
-                                 vertical='center',
-                                 wrap_text=True)
-    header_fill = PatternFill(start_color='D5FD7B',
-                              end_color='D5FD7B',
-                              fill_type='solid')
-    thin_border = Border(left=Side(style='thin'),
-                         right=Side(style='thin'),
-                         top=Side(style='thin'),
-                         bottom=Side(style='thin'))
-
-    ws.merge_cells('A1:E1')
-    title_cell = ws['A1']
-    title_cell.value = "Результаты оценки уровня владения компетенциями по управлению данными в соответствии с фреймворком DAMА"
-    title_cell.font = header_font
-    title_cell.alignment = center_alignment
-    title_cell.fill = header_fill
-    title_cell.border = thin_border
-
-    ws.append([None])
-
-    meta_rows = [
-        ["Дата и время тестирования", "", "", "", ""],
-        ["ФИО тестируемого", "", "", "", ""], ["Роль", "", "", "", ""],
-        ["Компетенция", "", "", "",
-         ""], ["Средняя оценка по компетенции", "", "", "", ""],
-        [
-            "Экспертность в управлении данными DAMA (порог экспертности ≥ 4.5)",
-            "", "", "", ""
-        ], [None, None, None, None, None],
-        [
-            "Область знаний/Основные работы", "Вопрос",
-            "Пользовательский ответ", "Рекомендуемые материалы для изучения",
-            "Оценка (1-5)"
-        ]
-    ]
-
-    for row_idx, row in enumerate(meta_rows, start=3):
-        for col_idx, value in enumerate(row, start=1):
-            if value is not None:
-                cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                cell.font = body_font
-                cell.alignment = center_alignment
-                if row_idx == 10:
-                    cell.font = Font(bold=True, name='Century Gothic', size=11)
-                    cell.fill = header_fill
-                if value != "":
-                    cell.border = thin_border
-
-    ws['B3'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    ws['B4'] = metadata.get('user_name', '')
-    ws['B5'] = metadata.get('selected_role', '')
-    ws['B6'] = metadata.get('selected_comp', '')
-    ws['B7'] = avg
-    ws['B8'] = "Да" if is_expert else "Нет"
-
-    for row in range(3, 9):
-        for col in range(1, 6):
-            cell = ws.cell(row=row, column=col)
-            if cell.value:
-                cell.font = body_font
-                cell.alignment = center_alignment
-                cell.border = thin_border
-
-    for answer in filtered_answers:
-        feedback = answer.get('feedback', {})
-        recommendations = feedback.get('recommendations', '')
-        if isinstance(recommendations, list):
-            recommendations = " ".join(recommendations)
-
-        row = [
-            answer.get('knowledge_area', ''),
-            answer.get('question', ''),
-            answer.get('user_answer', ''), recommendations,
-            float(answer.get('score', 0))
-        ]
-        ws.append(row)
-
-        for col in range(1, 6):
-            cell = ws.cell(row=ws.max_row, column=col)
-            cell.font = body_font
-            cell.alignment = center_alignment
-            cell.border = thin_border
-
-    ws.column_dimensions['A'].width = 35
-    ws.column_dimensions['B'].width = 40
-    ws.column_dimensions['C'].width = 50
-    ws.column_dimensions['D'].width = 50
-    ws.column_dimensions['E'].width = 15
-
-    for row in ws.iter_rows():
-        for cell in row:
-            cell.alignment = Alignment(wrap_text=True,
-                                       horizontal='center',
-                                       vertical='center')
-
-    excel_buffer = io.BytesIO()
-    wb.save(excel_buffer)
-    excel_buffer.seek(0)
-
     return {
+        'test_result_id': test_result_id,
+        'test_date': test_result['test_date'],
         'avg_score': avg,
         'is_expert': is_expert,
-        'answers': answers,
-        'excel_file': excel_buffer
+        'answers': answers
     }
-
-
-async def get_available_roles():
-    """Получение списка доступных ролей DAMA из базы данных"""
-    try:
-        async with get_async_session() as session:
-            result = await session.execute(
-                select(DMARoles.dama_role_name).distinct())
-            roles = result.scalars().all()
-            return sorted(roles) if roles else []
-    except Exception as e:
-        logger.error(f"Error while getting roles: {e}")
-        return []
-
-
-async def get_competencies_for_role(role: str):
-    try:
-        if not role:
-            return []
-
-        async with get_async_session() as session:
-            result = await session.execute(
-                select(DAMACompetency.dama_competence_name).where(
-                    DAMACompetency.dama_role_name == role).distinct())
-            competencies = result.scalars().all()
-            return sorted(competencies) if competencies else []
-    except Exception as e:
-        logger.error(f"Error while getting competencies {role}: {e}")
-        return []
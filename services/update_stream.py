@@ -0,0 +1,252 @@
+"""Раздача апдейтов Telegram по процессам через Redis Streams.
+
+getUpdates может вызывать только один процесс, поэтому опрашивает
+Telegram лидер - владелец аренды updates:poller. Он раскладывает апдейты
+по потокам updates:<shard>, где shard = user_id % UPDATE_SHARDS: апдейты
+одного пользователя попадают в один поток и обрабатываются по порядку.
+Каждый поток в момент времени обрабатывает один процесс - владелец
+аренды шарда; процесс может владеть несколькими шардами. Упавшего лидера или владельца шарда через
+UPDATE_LEASE_TTL заменяет другой процесс.
+"""
+import asyncio
+import math
+from typing import Dict, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.types import Update
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+from config import Config
+from services.logger import logger
+from services.redis_lease import RedisLease
+
+POLLER_LEASE = "updates:poller"
+OFFSET_KEY = "updates:offset"
+SEEN_KEY = "updates:seen:{update_id}"
+# Telegram хранит недоставленные апдейты не дольше суток
+UPDATE_TTL = 86400
+GROUP = "update-workers"
+POLL_TIMEOUT = 30
+BATCH_SIZE = 100
+
+
+def shard_stream(shard: int) -> str:
+    return f"updates:{shard}"
+
+
+def update_user_id(update: Update) -> int:
+    """Пользователь апдейта, а если его нет - чат"""
+    event = update.event
+    user = getattr(event, 'from_user', None) or getattr(event, 'user', None)
+    if user:
+        return user.id
+    chat = getattr(event, 'chat', None)
+    return chat.id if chat else 0
+
+
+def _redis() -> Redis:
+    return Redis(host=Config.REDIS_HOST,
+                 port=Config.REDIS_PORT,
+                 db=0,
+                 password=Config.REDIS_USER_PASSWORD,
+                 username=Config.REDIS_USER,
+                 decode_responses=False)
+
+
+class UpdatePoller:
+    """Опрос Telegram лидером. Реплики без аренды ждут в резерве"""
+
+    def __init__(self, bot: Bot, dp: Dispatcher):
+        self.bot = bot
+        self.allowed_updates = dp.resolve_used_update_types()
+        self.redis_client = _redis()
+
+    async def _publish(self, update: Update) -> None:
+        # Апдейт, уже разложенный прошлым лидером, пропускаем. ID записи
+        # в потоке автоматический: update_id не монотонен, после недели
+        # простоя Telegram начинает счет заново
+        seen = SEEN_KEY.format(update_id=update.update_id)
+        if not await self.redis_client.set(seen, 1, nx=True, ex=UPDATE_TTL):
+            logger.info(f"Skipping duplicate update {update.update_id}")
+            return
+
+        user_id = update_user_id(update)
+        try:
+            await self.redis_client.xadd(
+                shard_stream(user_id % Config.UPDATE_SHARDS), {
+                    'user_id': user_id,
+                    'update': update.model_dump_json(exclude_unset=True)
+                })
+        except Exception:
+            await self.redis_client.delete(seen)
+            raise
+
+    async def _poll(self) -> None:
+        offset = await self.redis_client.get(OFFSET_KEY)
+        offset = int(offset) if offset else None
+        logger.info(f"Became update poller, offset {offset}")
+        while True:
+            try:
+                updates = await self.bot.get_updates(
+                    offset=offset,
+                    timeout=POLL_TIMEOUT,
+                    allowed_updates=self.allowed_updates)
+            except TelegramNetworkError as e:
+                logger.warning(f"Error polling updates: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                await self._publish(update)
+            if updates:
+                # Telegram считает апдейты доставленными со следующим
+                # getUpdates, а новый лидер продолжит с этого offset
+                offset = updates[-1].update_id + 1
+                # Старый offset после перезапуска счета update_id скрыл
+                # бы новые апдейты
+                await self.redis_client.set(OFFSET_KEY, offset, ex=UPDATE_TTL)
+
+    async def run(self) -> None:
+        # getUpdates не работает, пока у бота установлен webhook
+        await self.bot.delete_webhook()
+        lease = RedisLease(self.redis_client, POLLER_LEASE,
+                           Config.UPDATE_LEASE_TTL)
+        while True:
+            try:
+                if await lease.acquire():
+                    await lease.hold(self._poll)
+                    logger.warning("Lost update poller lease")
+            except Exception as e:
+                logger.error(f"Update poller error: {e}")
+            await asyncio.sleep(Config.UPDATE_LEASE_TTL / 3)
+
+
+class ShardWorker:
+    """Обработка шардов апдейтов в процессе.
+
+    Процесс берет свою долю шардов - UPDATE_SHARDS / UPDATE_WORKERS, а
+    шард, который два круга подряд никто не взял, забирает сверх доли:
+    при нехватке процессов ни один шард не остается без обработчика.
+    Апдейты одного пользователя идут строго по очереди, разных -
+    параллельно, не больше MAX_CONCURRENT_UPDATES в процессе. Апдейт
+    подтверждается после обработки; необработанные апдейты упавшего
+    владельца новый владелец шарда читает первыми.
+    """
+
+    def __init__(self, bot: Bot, dp: Dispatcher):
+        self.bot = bot
+        self.dp = dp
+        self.redis_client = _redis()
+        self._slots = asyncio.Semaphore(Config.MAX_CONCURRENT_UPDATES)
+        # Последняя задача пользователя по каждому потоку
+        self._chains: Dict[str, Dict[int, asyncio.Task]] = {}
+
+    async def _ensure_group(self, stream: str) -> None:
+        try:
+            await self.redis_client.xgroup_create(stream, GROUP, id='0',
+                                                  mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    async def _handle(self, stream: str, entry_id: bytes, fields: Dict,
+                      previous: Optional[asyncio.Task]) -> None:
+        try:
+            if previous:
+                await asyncio.gather(previous, return_exceptions=True)
+            update = Update.model_validate_json(fields[b'update'],
+                                                context={'bot': self.bot})
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                # Как и при polling, упавший хендлер апдейт не повторяет
+                logger.error(f"Error handling update {update.update_id}: {e}")
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.xack(stream, GROUP, entry_id)
+                pipe.xdel(stream, entry_id)
+                await pipe.execute()
+        finally:
+            self._slots.release()
+
+    async def _dispatch(self, stream: str, entry_id: bytes,
+                        fields: Dict) -> None:
+        await self._slots.acquire()
+        user_id = int(fields[b'user_id'])
+        chains = self._chains.setdefault(stream, {})
+        task = asyncio.create_task(
+            self._handle(stream, entry_id, fields, chains.get(user_id)))
+        chains[user_id] = task
+
+        def forget(done: asyncio.Task) -> None:
+            if chains.get(user_id) is done:
+                del chains[user_id]
+
+        task.add_done_callback(forget)
+
+    async def _consume(self, shard: int) -> None:
+        stream = shard_stream(shard)
+        await self._ensure_group(stream)
+        logger.info(f"Took update shard {shard}")
+        # Имя потребителя - имя шарда, поэтому сначала читаем то, что
+        # прошлый владелец прочитал, но не подтвердил
+        cursor = '0'
+        try:
+            while True:
+                response = await self.redis_client.xreadgroup(
+                    GROUP,
+                    f"shard-{shard}", {stream: cursor},
+                    count=BATCH_SIZE,
+                    block=5000)
+                entries = response[0][1] if response else []
+                for entry_id, fields in entries:
+                    await self._dispatch(stream, entry_id, fields)
+                if cursor != '>':
+                    cursor = entries[-1][0] if entries else '>'
+        finally:
+            # Начатые апдейты доводим до конца, не обрывая хендлеры
+            await asyncio.gather(*self._chains.pop(stream, {}).values(),
+                                 return_exceptions=True)
+
+    async def _own(self, shard: int, lease: RedisLease) -> None:
+        try:
+            await lease.hold(lambda: self._consume(shard))
+            logger.warning(f"Lost update shard {shard}")
+        except Exception as e:
+            logger.error(f"Update shard {shard} error: {e}")
+
+    async def run(self) -> None:
+        fair_share = math.ceil(Config.UPDATE_SHARDS / Config.UPDATE_WORKERS)
+        owned: Dict[int, asyncio.Task] = {}
+        free_before = set()
+        try:
+            while True:
+                owned = {
+                    shard: task
+                    for shard, task in owned.items() if not task.done()
+                }
+                free_now = set()
+                for shard in range(Config.UPDATE_SHARDS):
+                    if shard in owned:
+                        continue
+                    lease = RedisLease(self.redis_client,
+                                       f"{shard_stream(shard)}:owner",
+                                       Config.UPDATE_LEASE_TTL)
+                    try:
+                        if (len(owned) >= fair_share
+                                and shard not in free_before):
+                            # Сверх доли - только давно свободный шард
+                            if not await self.redis_client.exists(lease.key):
+                                free_now.add(shard)
+                            continue
+                        if await lease.acquire():
+                            owned[shard] = asyncio.create_task(
+                                self._own(shard, lease))
+                    except Exception as e:
+                        logger.error(f"Update shard {shard} error: {e}")
+                free_before = free_now
+                await asyncio.sleep(Config.UPDATE_LEASE_TTL / 3)
+        finally:
+            for task in owned.values():
+                task.cancel()
+            await asyncio.gather(*owned.values(), return_exceptions=True)
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Optional, Tuple
+
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import Config
+from db.database import session_scope
+from db.enums import UserRole
+from repositories.user_repository import UserRepository
+from services.logger import logger
+
+_MISSING = b"missing"
+INVALIDATION_CHANNEL = "user:profile:invalidated"
+
+
+@dataclass(frozen=True)
+class UserProfile:
+    """Данные пользователя, нужные почти каждому апдейту"""
+    id: int
+    first_name: str
+    last_name: str
+    username: str
+    role: str
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == UserRole.ADMIN
+
+    @property
+    def is_banned(self) -> bool:
+        return self.role == UserRole.BANNED
+
+    @property
+    def display_name(self) -> str:
+        return self.username or f"{self.first_name} {self.last_name}".strip()
+
+
+class UserProfileCache:
+    """LRU-кэш профилей в процессе с TTL поверх общего кэша в Redis.
+
+    Инвалидация рассылается через Redis pub/sub, и все процессы сразу
+    удаляют профиль из локального кэша. Короткий локальный TTL остается
+    страховкой на время разрыва подписки.
+    """
+
+    def __init__(self):
+        self.redis_client = Redis(host=Config.REDIS_HOST,
+                                  port=Config.REDIS_PORT,
+                                  db=0,
+                                  password=Config.REDIS_USER_PASSWORD,
+                                  username=Config.REDIS_USER,
+                                  decode_responses=False)
+        self._local: OrderedDict[int, Tuple[float, Optional[UserProfile]]] = OrderedDict()
+        self._listener: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"user:{user_id}:profile"
+
+    def _remember(self, user_id: int, profile: Optional[UserProfile]) -> None:
+        self._local[user_id] = (time.monotonic() + Config.USER_CACHE_LOCAL_TTL,
+                                profile)
+        self._local.move_to_end(user_id)
+        while len(self._local) > Config.USER_CACHE_SIZE:
+            self._local.popitem(last=False)
+
+    async def get(self,
+                  user_id: int,
+                  session: Optional[AsyncSession] = None) -> Optional[UserProfile]:
+        """Профиль пользователя или None, если он еще не зарегистрирован.
+
+        session - сессия текущего апдейта, чтобы промах кэша не брал
+        из пула еще одно соединение.
+        """
+        cached = self._local.get(user_id)
+        if cached and cached[0] > time.monotonic():
+            self._local.move_to_end(user_id)
+            return cached[1]
+
+        try:
+            raw = await self.redis_client.get(self._key(user_id))
+            if raw is not None:
+                profile = None if raw == _MISSING else UserProfile(
+                    **json.loads(raw))
+                self._remember(user_id, profile)
+                return profile
+        except Exception as e:
+            logger.error(f"Error reading user profile from redis: {e}")
+
+        profile = await self._load(user_id, session)
+        self._remember(user_id, profile)
+        try:
+            if profile:
+                await self.redis_client.set(self._key(user_id),
+                                            json.dumps(asdict(profile)),
+                                            ex=Config.USER_CACHE_TTL)
+            else:
+                await self.redis_client.set(self._key(user_id),
+                                            _MISSING,
+                                            ex=Config.USER_CACHE_MISSING_TTL)
+        except Exception as e:
+            logger.error(f"Error saving user profile to redis: {e}")
+        return profile
+
+    async def invalidate(self, user_id: int) -> None:
+        self._local.pop(user_id, None)
+        try:
+            await self.redis_client.delete(self._key(user_id))
+            await self.redis_client.publish(INVALIDATION_CHANNEL, user_id)
+        except Exception as e:
+            logger.error(f"Error invalidating user profile: {e}")
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self.redis_client.pubsub() as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    # Инвалидации, пришедшие до подписки, не узнать
+                    self._local.clear()
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self._local.pop(int(message['data']), None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"User profile invalidation listener error: {e}")
+                await asyncio.sleep(1)
+
+    def start(self) -> None:
+        """Подписаться на инвалидации других процессов"""
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    async def _load(self, user_id: int,
+                    session: Optional[AsyncSession]) -> Optional[UserProfile]:
+        async with session_scope(session) as session:
+            row = await UserRepository(session).get_profile(user_id)
+
+        if not row:
+            return None
+        role = row.role.value if isinstance(row.role, UserRole) else str(
+            row.role)
+        return UserProfile(id=row.id,
+                           first_name=row.first_name,
+                           last_name=row.last_name,
+                           username=row.username,
+                           role=role)
+
+
+user_profile_cache = UserProfileCache()
@@ -3,64 +3,94 @@ from typing import Optional, List, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from repositories.user_repository import UserRepository
+from db.database import after_commit
 from db.models import User
 from db.enums import UserRole
 from services.logger import logger
+from services.redis_service import RedisService
+from services.user_cache import user_profile_cache
 
 class UserService:
     def __init__(self, session: AsyncSession):
+        self.session = session
         self.user_repo = UserRepository(session)
+        self.redis_service = RedisService()
 
-    async def get_or_create_user(self, telegram_id: int, name: str, username: str = None) -> User:
+    async def get_or_create_user(self, telegram_id: int, first_name: str,
+                                 last_name: str = '',
+                                 username: str = '') -> User:
         """Получить пользователя или создать нового"""
         user = await self.user_repo.get_by_telegram_id(telegram_id)
         if not user:
             user = await self.user_repo.create(
-                telegram_id=telegram_id,
-                name=name,
+                id=telegram_id,
+                first_name=first_name,
+                last_name=last_name,
                 username=username,
                 role=UserRole.USER
             )
-            logger.info(f"Created new user: {name} (ID: {telegram_id})")
+            self._invalidate_profile(telegram_id)
+            logger.info(f"Created new user: {username} (ID: {telegram_id})")
         return user
 
+    def _invalidate_profile(self, telegram_id: int) -> None:
+        # Изменение видно другим процессам только после коммита апдейта
+        after_commit(self.session,
+                     lambda: user_profile_cache.invalidate(telegram_id))
+
     async def is_admin(self, telegram_id: int) -> bool:
         """Проверить, является ли пользователь администратором"""
-        user = await self.user_repo.get_by_telegram_id(telegram_id)
-        return user and user.role == UserRole.ADMIN
+        return await self.user_repo.get_role(telegram_id) == UserRole.ADMIN
 
     async def is_banned(self, telegram_id: int) -> bool:
         """Проверить, забанен ли пользователь"""
-        user = await self.user_repo.get_by_telegram_id(telegram_id)
-        return user and user.is_banned
+        return await self.user_repo.get_role(telegram_id) == UserRole.BANNED
 
     async def ban_user(self, telegram_id: int) -> bool:
         """Забанить пользователя"""
-        return await self.user_repo.ban_user(telegram_id)
+        success = await self.user_repo.ban_user(telegram_id)
+        self._invalidate_profile(telegram_id)
+        return success
 
     async def unban_user(self, telegram_id: int) -> bool:
         """Разбанить пользователя"""
-        return await self.user_repo.unban_user(telegram_id)
+        success = await self.user_repo.unban_user(telegram_id)
+        self._invalidate_profile(telegram_id)
+        return success
+
+    async def get_users_page(self,
+                             page_size: int = 10,
+                             after_id: Optional[int] = None,
+                             before_id: Optional[int] = None,
+                             role: Optional[str] = None) -> Dict[str, Any]:
+        """Страница пользователей по курсору id.
+
+        after_id - листаем вперед, before_id - назад. Общее число берется
+        из кэша в Redis и пересчитывается COUNT(*) раз в минуту.
+        """
+        users, has_more = await self.user_repo.get_page(page_size=page_size,
+                                                        after_id=after_id,
+                                                        before_id=before_id,
+                                                        role=role)
+        total_count = await self.redis_service.load_users_count(role)
+        if total_count is None:
+            total_count = await self.user_repo.count(role)
+            await self.redis_service.save_users_count(role, total_count)
+
+        if before_id is not None:
+            has_prev, has_next = has_more, True
+        else:
+            has_prev, has_next = after_id is not None, has_more
 
-    async def get_users_paginated(self, page: int, page_size: int = 10) -> Dict[str, Any]:
-        """Получить пользователей с пагинацией"""
-        users, total_count = await self.user_repo.get_paginated(page, page_size)
-        total_pages = (total_count + page_size - 1) // page_size
-        
         return {
             'users': users,
-            'current_page': page,
-            'total_pages': total_pages,
             'total_count': total_count,
-            'has_next': page < total_pages - 1,
-            'has_prev': page > 0
+            'has_next': has_next,
+            'has_prev': has_prev
         }
 
     async def promote_to_admin(self, telegram_id: int) -> bool:
         """Сделать пользователя администратором"""
-        user = await self.user_repo.get_by_telegram_id(telegram_id)
-        if user:
-            user.role = UserRole.ADMIN
-            await self.user_repo.session.commit()
-            return True
-        return False
+        success = await self.user_repo.set_role(telegram_id, UserRole.ADMIN)
+        self._invalidate_profile(telegram_id)
+        return success